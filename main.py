@@ -1,25 +1,41 @@
 from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.responses import PlainTextResponse
 import httpx
+import asyncio
 import logging
-import google.generativeai as genai
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request as GoogleRequest
+from googleapiclient.errors import HttpError
+import google_auth_httplib2
+import httplib2
+import bisect
+import calendar
+import contextlib
+import contextvars
+import copy
 import datetime
+import functools
+import hashlib
+import heapq
+import itertools
 import json
 import os
 import re
 import pickle
+import random
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import uuid
 import pytz
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
-
 # ---------------- CONFIG ----------------
 # Configure clean logging format
 import time
@@ -79,34 +95,32 @@ if not GEMINI_API_KEY:
     logger.error("❌ GEMINI_API_KEY not found in environment variables!")
     raise ValueError("GEMINI_API_KEY is required. Please check your .env file.")
 
-genai.configure(api_key=GEMINI_API_KEY)
-
 # Google Calendar
 calendar_service = None
+calendar_credentials = None
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+# Get OAuth credentials file and token pickle file from environment or use defaults
+GOOGLE_OAUTH_CREDENTIALS_FILE = os.getenv("GOOGLE_OAUTH_CREDENTIALS_FILE", 
+                                          'client_secret_428819923956-is6irhla4qp3phl2ij7ik2vv9cpecd4p.apps.googleusercontent.com.json')
+GOOGLE_TOKEN_PICKLE_FILE = os.getenv("GOOGLE_TOKEN_PICKLE_FILE", 'token.pickle')
+# Optional discovery document to build from; the client library's bundled copy is used otherwise
+CALENDAR_DISCOVERY_FILE = os.getenv("CALENDAR_DISCOVERY_FILE", "")
 
 
 # ---------------- GOOGLE CALENDAR SETUP ----------------
-def setup_google_calendar():
-    """Setup Google Calendar service with OAuth or Service Account"""
-    global calendar_service
+def load_calendar_credentials():
+    """Load OAuth or Service Account credentials, refreshing saved OAuth tokens if expired"""
+    from google.auth.transport.requests import Request as GoogleRequest
+    from google.oauth2 import service_account
+
     creds = None
 
-    logger.info("📅 Setting up Google Calendar integration...")
-    
-    # Get OAuth credentials file from environment or use default
-    oauth_file = os.getenv("GOOGLE_OAUTH_CREDENTIALS_FILE", 
-                          'client_secret_428819923956-is6irhla4qp3phl2ij7ik2vv9cpecd4p.apps.googleusercontent.com.json')
-    
-    # Get token pickle file from environment or use default
-    token_pickle_file = os.getenv("GOOGLE_TOKEN_PICKLE_FILE", 'token.pickle')
-    
-    if os.path.exists(oauth_file):
+    if os.path.exists(GOOGLE_OAUTH_CREDENTIALS_FILE):
         logger.info("📄 Found OAuth credentials file")
         
-        if os.path.exists(token_pickle_file):
+        if os.path.exists(GOOGLE_TOKEN_PICKLE_FILE):
             logger.info("🔑 Loading saved tokens...")
-            with open(token_pickle_file, 'rb') as token:
+            with open(GOOGLE_TOKEN_PICKLE_FILE, 'rb') as token:
                 creds = pickle.load(token)
 
         if creds and creds.expired and creds.refresh_token:
@@ -121,12 +135,11 @@ def setup_google_calendar():
         if not creds or not creds.valid:
             logger.warning("⚠️  OAuth credentials missing/invalid")
             logger.warning("💡 Run: python setup_calendar.py")
-            return False
+            return None
 
         # Save refreshed credentials
         try:
-            with open(token_pickle_file, 'wb') as token:
-                pickle.dump(creds, token)
+            save_calendar_credentials(creds)
         except Exception as e:
             logger.error(f"❌ Failed to save credentials: {e}")
 
@@ -139,59 +152,590 @@ def setup_google_calendar():
             logger.info("✅ Service Account loaded successfully")
         except Exception as e:
             logger.error(f"❌ Failed to load service account: {e}")
-            return False
+            return None
 
     if creds and creds.valid:
-        try:
-            calendar_service = build("calendar", "v3", credentials=creds)
-            logger.info("✅ Google Calendar service initialized successfully")
-            logger.info("📅 Calendar integration: READY")
-            return True
-        except Exception as e:
-            logger.error(f"❌ Failed to build calendar service: {e}")
-            return False
+        return creds
+
+    logger.warning("⚠️  No valid credentials found")
+    return None
+
+
+def write_file_atomically(path: str, data: bytes):
+    """Replace a file via a temp file and rename, so a crash mid-write never leaves it truncated"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def save_calendar_credentials(creds):
+    """Atomically replace the token pickle"""
+    global token_file_mtime
+
+    write_file_atomically(GOOGLE_TOKEN_PICKLE_FILE, pickle.dumps(creds))
+    # Our own write is not a rotation
+    token_file_mtime = get_token_file_mtime()
+
+
+def build_calendar_service(creds):
+    """Build the Calendar client from a local discovery document, without fetching it over the network"""
+    from googleapiclient.discovery import build, build_from_document
+
+    global calendar_service, calendar_credentials
+
+    try:
+        if CALENDAR_DISCOVERY_FILE:
+            with open(CALENDAR_DISCOVERY_FILE) as f:
+                calendar_service = build_from_document(f.read(), credentials=creds)
+        else:
+            calendar_service = build("calendar", "v3", credentials=creds, static_discovery=True, cache_discovery=False)
+        calendar_credentials = creds
+        logger.info("✅ Google Calendar service initialized successfully")
+        logger.info("📅 Calendar integration: READY")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Failed to build calendar service: {e}")
+        return False
+
+
+# ---------------- STARTUP ----------------
+# Nothing slow runs at import time: credentials, the Calendar client, the Gemini
+# SDK and the background workers are set up in the lifespan hook, and each
+# phase is timed so slow boots can be traced to a step.
+startup_phases = {}  # phase name -> seconds
+
+
+@contextlib.contextmanager
+def startup_phase(name: str):
+    started = time.time()
+    try:
+        yield
+    finally:
+        startup_phases[name] = round(time.time() - started, 3)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_phases["imports"] = round(time.time() - start_time, 3)
+    lifespan_started = time.time()
+
+    logger.info("📅 Setting up Google Calendar integration...")
+    with startup_phase("calendar_credentials"):
+        creds = await run_calendar_call(load_calendar_credentials)
+    with startup_phase("calendar_client"):
+        calendar_ready = creds is not None and await run_calendar_call(build_calendar_service, creds)
+    with startup_phase("gemini"):
+        setup_gemini()
+
+    # Incoming messages are drained before outbound delivery stops on shutdown,
+    # so their replies (and insert failure notices) still go out.
+    with startup_phase("durable_state"):
+        claim_web_process()
+        await asyncio.get_running_loop().run_in_executor(None, restore_durable_state)
+    with startup_phase("reminder_scheduler"):
+        await start_reminder_scheduler()
+    with startup_phase("reminder_dispatch"):
+        await start_reminder_dispatch()
+    with startup_phase("calendar_inserts"):
+        await start_calendar_inserts()
+    with startup_phase("webhook_workers"):
+        await start_webhook_workers()
+    with startup_phase("outbound_delivery"):
+        await start_outbound_delivery()
+    with startup_phase("calendar_channels"):
+        await start_calendar_channels()
+    with startup_phase("credential_refresh"):
+        start_credential_refresh()
+
+    if calendar_ready:
+        logger.info("🎉 WhatBot initialization complete - All systems ready!")
     else:
-        logger.warning("⚠️  No valid credentials found")
         logger.warning("📅 Google Calendar: DISABLED")
+        logger.warning("⚠️  WhatBot started with limited functionality (no calendar)")
+
+    startup_time = startup_phases["imports"] + time.time() - lifespan_started
+    logger.info(f"⚡ Startup completed in {startup_time:.2f} seconds")
+    for name, seconds in startup_phases.items():
+        logger.info(f"   ⏱️  {name}: {seconds:.3f}s")
+    logger.info("=" * 60)
+    logger.info("🤖 WHATBOT READY FOR MESSAGES")
+    logger.info("=" * 60)
+
+    yield
+
+    await stop_webhook_workers()
+    await stop_calendar_inserts()
+    await stop_reminder_scheduler()
+    await stop_reminder_dispatch()
+    await stop_outbound_delivery()
+    await stop_calendar_channels()
+    await stop_credential_refresh()
+    close_state_db()
+    release_web_process()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# ---------------- CALENDAR ACCESS ----------------
+# The Calendar client is synchronous, so every call runs on a bounded thread
+# pool instead of the event loop. httplib2 transports are not thread-safe: the
+# shared service object only builds requests, and each worker thread executes
+# them over its own authorized transport.
+CALENDAR_MAX_WORKERS = max(1, int(os.getenv("CALENDAR_MAX_WORKERS", "8")))
+CALENDAR_TIMEOUT = float(os.getenv("CALENDAR_TIMEOUT", "30"))
+
+calendar_executor = ThreadPoolExecutor(max_workers=CALENDAR_MAX_WORKERS, thread_name_prefix="calendar")
+calendar_thread_local = threading.local()
+# Bumped whenever the credentials are swapped, so threads rebuild their transport
+calendar_generation = 0
+
+
+def get_calendar_http():
+    """Authorized httplib2 transport owned by the current thread"""
+    http = getattr(calendar_thread_local, "http", None)
+    if http is None or calendar_thread_local.generation != calendar_generation:
+        http = google_auth_httplib2.AuthorizedHttp(
+            calendar_credentials,
+            http=httplib2.Http(timeout=CALENDAR_TIMEOUT)
+        )
+        calendar_thread_local.http = http
+        calendar_thread_local.generation = calendar_generation
+    return http
+
+
+def execute_calendar_request(request):
+    """Execute a Calendar API request on this thread's transport, within the rate limiter's budget"""
+    for attempt in range(CALENDAR_RATE_LIMIT_RETRIES + 1):
+        calendar_rate_limiter.acquire(user=calendar_call_user.get(), priority=calendar_call_priority.get())
+        try:
+            result = request.execute(http=get_calendar_http())
+        except HttpError as e:
+            if not is_rate_limit_error(e):
+                raise
+            calendar_rate_limiter.on_rate_limited(e.resp.get("retry-after"), attempt)
+            if attempt == CALENDAR_RATE_LIMIT_RETRIES:
+                raise
+            logger.warning(f"⚠️  Calendar rate limit hit, retrying (attempt {attempt + 1})")
+            continue
+        calendar_rate_limiter.on_success()
+        return result
+
+
+async def run_calendar_call(func, *args, **kwargs):
+    """Run a blocking calendar helper on the calendar thread pool.
+    The caller's context (user, priority) goes with it."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        calendar_executor,
+        functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+# ---------------- CALENDAR RATE LIMITER ----------------
+# Every Calendar request (single or batched) draws from one adaptive token
+# bucket shared by all users, plus a smaller bucket per user. The shared rate
+# follows AIMD: it grows by CALENDAR_RATE_INCREASE per successful request up to
+# CALENDAR_MAX_QPS and halves on each rate-limit response. Bulk work (delete-all,
+# background inserts and syncs) waits while interactive requests are queued.
+CALENDAR_MAX_QPS = float(os.getenv("CALENDAR_MAX_QPS", "10"))
+CALENDAR_MIN_QPS = float(os.getenv("CALENDAR_MIN_QPS", "0.5"))
+CALENDAR_BURST = max(1, int(os.getenv("CALENDAR_BURST", "20")))
+CALENDAR_USER_QPS = float(os.getenv("CALENDAR_USER_QPS", "2"))
+CALENDAR_USER_BURST = max(1, int(os.getenv("CALENDAR_USER_BURST", "10")))
+CALENDAR_RATE_INCREASE = float(os.getenv("CALENDAR_RATE_INCREASE", "0.1"))
+CALENDAR_RATE_LIMIT_RETRIES = int(os.getenv("CALENDAR_RATE_LIMIT_RETRIES", "3"))
+CALENDAR_RATE_LIMIT_BACKOFF = float(os.getenv("CALENDAR_RATE_LIMIT_BACKOFF", "1"))  # min pause after a rate-limit error
+CALENDAR_RATE_LIMIT_BACKOFF_MAX = float(os.getenv("CALENDAR_RATE_LIMIT_BACKOFF_MAX", "32"))
+
+CALENDAR_PRIORITY_INTERACTIVE = 0
+CALENDAR_PRIORITY_BULK = 1
+
+# Who a calendar call is for and how urgent it is; carried into the calendar threads by run_calendar_call
+calendar_call_user = contextvars.ContextVar("calendar_call_user", default=None)
+calendar_call_priority = contextvars.ContextVar("calendar_call_priority", default=CALENDAR_PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def calendar_priority(priority: int):
+    """Run the calendar calls made inside the block at the given priority"""
+    token = calendar_call_priority.set(priority)
+    try:
+        yield
+    finally:
+        calendar_call_priority.reset(token)
+
+
+def is_rate_limit_error(error):
+    status = get_http_error_status(error)
+    return status == 429 or (status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS))
+
+
+class CalendarRateLimiter:
+    """Thread-safe AIMD token bucket with per-user budgets and two priorities"""
+
+    def __init__(self):
+        self.rate = CALENDAR_MAX_QPS
+        self.tokens = float(CALENDAR_BURST)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.user_buckets = {}  # user -> [tokens, updated_at]
+        self.interactive_waiting = 0
+        self.condition = threading.Condition()
+        self.stats = {"acquired": 0, "waits": 0, "wait_seconds": 0.0, "rate_limited": 0}
+
+    def _refill(self, now: float):
+        self.tokens = min(CALENDAR_BURST, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _user_bucket(self, user: str, now: float):
+        bucket = self.user_buckets.get(user)
+        if bucket is None:
+            if len(self.user_buckets) >= 10000:
+                # Drop idle users; their buckets would be full again anyway
+                self.user_buckets = {
+                    u: b for u, b in self.user_buckets.items()
+                    if b[0] + (now - b[1]) * CALENDAR_USER_QPS < CALENDAR_USER_BURST
+                }
+            bucket = self.user_buckets[user] = [float(CALENDAR_USER_BURST), now]
+        bucket[0] = min(CALENDAR_USER_BURST, bucket[0] + (now - bucket[1]) * CALENDAR_USER_QPS)
+        bucket[1] = now
+        return bucket
+
+    def acquire(self, cost: int = 1, user: str = None, priority: int = CALENDAR_PRIORITY_INTERACTIVE,
+                user_cost: int = None):
+        """Block until cost requests fit in the shared budget and user_cost (default cost) in the user's.
+        A cost above the burst size is allowed once the bucket is full, leaving it in debt."""
+        user_cost = cost if user_cost is None else user_cost
+        started = time.monotonic()
+        interactive = priority == CALENDAR_PRIORITY_INTERACTIVE
+        counted = False  # whether this call is in interactive_waiting
+        with self.condition:
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    user_wait = 0.0
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif not interactive and self.interactive_waiting:
+                        wait = 0.05
+                    else:
+                        wait = max(0.0, (min(cost, CALENDAR_BURST) - self.tokens) / self.rate)
+                        bucket = self._user_bucket(user, now) if user else None
+                        if bucket:
+                            user_wait = (min(user_cost, CALENDAR_USER_BURST) - bucket[0]) / CALENDAR_USER_QPS
+                        if max(wait, user_wait) <= 0:
+                            self.tokens -= cost
+                            if bucket:
+                                bucket[0] -= user_cost
+                            break
+                    # Bulk callers only yield to interactive ones held up by the shared budget,
+                    # not to one waiting out its own per-user bucket
+                    shared = wait > 0 and wait >= user_wait
+                    if interactive and shared != counted:
+                        self.interactive_waiting += 1 if shared else -1
+                        counted = shared
+                        if not shared:
+                            self.condition.notify_all()
+                    self.condition.wait(max(wait, user_wait))
+            finally:
+                if counted:
+                    self.interactive_waiting -= 1
+                if interactive:
+                    self.condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.stats["acquired"] += cost
+            if waited > 0.001:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += waited
+
+    def on_success(self, count: int = 1):
+        with self.condition:
+            self.rate = min(CALENDAR_MAX_QPS, self.rate + CALENDAR_RATE_INCREASE * count)
+
+    def on_rate_limited(self, retry_after=None, attempt: int = 0):
+        with self.condition:
+            self.stats["rate_limited"] += 1
+            now = time.monotonic()
+            # One burst of rejections is one congestion signal
+            if now - self.last_decrease > 1.0:
+                self.rate = max(CALENDAR_MIN_QPS, self.rate / 2)
+                self.last_decrease = now
+            try:
+                pause = float(retry_after) if retry_after else 0.0
+            except ValueError:
+                pause = 0.0
+            # Without Retry-After still back off, and drop banked tokens so the retry
+            # doesn't go straight back out
+            backoff = min(CALENDAR_RATE_LIMIT_BACKOFF_MAX, CALENDAR_RATE_LIMIT_BACKOFF * (2 ** attempt))
+            pause = max(pause, random.uniform(backoff / 2, backoff))
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, now + pause)
+            logger.warning(f"⚠️  Calendar rate limited, slowing to {self.rate:.1f} req/s")
+
+    def metrics(self):
+        with self.condition:
+            return {
+                "rate_per_second": round(self.rate, 2),
+                "max_rate_per_second": CALENDAR_MAX_QPS,
+                "tokens": round(self.tokens, 1),
+                "interactive_waiting": self.interactive_waiting,
+                "tracked_users": len(self.user_buckets),
+                **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()}
+            }
+
+
+calendar_rate_limiter = CalendarRateLimiter()
+
+
+# ---------------- CALENDAR CREDENTIAL REFRESH ----------------
+# Access tokens are refreshed in the background ahead of expiry (on a copy of
+# the credentials, which is then swapped in), so no user request ever waits on a
+# token refresh. OAuth tokens are persisted atomically. A replaced token file,
+# e.g. after re-running setup_calendar.py, is picked up without a restart, which
+# is also how the bot recovers after a refresh token is revoked.
+CALENDAR_TOKEN_REFRESH_MARGIN = float(os.getenv("CALENDAR_TOKEN_REFRESH_MARGIN", "600"))
+CALENDAR_CREDENTIAL_CHECK_INTERVAL = float(os.getenv("CALENDAR_CREDENTIAL_CHECK_INTERVAL", "60"))
+
+token_file_mtime = None
+credential_refresh_task = None
+calendar_credential_stats = {"refreshes": 0, "refresh_failures": 0, "reloads": 0, "last_error": None}
+
+
+def get_token_file_mtime():
+    try:
+        return os.path.getmtime(GOOGLE_TOKEN_PICKLE_FILE)
+    except OSError:
+        return None
+
+
+def swap_calendar_credentials(creds):
+    """Rebuild the Calendar client around new credentials; threads pick up fresh transports"""
+    global calendar_generation
+
+    if not build_calendar_service(creds):
         return False
+    calendar_generation += 1
+    return True
+
+
+def refresh_calendar_credentials():
+    """Reload a replaced token file, or refresh the access token if it expires soon"""
+    global calendar_service, token_file_mtime
+
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request as GoogleRequest
+
+    mtime = get_token_file_mtime()
+    if mtime is not None and mtime != token_file_mtime:
+        token_file_mtime = mtime
+        creds = load_calendar_credentials()
+        if creds is not None and swap_calendar_credentials(creds):
+            calendar_credential_stats["reloads"] += 1
+            logger.info("🔑 Calendar credentials reloaded from token file")
+        return
+
+    creds = calendar_credentials
+    if creds is None or calendar_service is None:
+        return
+    if creds.token and creds.expiry and (creds.expiry - datetime.datetime.utcnow()).total_seconds() > CALENDAR_TOKEN_REFRESH_MARGIN:
+        return
+
+    refreshed = copy.copy(creds)
+    try:
+        refreshed.refresh(GoogleRequest())
+    except RefreshError as e:
+        # Revoked or expired refresh token: retrying will not help, so disable
+        # the calendar until a new token file shows up
+        calendar_credential_stats["refresh_failures"] += 1
+        calendar_credential_stats["last_error"] = str(e)
+        calendar_service = None
+        logger.error(f"❌ Calendar credentials can no longer be refreshed: {e}")
+        logger.warning("💡 Run: python setup_calendar.py")
+        return
+    except Exception as e:
+        calendar_credential_stats["refresh_failures"] += 1
+        calendar_credential_stats["last_error"] = str(e)
+        logger.warning(f"⚠️  Calendar token refresh failed, will retry: {e}")
+        return
+
+    if getattr(refreshed, "refresh_token", None):
+        try:
+            save_calendar_credentials(refreshed)
+        except Exception as e:
+            logger.error(f"❌ Failed to save credentials: {e}")
+    if swap_calendar_credentials(refreshed):
+        calendar_credential_stats["refreshes"] += 1
+        logger.info(f"🔄 Calendar token refreshed, valid until {refreshed.expiry} UTC")
+
+
+async def credential_refresh_loop():
+    while True:
+        try:
+            await run_calendar_call(refresh_calendar_credentials)
+        except Exception as e:
+            logger.error(f"❌ Calendar credential check failed: {str(e)}")
+        await asyncio.sleep(CALENDAR_CREDENTIAL_CHECK_INTERVAL)
+
+
+def get_calendar_credential_metrics():
+    expiry = getattr(calendar_credentials, "expiry", None)
+    return {
+        "available": calendar_service is not None,
+        "generation": calendar_generation,
+        "expires_in_seconds": round((expiry - datetime.datetime.utcnow()).total_seconds()) if expiry else None,
+        **calendar_credential_stats
+    }
+
+
+def start_credential_refresh():
+    """Start the background refresh task"""
+    global credential_refresh_task
 
+    credential_refresh_task = asyncio.create_task(credential_refresh_loop())
 
-# Initialize calendar service
-calendar_setup_result = setup_google_calendar()
-if calendar_setup_result:
-    logger.info("🎉 WhatBot initialization complete - All systems ready!")
-else:
-    logger.warning("⚠️  WhatBot started with limited functionality (no calendar)")
 
-startup_time = time.time() - start_time
-logger.info(f"⚡ Startup completed in {startup_time:.2f} seconds")
-logger.info("=" * 60)
-logger.info("🤖 WHATBOT READY FOR MESSAGES")
-logger.info("=" * 60)
+async def stop_credential_refresh():
+    global credential_refresh_task
+
+    if credential_refresh_task is not None:
+        credential_refresh_task.cancel()
+        await asyncio.gather(credential_refresh_task, return_exceptions=True)
+        credential_refresh_task = None
 
 
 # ---------------- WHATSAPP SENDER ----------------
+# One long-lived client for all Graph API calls so replies reuse warm
+# TCP/TLS connections instead of handshaking on every message.
+WHATSAPP_HTTP2 = os.getenv("WHATSAPP_HTTP2", "false").lower() in ("1", "true", "yes")
+WHATSAPP_MAX_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_CONNECTIONS", "20"))
+WHATSAPP_MAX_KEEPALIVE = int(os.getenv("WHATSAPP_MAX_KEEPALIVE", "10"))
+WHATSAPP_KEEPALIVE_EXPIRY = float(os.getenv("WHATSAPP_KEEPALIVE_EXPIRY", "60"))
+WHATSAPP_TIMEOUT = float(os.getenv("WHATSAPP_TIMEOUT", "10"))
+WHATSAPP_CONNECT_TIMEOUT = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT", "5"))
+
+if WHATSAPP_HTTP2:
+    try:
+        import h2  # noqa: F401  (optional, installed with httpx[http2])
+    except ImportError:
+        logger.warning("⚠️  WHATSAPP_HTTP2 enabled but 'h2' is not installed, using HTTP/1.1")
+        WHATSAPP_HTTP2 = False
+
+whatsapp_client = None
+whatsapp_client_stats = {"requests": 0, "new_connections": 0}
+
+
+async def trace_whatsapp_connection(event_name: str, info: dict):
+    """httpcore trace hook: count requests that had to open a new connection"""
+    if event_name == "connection.connect_tcp.complete":
+        whatsapp_client_stats["new_connections"] += 1
+
+
+def create_whatsapp_client():
+    """Build the shared Graph API client with keep-alive pooling"""
+    return httpx.AsyncClient(
+        http2=WHATSAPP_HTTP2,
+        headers={
+            "Authorization": f"Bearer {ACCESS_TOKEN}",
+            "Content-Type": "application/json"
+        },
+        limits=httpx.Limits(
+            max_connections=WHATSAPP_MAX_CONNECTIONS,
+            max_keepalive_connections=WHATSAPP_MAX_KEEPALIVE,
+            keepalive_expiry=WHATSAPP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(WHATSAPP_TIMEOUT, connect=WHATSAPP_CONNECT_TIMEOUT)
+    )
+
+
+async def open_whatsapp_client():
+    """Create the shared WhatsApp client"""
+    global whatsapp_client
+    whatsapp_client = create_whatsapp_client()
+    logger.info(f"📱 WhatsApp client ready (pool={WHATSAPP_MAX_CONNECTIONS}, http2={WHATSAPP_HTTP2})")
+
+
+async def close_whatsapp_client():
+    """Close pooled connections on shutdown"""
+    global whatsapp_client
+    if whatsapp_client:
+        await whatsapp_client.aclose()
+        whatsapp_client = None
+
+
+def get_whatsapp_client_metrics():
+    """Connection reuse for the shared WhatsApp client"""
+    requests_sent = whatsapp_client_stats["requests"]
+    new_connections = whatsapp_client_stats["new_connections"]
+    reused = max(requests_sent - new_connections, 0)
+    return {
+        "requests": requests_sent,
+        "new_connections": new_connections,
+        "reused_connections": reused,
+        "reuse_rate": round(reused / requests_sent, 3) if requests_sent else 0.0,
+        "http2": WHATSAPP_HTTP2,
+        "max_connections": WHATSAPP_MAX_CONNECTIONS,
+        "max_keepalive_connections": WHATSAPP_MAX_KEEPALIVE
+    }
+
+
 @app.post("/send-text/")
 async def send_text_api(to: str, message: str):
     """Send WhatsApp message manually (for testing)"""
-    result = await send_text(to, message)
-    return result
+    result = await deliver_whatsapp_message(build_text_payload(to, message))
+    return result or {"status": "failed", "detail": "Message moved to dead-letter list"}
 
 
-async def send_text(to: str, message: str):
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
+def build_text_payload(to: str, message: str):
+    return {
         "messaging_product": "whatsapp",
         "to": to,
         "type": "text",
         "text": {"body": message}
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(WHATSAPP_URL, headers=headers, json=payload)
-    return response.json()
+
+
+async def send_text(to: str, message: str, wait: bool = False):
+    """Queue a text message for delivery; handlers don't wait for the Graph API.
+    With wait=True, returns the API response once the message is actually sent."""
+    payload = build_text_payload(to, message)
+    if outbound_queue is None:
+        # Outside the app lifecycle (e.g. scripts) deliver inline
+        return await deliver_whatsapp_message(payload) or {"status": "failed", "detail": "Message moved to dead-letter list"}
+
+    done = asyncio.get_running_loop().create_future() if wait else None
+    if not enqueue_outbound_message(payload, done):
+        return {"status": "failed", "detail": "Outbound queue full"}
+    if done is None:
+        return {"status": "queued"}
+    return await done or {"status": "failed", "detail": "Message moved to dead-letter list"}
+
+
+async def post_whatsapp_message(payload: dict):
+    """Single Graph API call, returns the raw httpx response"""
+    if whatsapp_client is None:
+        async with create_whatsapp_client() as client:
+            return await client.post(WHATSAPP_URL, json=payload)
+
+    response = await whatsapp_client.post(
+        WHATSAPP_URL,
+        json=payload,
+        extensions={"trace": trace_whatsapp_connection}
+    )
+    whatsapp_client_stats["requests"] += 1
+    return response
 
 
 # ---------------- WEBHOOK VERIFY ----------------
@@ -213,6 +757,8 @@ async def receive_webhook(request: Request):
     try:
         data = await request.json()
         logger.debug(f"📨 Raw webhook data: {data}")
+        incoming = []  # (message, contacts) for every new message in the request
+        pending = []
 
         if "entry" in data:
             for entry in data["entry"]:
@@ -224,10 +770,11 @@ async def receive_webhook(request: Request):
                         if "messages" in message_data:
                             logger.info("💬 Processing incoming message(s)")
                             for message in message_data["messages"]:
-                                await process_incoming_message(
-                                    message,
-                                    message_data.get("contacts", [])
-                                )
+                                # WhatsApp redelivers on slow responses; retries cost nothing
+                                if is_duplicate_message(message.get("id")):
+                                    logger.info(f"♻️  Skipping duplicate delivery of message {message.get('id')}")
+                                    continue
+                                incoming.append((message, message_data.get("contacts", [])))
                         
                         # Handle status updates (read receipts, delivered, etc.)
                         elif "statuses" in message_data:
@@ -237,1081 +784,3319 @@ async def receive_webhook(request: Request):
                         else:
                             logger.debug("📭 Received webhook data with no messages or statuses")
 
+        # All or nothing: a 503 after part of the batch was queued would make
+        # WhatsApp redeliver, and us process, that part twice
+        if len(incoming) > get_webhook_capacity():
+            for message, _ in incoming:
+                forget_message_id(message.get("id"))
+            webhook_queue_stats["rejected"] += len(incoming)
+            logger.warning(f"⚠️  Webhook queue full, rejecting a batch of {len(incoming)} message(s)")
+            raise HTTPException(status_code=503, detail="Webhook queue full")
+
+        for message, contacts in incoming:
+            # Async mode acknowledges right away; inline mode waits below
+            future = None if WEBHOOK_ASYNC_MODE else asyncio.get_running_loop().create_future()
+            enqueue_webhook_message(message, contacts, future)
+            if future is not None:
+                pending.append(future)
+
+        # Inline mode: different users in the batch run concurrently, each user in order
+        if pending:
+            await asyncio.gather(*pending)
+
         return {"status": "success"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing webhook: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-# ---------------- PROCESS MESSAGE ----------------
-# Store user conversations for clarification flow
-user_conversations = {}
-user_management_state = {}  # Store user state for reminder management
+# ---------------- WEBHOOK WORK QUEUE ----------------
+# Every incoming message goes through a FIFO queue drained by a pool of asyncio
+# workers. Work is sharded by phone number: a user's messages run strictly in
+# order (so the clarification/management state machines never interleave), while
+# different users run concurrently, up to WEBHOOK_WORKER_COUNT at a time.
+# When WEBHOOK_ASYNC_MODE is on, /webhook/ returns 200 as soon as messages are
+# enqueued; otherwise it waits for them to finish.
+WEBHOOK_ASYNC_MODE = os.getenv("WEBHOOK_ASYNC_MODE", "true").lower() in ("1", "true", "yes")
+WEBHOOK_WORKER_COUNT = max(1, int(os.getenv("WEBHOOK_WORKER_COUNT", "4")))
+WEBHOOK_QUEUE_MAXSIZE = int(os.getenv("WEBHOOK_QUEUE_MAXSIZE", "1000"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
 
-async def process_incoming_message(message: dict, contacts: list):
-    from_number = message.get("from")
-    message_type = message.get("type")
+webhook_queue = None
+webhook_enqueue_times = deque()  # Enqueue timestamps, oldest first (mirrors queue order)
+webhook_worker_tasks = []
+active_user_backlogs = {}  # from_number -> messages parked behind the worker that owns this user
+webhook_outstanding = 0  # queued + parked + running messages, capped by WEBHOOK_QUEUE_MAXSIZE
+webhook_queue_stats = {
+    "enqueued": 0,
+    "processed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "total_wait_seconds": 0.0,
+    "max_wait_seconds": 0.0
+}
 
-    if message_type == "text":
-        text_body = message.get("text", {}).get("body", "")
-        
-        # Get contact name if available
-        contact_name = "there"
-        if contacts:
-            for contact in contacts:
-                if contact.get("wa_id") == from_number:
-                    contact_name = contact.get("profile", {}).get("name", "there")
-                    break
-        
-        logger.info(f"👤 {contact_name} ({from_number[-4:]}****): {text_body}")
 
-        # Check if user is asking to list/manage reminders
-        if await handle_reminder_management(text_body, from_number, contact_name):
-            return
+def get_webhook_capacity():
+    """How many more messages can be accepted. Messages parked behind a busy
+    user count against WEBHOOK_QUEUE_MAXSIZE until they have run."""
+    if webhook_queue is None:
+        return 0
+    if WEBHOOK_QUEUE_MAXSIZE <= 0:
+        return float("inf")
+    return max(0, WEBHOOK_QUEUE_MAXSIZE - webhook_outstanding)
 
-        # Check if user is in a clarification conversation
-        existing_data = user_conversations.get(from_number)
-        
-        structured = await extract_with_gemini(text_body, existing_data)
 
-        if structured:
-            # Check if reminder is complete
-            missing = identify_missing_info(structured)
-            
-            if missing:
-                # Store conversation state and ask for clarification
-                logger.info(f"🔄 Requesting clarification from {contact_name} for: {missing}")
-                user_conversations[from_number] = structured
-                question = generate_clarification_question(missing)
-                
-                # Enhanced clarification message
-                response_msg = f"Hi {contact_name} 👋\n\n"
-                response_msg += f"I'm setting up your reminder and need a bit more information:\n\n"
-                
-                # Show current reminder state
-                response_msg += "📝 Current Reminder:\n"
-                if structured.get('task'):
-                    response_msg += f"   Task: {structured['task']}\n"
-                else:
-                    response_msg += f"   Task: Not specified\n"
-                    
-                if structured.get('date'):
-                    response_msg += f"   Date: {structured['date']}\n"
-                else:
-                    response_msg += f"   Date: Not specified\n"
-                    
-                if structured.get('time'):
-                    response_msg += f"   Time: {structured['time']}\n"
-                else:
-                    response_msg += f"   Time: Not specified\n"
-                
-                if structured.get('recurrence') and structured['recurrence'] != 'none':
-                    response_msg += f"   Repeat: {structured['recurrence']}\n"
-                
-                response_msg += f"\n{question}\n\n"
-                response_msg += "Just reply with the missing information and I'll complete your reminder."
-                
-                await send_text(from_number, response_msg)
-                return
-            
-            # Reminder is complete, clear conversation and create reminder
-            if from_number in user_conversations:
-                del user_conversations[from_number]
-            
-            logger.info(f"✅ Creating reminder for {contact_name}: {structured.get('task', 'Unknown task')}")
-            
-            # Create calendar event
-            if calendar_service:
-                event_link = create_calendar_event(structured)
-                calendar_msg = f"Google Calendar: Event created successfully.\nLink: {event_link}"
-                logger.info(f"📅 Calendar event created: {event_link}")
-            else:
-                calendar_msg = "Google Calendar: Not configured (reminder saved locally)"
-                logger.warning("📅 Calendar not available - reminder saved locally only")
+def enqueue_webhook_message(message: dict, contacts: list, future=None):
+    """Put an incoming message on the work queue. Returns False if the queue is full.
 
-            # Enhanced success message
-            ack_msg = f"✅ Reminder Set Successfully\n\n"
-            ack_msg += f"Hi {contact_name}! Your reminder has been created with the following details:\n\n"
-            
-            # Reminder details
-            ack_msg += "📋 Reminder Details:\n"
-            task_name = structured.get('task', structured.get('title', 'Unknown task'))
-            ack_msg += f"   Task: {task_name}\n"
-            
-            if structured.get('date'):
-                # Format date nicely
-                try:
-                    date_obj = datetime.datetime.strptime(structured['date'], "%Y-%m-%d")
-                    formatted_date = date_obj.strftime("%A, %B %d, %Y")
-                    ack_msg += f"   Date: {formatted_date}\n"
-                except ValueError:
-                    ack_msg += f"   Date: {structured['date']}\n"
-            
-            if structured.get('time') and structured.get('time') != 'skip':
-                # Format time nicely
-                try:
-                    time_obj = datetime.datetime.strptime(structured['time'], "%H:%M")
-                    formatted_time = time_obj.strftime("%I:%M %p")
-                    ack_msg += f"   Time: {formatted_time}\n"
-                except ValueError:
-                    ack_msg += f"   Time: {structured['time']}\n"
-            elif structured.get('time') == 'skip':
-                ack_msg += f"   Time: All-day reminder\n"
-            
-            if structured.get('recurrence') and structured['recurrence'] != 'none':
-                ack_msg += f"   Repeat: {structured['recurrence'].title()}\n"
-            
-            if structured.get('day_of_week'):
-                ack_msg += f"   Day: {structured['day_of_week']}\n"
-            
-            if structured.get('notes'):
-                ack_msg += f"   Notes: {structured['notes']}\n"
-            
-            ack_msg += f"\n{calendar_msg}\n\n"
-            ack_msg += "I'll make sure to remind you! Have a great day 😊"
-            
-            await send_text(from_number, ack_msg)
-            
-        else:
-            # Failed to parse - clear any existing conversation and provide helpful guidance
-            if from_number in user_conversations:
-                del user_conversations[from_number]
-            
-            logger.warning(f"❓ Could not parse reminder request from {contact_name}: '{text_body}'")
-            
-            error_msg = f"Hi {contact_name} 👋\n\n"
-            error_msg += "I couldn't understand your reminder request. Let me help you.\n\n"
-            error_msg += "Try examples like:\n"
-            error_msg += "   • 'Remind me to call mom tomorrow at 3pm'\n"
-            error_msg += "   • 'Doctor appointment on December 15'\n"
-            error_msg += "   • 'Take medicine daily at 8am'\n"
-            error_msg += "   • 'Team meeting every Monday at 10am'\n"
-            error_msg += "   • 'Pay rent on 1st of every month'\n\n"
-            error_msg += "📅 Or manage your reminders:\n"
-            error_msg += "   • 'List my reminders today'\n"
-            error_msg += "   • 'Show reminders for tomorrow'\n"
-            error_msg += "   • 'What do I have next Monday'\n"
-            error_msg += "   • 'My schedule this week'\n"
-            error_msg += "   • 'Show agenda for December 15'\n"
-            error_msg += "   • 'What's on my calendar next month'\n"
-            error_msg += "   • 'Delete all reminders'\n\n"
-            error_msg += "Or just tell me:\n"
-            error_msg += "   • What you want to be reminded about\n"
-            error_msg += "   • When you want the reminder\n"
-            error_msg += "   • Any specific time (optional)\n\n"
-            error_msg += "Try again and I'll help you set up your reminder."
-            
-            await send_text(from_number, error_msg)
+    If a future is given it is resolved once the message has been processed.
+    """
+    global webhook_outstanding
 
+    if webhook_queue is None:
+        logger.error("❌ Webhook queue not started")
+        return False
 
-# ---------------- REMINDER MANAGEMENT ----------------
-async def handle_reminder_management(text_body: str, from_number: str, contact_name: str):
-    """Enhanced reminder management with intelligent date parsing"""
-    import re
-    
-    if not calendar_service:
+    if get_webhook_capacity() < 1:
+        webhook_queue_stats["rejected"] += 1
+        logger.warning(f"⚠️  Webhook queue full ({webhook_outstanding} items), rejecting message")
         return False
-    
-    text_lower = text_body.lower().strip()
-    
-    # Enhanced keywords for listing reminders
-    list_keywords = [
-        'list', 'show', 'display', 'what are my', 'my reminders', 'reminders for',
-        'schedule', 'agenda', 'what do i have', 'appointments', 'events',
-        'what\'s on', 'check my', 'see my', 'view my'
-    ]
-    
-    # Check if user wants to delete all reminders
-    delete_all_keywords = [
-        'delete all reminders', 'remove all reminders', 'clear all reminders', 
-        'delete all my reminders', 'remove all my reminders', 'clear everything',
-        'delete everything', 'remove everything'
-    ]
-    is_delete_all_request = any(keyword in text_lower for keyword in delete_all_keywords)
-    
-    # Check if user wants to list reminders
-    is_list_request = any(keyword in text_lower for keyword in list_keywords)
-    
-    # Also check for date-specific patterns that indicate listing
-    date_list_patterns = [
-        r'reminders?\s+(?:for\s+|on\s+)?(.+)',
-        r'what.+(?:today|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)',
-        r'(?:show|list|display).+(?:today|tomorrow|this week|next week|this month)',
-        r'agenda\s+(?:for\s+)?(.+)',
-        r'schedule\s+(?:for\s+)?(.+)',
-        r'what.+(?:january|february|march|april|may|june|july|august|september|october|november|december)',
-        r'events?\s+(?:for\s+|on\s+)?(.+)'
-    ]
-    
-    for pattern in date_list_patterns:
-        if re.search(pattern, text_lower):
-            is_list_request = True
-            break
-    
-    # Check if user is in management mode
-    management_state = user_management_state.get(from_number)
-    
-    if management_state:
-        return await handle_management_action(text_body, from_number, contact_name, management_state)
-    
-    if is_delete_all_request:
-        # Handle delete all reminders request
-        await handle_delete_all_reminders(from_number, contact_name)
-        return True
-    
-    if is_list_request:
-        # Enhanced date parsing from the request
-        target_date = parse_date_from_text(text_lower)
-        date_range = None
-        
-        # Check for range queries
-        if any(phrase in text_lower for phrase in ['this week', 'next week', 'last week']):
-            date_range = get_week_range(text_lower)
-        elif any(phrase in text_lower for phrase in ['this month', 'next month', 'last month']):
-            date_range = get_month_range(text_lower)
-        
-        # Default to today if no date found
-        if not target_date and not date_range:
-            target_date = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d")
-        
-        # Get reminders
-        if date_range:
-            reminders = get_reminders_for_date_range(date_range['start'], date_range['end'])
-            await display_range_reminders(from_number, contact_name, reminders, date_range)
-        else:
-            reminders = get_reminders_for_date(target_date)
-            if not reminders:
-                formatted_date = format_date_friendly(target_date)
-                msg = f"Hi {contact_name} 👋\n\n"
-                msg += f"📅 You have no reminders scheduled for {formatted_date}.\n\n"
-                msg += "Want to create one? Just tell me:\n"
-                msg += "   • 'Remind me to call mom at 3pm'\n"
-                msg += "   • 'Doctor appointment tomorrow'\n"
-                msg += "   • 'Team meeting next Monday'\n\n"
-                msg += "Or try asking about other dates:\n"
-                msg += "   • 'Show my reminders for tomorrow'\n"
-                msg += "   • 'What's my schedule this week'\n"
-                msg += "   • 'List reminders for December 15'"
-                
-                await send_text(from_number, msg)
-                return True
-            
-            # Display reminders with management options
-            await display_reminders_with_actions(from_number, contact_name, reminders, target_date)
-        
-        return True
-    
-    return False
 
-async def handle_delete_all_reminders(from_number: str, contact_name: str):
-    """Handle delete all reminders request"""
+    enqueued_at = time.time()
+    webhook_queue.put_nowait({
+        "message": message,
+        "contacts": contacts,
+        "enqueued_at": enqueued_at,
+        "future": future
+    })
+    webhook_outstanding += 1
+    webhook_enqueue_times.append(enqueued_at)
+    webhook_queue_stats["enqueued"] += 1
+    return True
+
+
+def finish_webhook_item(item: dict):
+    """Release an item's slot once it has run (or will never run)"""
+    global webhook_outstanding
+
+    future = item.get("future")
+    if future is not None and not future.done():
+        future.cancel()
+    webhook_outstanding -= 1
+    webhook_queue.task_done()
+
+
+async def process_message_in_order(message: dict, contacts: list):
+    """Process a message through the per-user dispatcher and wait for the result"""
+    future = asyncio.get_running_loop().create_future()
+    if not enqueue_webhook_message(message, contacts, future):
+        raise HTTPException(status_code=503, detail="Webhook queue full")
+    await future
+
+
+async def run_webhook_item(worker_id: int, item: dict):
+    """Process a single queued message and resolve its future, if any"""
+    wait = time.time() - item["enqueued_at"]
+    webhook_queue_stats["total_wait_seconds"] += wait
+    webhook_queue_stats["max_wait_seconds"] = max(webhook_queue_stats["max_wait_seconds"], wait)
+
+    future = item.get("future")
     try:
-        # Get all reminders for the next 30 days to cover most user reminders
-        now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
-        start_date = now.strftime("%Y-%m-%d")
-        end_date = (now + timedelta(days=30)).strftime("%Y-%m-%d")
-        
-        all_reminders = get_reminders_for_date_range(start_date, end_date)
-        
-        if not all_reminders:
-            msg = f"Hi {contact_name} 👋\n\n"
-            msg += "📅 You have no reminders to delete.\n\n"
-            msg += "You can create new reminders anytime by telling me what you need to remember."
-            await send_text(from_number, msg)
-            return
-        
-        # Delete all reminders
-        deleted_count = 0
-        failed_count = 0
-        
-        for reminder in all_reminders:
-            if delete_calendar_event(reminder['id']):
-                deleted_count += 1
-            else:
-                failed_count += 1
-        
-        # Send confirmation message
-        msg = f"Hi {contact_name} 👋\n\n"
-        if deleted_count > 0:
-            msg += f"✅ Successfully deleted {deleted_count} reminder{'s' if deleted_count != 1 else ''}.\n\n"
-        
-        if failed_count > 0:
-            msg += f"❌ Failed to delete {failed_count} reminder{'s' if failed_count != 1 else ''}. Please try again later.\n\n"
-        
-        msg += "You can create new reminders anytime."
-        
-        await send_text(from_number, msg)
-        
+        await process_incoming_message(item["message"], item["contacts"])
+        webhook_queue_stats["processed"] += 1
+        if future is not None and not future.done():
+            future.set_result(None)
     except Exception as e:
-        logger.error(f"Error deleting all reminders: {str(e)}")
-        msg = f"Hi {contact_name}.\n\n"
-        msg += "Sorry, I encountered an error while deleting your reminders. Please try again later."
-        await send_text(from_number, msg)
+        webhook_queue_stats["failed"] += 1
+        logger.error(f"❌ Worker {worker_id} failed to process message: {str(e)}")
+        # Let a redelivery of this message try again
+        forget_message_id(item["message"].get("id"))
+        if future is not None and not future.done():
+            future.set_exception(e)
+
+
+async def webhook_worker(worker_id: int):
+    """Drain the webhook queue, running each user's messages in arrival order"""
+    while True:
+        item = await webhook_queue.get()
+        webhook_enqueue_times.popleft()
+        from_number = item["message"].get("from")
+
+        backlog = active_user_backlogs.get(from_number)
+        if backlog is not None:
+            # Another worker owns this user; it runs (and finishes) the message after the current one
+            backlog.append(item)
+            continue
+
+        backlog = active_user_backlogs[from_number] = deque()
+        try:
+            await run_webhook_item(worker_id, item)
+            while backlog:
+                finish_webhook_item(item)
+                item = backlog.popleft()
+                await run_webhook_item(worker_id, item)
+        finally:
+            del active_user_backlogs[from_number]
+            finish_webhook_item(item)
+            for leftover in backlog:
+                finish_webhook_item(leftover)
+
+
+def get_webhook_queue_metrics():
+    """Snapshot of queue depth, age and throughput for sizing the worker pool"""
+    parked = sum(len(backlog) for backlog in active_user_backlogs.values())
+    depth = (webhook_queue.qsize() if webhook_queue else 0) + parked
+
+    oldest = [backlog[0]["enqueued_at"] for backlog in active_user_backlogs.values() if backlog]
+    if webhook_enqueue_times:
+        oldest.append(webhook_enqueue_times[0])
+    oldest_age = time.time() - min(oldest) if oldest else 0.0
+    started = webhook_queue_stats["processed"] + webhook_queue_stats["failed"]
+
+    return {
+        "async_mode": WEBHOOK_ASYNC_MODE,
+        "workers": len(webhook_worker_tasks),
+        "depth": depth,
+        "parked": parked,
+        "active_users": len(active_user_backlogs),
+        "max_size": WEBHOOK_QUEUE_MAXSIZE,
+        "oldest_age_seconds": round(oldest_age, 3),
+        "enqueued": webhook_queue_stats["enqueued"],
+        "processed": webhook_queue_stats["processed"],
+        "failed": webhook_queue_stats["failed"],
+        "rejected": webhook_queue_stats["rejected"],
+        "avg_wait_seconds": round(webhook_queue_stats["total_wait_seconds"] / started, 3) if started else 0.0,
+        "max_wait_seconds": round(webhook_queue_stats["max_wait_seconds"], 3)
+    }
+
+
+async def start_webhook_workers():
+    """Create the webhook queue and spawn the worker pool"""
+    global webhook_queue
+
+    # Unbounded here: the limit is enforced on queued + parked messages in enqueue_webhook_message
+    webhook_queue = asyncio.Queue()
+    for worker_id in range(WEBHOOK_WORKER_COUNT):
+        webhook_worker_tasks.append(asyncio.create_task(webhook_worker(worker_id)))
+    mode = "queued" if WEBHOOK_ASYNC_MODE else "inline"
+    logger.info(f"📨 Webhook processing: {mode} ({WEBHOOK_WORKER_COUNT} workers)")
+
+
+async def stop_webhook_workers():
+    """Give queued messages a chance to finish, then stop the workers"""
+    if webhook_queue is None:
+        return
 
-async def handle_management_action(text_body: str, from_number: str, contact_name: str, management_state: dict):
-    """Handle edit/delete actions on specific reminders"""
-    text_lower = text_body.lower().strip()
-    
-    logger.info(f"Handle management action: {from_number}, mode: {management_state.get('mode')}, input: '{text_body}'")
-    
-    # Handle cancellation
-    if text_lower in ['cancel', 'exit', 'done', 'back']:
-        del user_management_state[from_number]
-        await send_text(from_number, "Management mode exited. You can create new reminders or list them again.")
-        return True
-    
-    # Handle number selection - check current mode first
     try:
-        selection = int(text_lower)
-        
-        # If we're in listing mode, select a reminder
-        if management_state.get('mode') == 'listing':
-            reminders = management_state.get('reminders', [])
-            
-            if 1 <= selection <= len(reminders):
-                selected_reminder = reminders[selection - 1]
-                
-                # Ask what to do with this reminder
-                user_management_state[from_number] = {
-                    'mode': 'action_selected',
-                    'selected_reminder': selected_reminder,
-                    'reminders': reminders,
-                    'date': management_state.get('date')
-                }
-                
-                logger.info(f"Set management state for {from_number}: mode=action_selected, reminder={selected_reminder['summary']}")
-                
-                msg = f"📝 Selected Reminder:\n"
-                msg += f"   Task: {selected_reminder['summary']}\n"
-                msg += f"   Time: {format_event_datetime(selected_reminder)}\n\n"
-                msg += "What would you like to do?\n"
-                msg += "   1 - ✏️ Edit this reminder\n"
-                msg += "   2 - 🗑️ Delete this reminder\n"
-                msg += "   3 - ↩️ Cancel and go back\n\n"
-                msg += "Reply with 1, 2, or 3."
-                
-                await send_text(from_number, msg)
-                return True
-            else:
-                await send_text(from_number, f"Please enter a number between 1 and {len(reminders)}, or 'cancel' to exit.")
-                return True
-        
-        # If we're in action_selected mode, handle the action choice
-        elif management_state.get('mode') == 'action_selected':
-            if selection == 1:
-                # Edit
-                selected = management_state['selected_reminder']
-                user_management_state[from_number] = {
-                    'mode': 'editing',
-                    'selected_reminder': selected,
-                    'reminders': management_state['reminders'],
-                    'date': management_state.get('date')
-                }
-                
-                msg = f"Editing Reminder:\n"
-                msg += f"   Current: {selected['summary']}\n"
-                msg += f"   Time: {format_event_datetime(selected)}\n\n"
-                msg += "Tell me what to change:\n"
-                msg += "   • 'Change time to 4pm'\n"
-                msg += "   • 'Move to tomorrow'\n"
-                msg += "   • 'Rename to call doctor'\n"
-                msg += "   • 'Make it daily'\n\n"
-                msg += "Or describe the new reminder details."
-                
-                await send_text(from_number, msg)
-                return True
-                
-            elif selection == 2:
-                # Delete
-                selected = management_state['selected_reminder']
-                logger.info(f"Attempting to delete reminder with ID: {selected.get('id')}")
-                
-                success = delete_calendar_event(selected['id'])
+        await asyncio.wait_for(webhook_queue.join(), timeout=WEBHOOK_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️  Shutting down with {webhook_outstanding} unprocessed webhook messages")
+
+    for task in webhook_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*webhook_worker_tasks, return_exceptions=True)
+    webhook_worker_tasks.clear()
+
+
+# ---------------- MESSAGE DEDUP ----------------
+# Seen WhatsApp message IDs with their expiry time. Entries are inserted with the
+# same TTL, so insertion order is also expiry order and expired IDs can be
+# dropped from the front in O(1).
+MESSAGE_DEDUP_TTL = float(os.getenv("MESSAGE_DEDUP_TTL", "86400"))
+MESSAGE_DEDUP_MAX_ENTRIES = int(os.getenv("MESSAGE_DEDUP_MAX_ENTRIES", "50000"))
+
+seen_message_ids = OrderedDict()
+message_dedup_stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+
+def is_duplicate_message(message_id: str):
+    """Return True if this message ID was already accepted, otherwise remember it"""
+    if not message_id:
+        return False
+
+    now = time.time()
+    while seen_message_ids:
+        expires_at = next(iter(seen_message_ids.values()))
+        if expires_at > now:
+            break
+        seen_message_ids.popitem(last=False)
+        message_dedup_stats["expired"] += 1
+
+    if message_id in seen_message_ids:
+        message_dedup_stats["hits"] += 1
+        return True
+
+    message_dedup_stats["misses"] += 1
+    seen_message_ids[message_id] = now + MESSAGE_DEDUP_TTL
+    if len(seen_message_ids) > MESSAGE_DEDUP_MAX_ENTRIES:
+        seen_message_ids.popitem(last=False)
+        message_dedup_stats["evicted"] += 1
+    return False
+
+
+def forget_message_id(message_id: str):
+    """Drop a message ID so a redelivery is processed again"""
+    if message_id:
+        seen_message_ids.pop(message_id, None)
+
+
+def get_message_dedup_metrics():
+    """Dedup cache size and hit/miss counters"""
+    lookups = message_dedup_stats["hits"] + message_dedup_stats["misses"]
+    return {
+        "size": len(seen_message_ids),
+        "max_entries": MESSAGE_DEDUP_MAX_ENTRIES,
+        "ttl_seconds": MESSAGE_DEDUP_TTL,
+        "hits": message_dedup_stats["hits"],
+        "misses": message_dedup_stats["misses"],
+        "hit_rate": round(message_dedup_stats["hits"] / lookups, 3) if lookups else 0.0,
+        "expired": message_dedup_stats["expired"],
+        "evicted": message_dedup_stats["evicted"]
+    }
+
+
+# ---------------- OUTBOUND DELIVERY ----------------
+# Replies are queued and sent by background workers. A token bucket per sender
+# phone number keeps us inside the Cloud API throughput tier (80 msg/s by default,
+# higher tiers go up to 1000 msg/s), 429/5xx responses and network errors are
+# retried with jittered exponential backoff, and messages that still fail end up
+# on a dead-letter list instead of silently disappearing. Messages to the same
+# recipient are delivered in the order they were queued.
+WHATSAPP_MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND", "80"))
+WHATSAPP_BURST = int(os.getenv("WHATSAPP_BURST", "80"))
+OUTBOUND_WORKER_COUNT = max(1, int(os.getenv("OUTBOUND_WORKER_COUNT", "8")))
+OUTBOUND_QUEUE_MAXSIZE = int(os.getenv("OUTBOUND_QUEUE_MAXSIZE", "10000"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "30"))
+OUTBOUND_DEAD_LETTER_MAX = int(os.getenv("OUTBOUND_DEAD_LETTER_MAX", "500"))
+OUTBOUND_DRAIN_TIMEOUT = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT", "10"))
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while (e.g. after a 429)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+outbound_buckets = {}  # phone number ID -> TokenBucket
+outbound_queue = None
+outbound_worker_tasks = []
+active_recipient_backlogs = {}  # recipient -> messages parked behind the worker sending to them
+outbound_outstanding = 0  # queued + parked + in-flight messages, capped by OUTBOUND_QUEUE_MAXSIZE
+outbound_dead_letters = deque(maxlen=OUTBOUND_DEAD_LETTER_MAX)
+outbound_stats = {"enqueued": 0, "sent": 0, "retries": 0, "dead_lettered": 0, "rejected": 0}
+
+
+def get_outbound_bucket(phone_number_id: str = WHATSAPP_PHONE_NUMBER_ID):
+    if phone_number_id not in outbound_buckets:
+        outbound_buckets[phone_number_id] = TokenBucket(WHATSAPP_MESSAGES_PER_SECOND, WHATSAPP_BURST)
+    return outbound_buckets[phone_number_id]
+
+
+def get_retry_delay(attempt: int, response=None):
+    """Full-jitter exponential backoff, honouring Retry-After when the API sends one"""
+    if response is not None and response.headers.get("Retry-After"):
+        try:
+            return min(float(response.headers["Retry-After"]), OUTBOUND_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(OUTBOUND_BACKOFF_MAX, OUTBOUND_BACKOFF_BASE * (2 ** attempt)))
+
+
+def dead_letter_message(payload: dict, attempts: int, error: str):
+    outbound_stats["dead_lettered"] += 1
+    outbound_dead_letters.append({
+        "to": payload.get("to"),
+        "payload": payload,
+        "attempts": attempts,
+        "error": error,
+        "failed_at": datetime.datetime.now().isoformat()
+    })
+    logger.error(f"❌ WhatsApp message to {str(payload.get('to'))[-4:]}**** dead-lettered after {attempts} attempt(s): {error}")
+
+
+async def deliver_whatsapp_message(payload: dict):
+    """Send one message with rate limiting and retries. Returns the API response or None."""
+    bucket = get_outbound_bucket()
+    error = "unknown error"
+
+    for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+        if attempt:
+            outbound_stats["retries"] += 1
+
+        await bucket.acquire()
+        response = None
+        try:
+            response = await post_whatsapp_message(payload)
+        except httpx.TransportError as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        else:
+            if response.is_success:
+                outbound_stats["sent"] += 1
+                return response.json()
+
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code == 429 and attempt < OUTBOUND_MAX_RETRIES:
+                # The paused bucket holds this retry (and every other send) back; no extra sleep
+                delay = get_retry_delay(attempt, response)
+                bucket.pause(delay)
+                logger.warning(f"⚠️  WhatsApp rate limited, pausing sends for {delay:.1f}s")
+                continue
+            elif response.status_code < 500 and response.status_code != 429:
+                # Bad request, auth, invalid recipient... retrying won't help
+                dead_letter_message(payload, attempt + 1, error)
+                return None
+
+        if attempt < OUTBOUND_MAX_RETRIES:
+            delay = get_retry_delay(attempt, response)
+            logger.warning(f"⚠️  WhatsApp send failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    dead_letter_message(payload, OUTBOUND_MAX_RETRIES + 1, error)
+    return None
+
+
+def enqueue_outbound_message(payload: dict, done: asyncio.Future = None):
+    """Queue a message for the delivery workers. Returns False if the queue is full.
+    Messages parked behind a recipient's earlier ones count against OUTBOUND_QUEUE_MAXSIZE.
+    done, if given, gets the API response (or None) once the message is sent or dead-lettered."""
+    global outbound_outstanding
+
+    if 0 < OUTBOUND_QUEUE_MAXSIZE <= outbound_outstanding:
+        outbound_stats["rejected"] += 1
+        dead_letter_message(payload, 0, "outbound queue full")
+        return False
+
+    outbound_queue.put_nowait((payload, done))
+    outbound_outstanding += 1
+    outbound_stats["enqueued"] += 1
+    return True
+
+
+def finish_outbound_message(item: tuple, result=None):
+    """Release a (payload, done) queue item, telling whoever waits on it how the send went"""
+    global outbound_outstanding
+
+    _, done = item
+    if done is not None and not done.done():
+        done.set_result(result)
+    outbound_outstanding -= 1
+    outbound_queue.task_done()
+
+
+async def deliver_queued_message(worker_id: int, item: tuple):
+    payload, _ = item
+    try:
+        return await deliver_whatsapp_message(payload)
+    except Exception as e:
+        logger.error(f"❌ Outbound worker {worker_id} error: {str(e)}")
+        dead_letter_message(payload, 1, str(e))
+        return None
+
+
+async def outbound_worker(worker_id: int):
+    """Drain the outbound queue, keeping each recipient's messages in order"""
+    while True:
+        item = await outbound_queue.get()
+        recipient = item[0].get("to")
+
+        backlog = active_recipient_backlogs.get(recipient)
+        if backlog is not None:
+            # The worker sending to this recipient delivers (and finishes) it next
+            backlog.append(item)
+            continue
+
+        backlog = active_recipient_backlogs[recipient] = deque()
+        try:
+            while item is not None:
+                finish_outbound_message(item, await deliver_queued_message(worker_id, item))
+                item = backlog.popleft() if backlog else None
+        finally:
+            del active_recipient_backlogs[recipient]
+            if item is not None:
+                # Cancelled mid-send
+                finish_outbound_message(item)
+            for leftover in backlog:
+                dead_letter_message(leftover[0], 0, "delivery interrupted")
+                finish_outbound_message(leftover)
+
+
+def get_outbound_metrics():
+    """Outbound queue depth, delivery counters and rate limiter state"""
+    parked = sum(len(backlog) for backlog in active_recipient_backlogs.values())
+    bucket = get_outbound_bucket()
+    bucket._refill()
+    return {
+        "depth": (outbound_queue.qsize() if outbound_queue else 0) + parked,
+        "workers": len(outbound_worker_tasks),
+        "messages_per_second": WHATSAPP_MESSAGES_PER_SECOND,
+        "tokens_available": round(bucket.tokens, 2),
+        "paused_for_seconds": round(max(bucket.paused_until - time.monotonic(), 0.0), 2),
+        "dead_letters": len(outbound_dead_letters),
+        **outbound_stats
+    }
+
+
+async def start_outbound_delivery():
+    """Open the shared WhatsApp client and spawn the delivery workers"""
+    global outbound_queue
+
+    await open_whatsapp_client()
+    # Unbounded here: the limit is enforced on queued + parked messages in enqueue_outbound_message
+    outbound_queue = asyncio.Queue()
+    for worker_id in range(OUTBOUND_WORKER_COUNT):
+        outbound_worker_tasks.append(asyncio.create_task(outbound_worker(worker_id)))
+    logger.info(f"📤 Outbound delivery: {OUTBOUND_WORKER_COUNT} workers, {WHATSAPP_MESSAGES_PER_SECOND:g} msg/s")
+
+
+async def stop_outbound_delivery():
+    """Flush queued replies, stop the workers and close the client"""
+    global outbound_queue
+
+    if outbound_queue is not None:
+        try:
+            await asyncio.wait_for(outbound_queue.join(), timeout=OUTBOUND_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️  Shutting down with {outbound_outstanding} undelivered WhatsApp messages")
+
+        for task in outbound_worker_tasks:
+            task.cancel()
+        await asyncio.gather(*outbound_worker_tasks, return_exceptions=True)
+        outbound_worker_tasks.clear()
+        outbound_queue = None
+
+    await close_whatsapp_client()
+
+
+@app.get("/dead-letters/")
+async def get_dead_letters():
+    """WhatsApp messages that could not be delivered"""
+    return {
+        "count": len(outbound_dead_letters),
+        "dead_letters": list(outbound_dead_letters)
+    }
+
+
+# ---------------- DURABLE STATE ----------------
+# Conversation/management sessions and scheduled reminder deliveries are
+# mirrored to an embedded SQLite database (WAL mode), one row per user or
+# event, so a deploy or crash loses nothing. On boot the rows are read back in
+# a single pass and the reminder heap is rebuilt with heapify (O(n)). Reminders
+# whose fire time passed while we were down are sent late if they are within
+# MISSED_REMINDER_GRACE; older one-off reminders are dropped and recurring ones
+# move on to their next occurrence. An empty STATE_DB_FILE keeps everything
+# in memory.
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "whatbot_state.db")
+MISSED_REMINDER_GRACE = float(os.getenv("MISSED_REMINDER_GRACE", "3600"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))  # sessions idle longer are not restored
+
+state_db = None
+state_db_lock = threading.Lock()  # one connection shared by the event loop and calendar threads
+web_process_lock = None  # open lock file while this process serves webhooks for STATE_DB_FILE
+state_stats = {"writes": 0, "write_errors": 0, "sessions_restored": 0, "reminders_restored": 0,
+               "reminders_caught_up": 0, "reminders_missed": 0, "replay_seconds": None}
+
+
+def connect_state_db():
+    import sqlite3
+    connection = sqlite3.connect(STATE_DB_FILE, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def open_state_db():
+    global state_db
+
+    if not STATE_DB_FILE or state_db is not None:
+        return
+    state_db = connect_state_db()
+    state_db.execute(
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        "kind TEXT NOT NULL, user TEXT NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL, "
+        "PRIMARY KEY (kind, user))"
+    )
+    state_db.execute(
+        "CREATE TABLE IF NOT EXISTS reminders ("
+        "event_id TEXT PRIMARY KEY, owner TEXT NOT NULL, fire_at REAL NOT NULL, data TEXT NOT NULL, "
+        "updated REAL NOT NULL DEFAULT 0)"
+    )
+    if "updated" not in [column[1] for column in state_db.execute("PRAGMA table_info(reminders)")]:
+        state_db.execute("ALTER TABLE reminders ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+    state_db.execute("CREATE INDEX IF NOT EXISTS reminders_updated ON reminders (updated)")
+    state_db.execute(
+        "CREATE TABLE IF NOT EXISTS partition_leases ("
+        "partition INTEGER PRIMARY KEY, worker TEXT NOT NULL, expires REAL NOT NULL)"
+    )
+    state_db.execute("CREATE TABLE IF NOT EXISTS dispatch_workers (worker TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+    logger.info(f"💾 Durable state: {STATE_DB_FILE}")
+
+
+def claim_web_process():
+    """Sessions, per-user ordering, the caches, Calendar push channels and the insert journal
+    are per process, so only one process may serve webhooks for a state DB. Raises otherwise."""
+    global web_process_lock
+
+    if not STATE_DB_FILE or web_process_lock is not None:
+        return
+    try:
+        import fcntl
+    except ImportError:
+        # Not enforced on Windows
+        return
+    lock_file = open(f"{STATE_DB_FILE}.web.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(
+            f"Another WhatBot process already serves webhooks for {STATE_DB_FILE}; "
+            "run a single web process and add reminder dispatch capacity with `python main.py dispatch`"
+        )
+    web_process_lock = lock_file
+
+
+def release_web_process():
+    global web_process_lock
+
+    if web_process_lock is not None:
+        web_process_lock.close()
+        web_process_lock = None
+
+
+def close_state_db():
+    global state_db
+
+    with state_db_lock:
+        if state_db is not None:
+            state_db.close()
+            state_db = None
+
+
+def write_state(sql: str, rows: list):
+    """Run one statement per row in a single transaction; failures are logged, never raised"""
+    if state_db is None or not rows:
+        return
+    with state_db_lock:
+        try:
+            with state_db:
+                state_db.executemany(sql, rows)
+            state_stats["writes"] += 1
+        except Exception as e:
+            state_stats["write_errors"] += 1
+            logger.error(f"❌ Durable state write failed: {e}")
+
+
+def read_state(sql: str, params: tuple = ()):
+    if state_db is None:
+        return []
+    with state_db_lock:
+        return state_db.execute(sql, params).fetchall()
+
+
+class PersistentSessions(dict):
+    """Per-user session dict that writes every top-level change through to the state DB.
+    Replace a user's value to persist it; in-place mutations are not tracked."""
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+
+    def __setitem__(self, user, value):
+        super().__setitem__(user, value)
+        write_state(
+            "INSERT OR REPLACE INTO sessions (kind, user, data, updated) VALUES (?, ?, ?, ?)",
+            [(self.kind, user, json.dumps(value, ensure_ascii=False, default=str), time.time())]
+        )
+
+    def __delitem__(self, user):
+        super().__delitem__(user)
+        write_state("DELETE FROM sessions WHERE kind = ? AND user = ?", [(self.kind, user)])
+
+    def pop(self, user, *default):
+        if user not in self:
+            return super().pop(user, *default)
+        value = super().pop(user)
+        write_state("DELETE FROM sessions WHERE kind = ? AND user = ?", [(self.kind, user)])
+        return value
+
+    def restore(self):
+        """Load this kind's sessions from the state DB, dropping ones idle past SESSION_TTL"""
+        cutoff = time.time() - SESSION_TTL
+        write_state("DELETE FROM sessions WHERE kind = ? AND updated < ?", [(self.kind, cutoff)])
+        for user, data in read_state("SELECT user, data FROM sessions WHERE kind = ?", (self.kind,)):
+            dict.__setitem__(self, user, json.loads(data))
+            state_stats["sessions_restored"] += 1
+
+
+def restore_durable_state():
+    """Open the state DB and rebuild sessions and scheduled reminders from it"""
+    started = time.time()
+    open_state_db()
+    if state_db is None:
+        return
+    user_conversations.restore()
+    user_management_state.restore()
+    restore_reminders()
+    state_stats["replay_seconds"] = round(time.time() - started, 3)
+    logger.info(
+        f"💾 Restored {state_stats['sessions_restored']} sessions and {state_stats['reminders_restored']} reminders "
+        f"({state_stats['reminders_caught_up']} overdue, {state_stats['reminders_missed']} missed)"
+    )
+
+
+def get_durable_state_metrics():
+    return {
+        "enabled": state_db is not None,
+        "file": STATE_DB_FILE or None,
+        **state_stats
+    }
+
+
+# ---------------- PROCESS MESSAGE ----------------
+# Store user conversations for clarification flow
+user_conversations = PersistentSessions("conversation")
+user_management_state = PersistentSessions("management")  # Store user state for reminder management
+
+async def process_incoming_message(message: dict, contacts: list):
+    from_number = message.get("from")
+    message_type = message.get("type")
+    # Calendar calls made while handling this message count against the sender's budget
+    calendar_call_user.set(from_number)
+
+    if message_type == "text":
+        text_body = message.get("text", {}).get("body", "")
+        
+        # Get contact name if available
+        contact_name = "there"
+        if contacts:
+            for contact in contacts:
+                if contact.get("wa_id") == from_number:
+                    contact_name = contact.get("profile", {}).get("name", "there")
+                    break
+        
+        logger.info(f"👤 {contact_name} ({from_number[-4:]}****): {text_body}")
+
+        # Check if user is asking to list/manage reminders
+        if await handle_reminder_management(text_body, from_number, contact_name):
+            return
+
+        # Check if user is in a clarification conversation
+        existing_data = user_conversations.get(from_number)
+        
+        structured = await extract_reminder(text_body, existing_data)
+
+        if structured:
+            # Check if reminder is complete
+            missing = identify_missing_info(structured)
+            
+            if missing:
+                # Store conversation state and ask for clarification
+                logger.info(f"🔄 Requesting clarification from {contact_name} for: {missing}")
+                user_conversations[from_number] = structured
+                question = generate_clarification_question(missing)
                 
-                # Clear management state
-                del user_management_state[from_number]
+                # Enhanced clarification message
+                response_msg = f"Hi {contact_name} 👋\n\n"
+                response_msg += f"I'm setting up your reminder and need a bit more information:\n\n"
                 
-                if success:
-                    msg = f"🗑️ Reminder Deleted Successfully.\n\n"
-                    msg += f"Removed: {selected['summary']}\n"
-                    msg += f"Was scheduled for: {format_event_datetime(selected)}\n\n"
-                    msg += "You can create new reminders anytime or list your remaining ones."
+                # Show current reminder state
+                response_msg += "📝 Current Reminder:\n"
+                if structured.get('task'):
+                    response_msg += f"   Task: {structured['task']}\n"
                 else:
-                    msg = f"❌ Failed to delete the reminder. Please try again later or contact support."
-                
-                await send_text(from_number, msg)
-                return True
+                    response_msg += f"   Task: Not specified\n"
+                    
+                if structured.get('date'):
+                    response_msg += f"   Date: {structured['date']}\n"
+                else:
+                    response_msg += f"   Date: Not specified\n"
+                    
+                if structured.get('time'):
+                    response_msg += f"   Time: {structured['time']}\n"
+                else:
+                    response_msg += f"   Time: Not specified\n"
                 
-            elif selection == 3:
-                # Go back to reminder list
-                reminders = management_state['reminders']
-                target_date = management_state.get('date', datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d"))
+                if structured.get('recurrence') and structured['recurrence'] != 'none':
+                    response_msg += f"   Repeat: {structured['recurrence']}\n"
                 
-                user_management_state[from_number] = {
-                    'mode': 'listing',
-                    'reminders': reminders,
-                    'date': target_date
-                }
+                response_msg += f"\n{question}\n\n"
+                response_msg += "Just reply with the missing information and I'll complete your reminder."
                 
-                await display_reminders_with_actions(from_number, contact_name, reminders, target_date)
-                return True
-            else:
-                await send_text(from_number, "Please enter 1, 2, or 3.")
-                return True
+                await send_text(from_number, response_msg)
+                return
             
-    except ValueError:
-        # Handle text-based commands when not expecting numbers
-        if management_state.get('mode') == 'editing':
-            # Process edit instructions
-            selected = management_state['selected_reminder']
+            # Reminder is complete, clear conversation and create reminder
+            if from_number in user_conversations:
+                del user_conversations[from_number]
             
-            # Use Gemini to understand the edit request
-            edit_result = await process_reminder_edit(text_body, selected)
+            logger.info(f"✅ Creating reminder for {contact_name}: {structured.get('task', 'Unknown task')}")
             
-            if edit_result:
-                success = update_calendar_event(selected['id'], edit_result)
-                
-                # Clear management state
-                del user_management_state[from_number]
-                
-                if success:
-                    msg = f"✅ Reminder Updated Successfully.\n\n"
-                    msg += f"📋 New Details:\n"
-                    msg += f"   Task: {edit_result.get('summary', selected['summary'])}\n"
-                    
-                    # Show updated date/time
-                    if 'start' in edit_result:
-                        if 'dateTime' in edit_result['start']:
-                            dt = datetime.datetime.fromisoformat(edit_result['start']['dateTime'].replace('Z', '+00:00'))
-                            local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
-                            msg += f"   Date: {local_dt.strftime('%A, %B %d, %Y')}\n"
-                            msg += f"   Time: {local_dt.strftime('%I:%M %p')}\n"
-                        else:
-                            msg += f"   Date: {edit_result['start']['date']} (All-day)\n"
-                    
-                    msg += f"\nYour reminder has been updated successfully."
-                else:
-                    msg = f"❌ Failed to update the reminder. Please try again later."
-                
-                await send_text(from_number, msg)
-                return True
+            # Create calendar event
+            if calendar_service and calendar_insert_queue is not None:
+                # Recorded locally; the insert happens in the background
+                await enqueue_calendar_insert(from_number, contact_name, structured)
+                calendar_msg = "Google Calendar: Adding your event now (I'll message you if that fails)"
+            elif calendar_service:
+                event_link = await run_calendar_call(create_calendar_event, structured, from_number)
+                calendar_msg = f"Google Calendar: Event created successfully.\nLink: {event_link}"
+                logger.info(f"📅 Calendar event created: {event_link}")
             else:
-                msg = f"I couldn't understand how to edit the reminder.\n\n"
-                msg += "Try being more specific:\n"
-                msg += "   • 'Change time to 4pm'\n"
-                msg += "   • 'Move to next Monday'\n"
-                msg += "   • 'Rename to doctor appointment'\n\n"
-                msg += "Or type 'cancel' to go back."
-                
-                await send_text(from_number, msg)
-                return True
-        
-        # For other modes, provide appropriate guidance
-        elif management_state.get('mode') == 'listing':
-            reminders = management_state.get('reminders', [])
-            await send_text(from_number, f"Please enter a number between 1 and {len(reminders)}, or 'cancel' to exit.")
-        elif management_state.get('mode') == 'action_selected':
-            await send_text(from_number, "Please enter 1 (Edit), 2 (Delete), or 3 (Cancel).")
+                calendar_msg = "Google Calendar: Not configured (reminder saved locally)"
+                logger.warning("📅 Calendar not available - reminder saved locally only")
+
+            # Enhanced success message
+            ack_msg = f"✅ Reminder Set Successfully\n\n"
+            ack_msg += f"Hi {contact_name}! Your reminder has been created with the following details:\n\n"
+            
+            # Reminder details
+            ack_msg += "📋 Reminder Details:\n"
+            task_name = structured.get('task', structured.get('title', 'Unknown task'))
+            ack_msg += f"   Task: {task_name}\n"
+            
+            if structured.get('date'):
+                # Format date nicely
+                try:
+                    date_obj = datetime.datetime.strptime(structured['date'], "%Y-%m-%d")
+                    formatted_date = date_obj.strftime("%A, %B %d, %Y")
+                    ack_msg += f"   Date: {formatted_date}\n"
+                except ValueError:
+                    ack_msg += f"   Date: {structured['date']}\n"
+            
+            if structured.get('time') and structured.get('time') != 'skip':
+                # Format time nicely
+                try:
+                    time_obj = datetime.datetime.strptime(structured['time'], "%H:%M")
+                    formatted_time = time_obj.strftime("%I:%M %p")
+                    ack_msg += f"   Time: {formatted_time}\n"
+                except ValueError:
+                    ack_msg += f"   Time: {structured['time']}\n"
+            elif structured.get('time') == 'skip':
+                ack_msg += f"   Time: All-day reminder\n"
+            
+            if structured.get('recurrence') and structured['recurrence'] != 'none':
+                ack_msg += f"   Repeat: {structured['recurrence'].title()}\n"
+            
+            if structured.get('day_of_week'):
+                ack_msg += f"   Day: {structured['day_of_week']}\n"
+            
+            if structured.get('notes'):
+                ack_msg += f"   Notes: {structured['notes']}\n"
+            
+            ack_msg += f"\n{calendar_msg}\n\n"
+            ack_msg += "I'll make sure to remind you! Have a great day 😊"
+            
+            await send_text(from_number, ack_msg)
+            
         else:
-            await send_text(from_number, f"I didn't understand that. Please try again or type 'cancel' to exit.")
-    
-    return True
+            # Failed to parse - clear any existing conversation and provide helpful guidance
+            if from_number in user_conversations:
+                del user_conversations[from_number]
+            
+            logger.warning(f"❓ Could not parse reminder request from {contact_name}: '{text_body}'")
+            
+            error_msg = f"Hi {contact_name} 👋\n\n"
+            error_msg += "I couldn't understand your reminder request. Let me help you.\n\n"
+            error_msg += "Try examples like:\n"
+            error_msg += "   • 'Remind me to call mom tomorrow at 3pm'\n"
+            error_msg += "   • 'Doctor appointment on December 15'\n"
+            error_msg += "   • 'Take medicine daily at 8am'\n"
+            error_msg += "   • 'Team meeting every Monday at 10am'\n"
+            error_msg += "   • 'Pay rent on 1st of every month'\n\n"
+            error_msg += "📅 Or manage your reminders:\n"
+            error_msg += "   • 'List my reminders today'\n"
+            error_msg += "   • 'Show reminders for tomorrow'\n"
+            error_msg += "   • 'What do I have next Monday'\n"
+            error_msg += "   • 'My schedule this week'\n"
+            error_msg += "   • 'Show agenda for December 15'\n"
+            error_msg += "   • 'What's on my calendar next month'\n"
+            error_msg += "   • 'Delete all reminders'\n\n"
+            error_msg += "Or just tell me:\n"
+            error_msg += "   • What you want to be reminded about\n"
+            error_msg += "   • When you want the reminder\n"
+            error_msg += "   • Any specific time (optional)\n\n"
+            error_msg += "Try again and I'll help you set up your reminder."
+            
+            await send_text(from_number, error_msg)
 
-def parse_date_from_text(text: str):
-    """Enhanced date parsing from natural language text"""
-    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
-    text_lower = text.lower()
+
+# ---------------- REMINDER MANAGEMENT ----------------
+async def handle_reminder_management(text_body: str, from_number: str, contact_name: str):
+    """Enhanced reminder management with intelligent date parsing"""
+    import re
     
-    # Basic relative dates
-    if 'today' in text_lower:
-        return now.strftime("%Y-%m-%d")
-    elif 'tomorrow' in text_lower:
-        return (now + timedelta(days=1)).strftime("%Y-%m-%d")
-    elif 'yesterday' in text_lower:
-        return (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    if not calendar_service:
+        return False
     
-    # Day of week patterns
-    weekdays = {
-        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-        'friday': 4, 'saturday': 5, 'sunday': 6,
-        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
-    }
+    text_lower = text_body.lower().strip()
     
-    # Check for specific weekdays
-    for day_name, day_num in weekdays.items():
-        if day_name in text_lower:
-            current_weekday = now.weekday()
-            
-            # Check for "next [day]" or "this [day]"
-            if 'next' in text_lower:
-                days_ahead = (day_num - current_weekday + 7) % 7
-                if days_ahead == 0:  # If it's the same day, go to next week
-                    days_ahead = 7
-                target_date = now + timedelta(days=days_ahead)
-                return target_date.strftime("%Y-%m-%d")
-            elif 'this' in text_lower or 'coming' in text_lower:
-                days_ahead = (day_num - current_weekday) % 7
-                if days_ahead == 0 and 'this' in text_lower:  # Today
-                    target_date = now
-                else:
-                    target_date = now + timedelta(days=days_ahead)
-                return target_date.strftime("%Y-%m-%d")
-            elif 'last' in text_lower or 'previous' in text_lower:
-                days_back = (current_weekday - day_num) % 7
-                if days_back == 0:  # Same day, go to previous week
-                    days_back = 7
-                target_date = now - timedelta(days=days_back)
-                return target_date.strftime("%Y-%m-%d")
-            else:
-                # Default to next occurrence of this weekday
-                days_ahead = (day_num - current_weekday) % 7
-                if days_ahead == 0:  # If it's today, assume next week
-                    days_ahead = 7
-                target_date = now + timedelta(days=days_ahead)
-                return target_date.strftime("%Y-%m-%d")
-                target_date = now + timedelta(days=days_ahead)
-                return target_date.strftime("%Y-%m-%d")
+    # Enhanced keywords for listing reminders
+    list_keywords = [
+        'list', 'show', 'display', 'what are my', 'my reminders', 'reminders for',
+        'schedule', 'agenda', 'what do i have', 'appointments', 'events',
+        'what\'s on', 'check my', 'see my', 'view my'
+    ]
     
-    # Week-based patterns
-    if 'this week' in text_lower:
-        days_since_monday = now.weekday()
-        monday = now - timedelta(days=days_since_monday)
-        return monday.strftime("%Y-%m-%d")
-    elif 'next week' in text_lower:
-        return (now + timedelta(weeks=1)).strftime("%Y-%m-%d")
-    elif 'last week' in text_lower:
-        return (now - timedelta(weeks=1)).strftime("%Y-%m-%d")
+    # Check if user wants to delete all reminders
+    delete_all_keywords = [
+        'delete all reminders', 'remove all reminders', 'clear all reminders', 
+        'delete all my reminders', 'remove all my reminders', 'clear everything',
+        'delete everything', 'remove everything'
+    ]
+    is_delete_all_request = any(keyword in text_lower for keyword in delete_all_keywords)
     
-    # Month-based patterns
-    if 'this month' in text_lower:
-        return now.replace(day=1).strftime("%Y-%m-%d")
-    elif 'next month' in text_lower:
-        if now.month == 12:
-            next_month = now.replace(year=now.year + 1, month=1, day=1)
-        else:
-            next_month = now.replace(month=now.month + 1, day=1)
-        return next_month.strftime("%Y-%m-%d")
-    elif 'last month' in text_lower:
-        if now.month == 1:
-            last_month = now.replace(year=now.year - 1, month=12, day=1)
-        else:
-            last_month = now.replace(month=now.month - 1, day=1)
-        return last_month.strftime("%Y-%m-%d")
+    # Check if user wants to list reminders
+    is_list_request = any(keyword in text_lower for keyword in list_keywords)
     
-    # Relative day patterns
+    # Also check for date-specific patterns that indicate listing
+    date_list_patterns = [
+        r'reminders?\s+(?:for\s+|on\s+)?(.+)',
+        r'what.+(?:today|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)',
+        r'(?:show|list|display).+(?:today|tomorrow|this week|next week|this month)',
+        r'agenda\s+(?:for\s+)?(.+)',
+        r'schedule\s+(?:for\s+)?(.+)',
+        r'what.+(?:january|february|march|april|may|june|july|august|september|october|november|december)',
+        r'events?\s+(?:for\s+|on\s+)?(.+)'
+    ]
     
-    # "in X days" or "X days from now"
-    days_pattern = r'(?:in\s+)?(\d+)\s+days?(?:\s+from\s+now)?'
-    match = re.search(days_pattern, text_lower)
-    if match:
-        days = int(match.group(1))
-        target_date = now + timedelta(days=days)
-        return target_date.strftime("%Y-%m-%d")
+    for pattern in date_list_patterns:
+        if re.search(pattern, text_lower):
+            is_list_request = True
+            break
     
-    # "X days ago"
-    ago_pattern = r'(\d+)\s+days?\s+ago'
-    match = re.search(ago_pattern, text_lower)
-    if match:
-        days = int(match.group(1))
-        target_date = now - timedelta(days=days)
-        return target_date.strftime("%Y-%m-%d")
+    # Check if user is in management mode
+    management_state = user_management_state.get(from_number)
     
-    # Date formats like "10/15", "15-10", "2025-10-15"
-    date_patterns = [
-        r'(\d{4})-(\d{1,2})-(\d{1,2})',  # YYYY-MM-DD
-        r'(\d{1,2})/(\d{1,2})/(\d{4})',  # MM/DD/YYYY
-        r'(\d{1,2})/(\d{1,2})',          # MM/DD (current year)
-        r'(\d{1,2})-(\d{1,2})-(\d{4})',  # MM-DD-YYYY or DD-MM-YYYY
-        r'(\d{1,2})-(\d{1,2})',          # MM-DD or DD-MM (current year)
-    ]
+    if management_state:
+        return await handle_management_action(text_body, from_number, contact_name, management_state)
     
-    for i, pattern in enumerate(date_patterns):
-        match = re.search(pattern, text)
-        if match:
-            try:
-                if i == 0:  # YYYY-MM-DD
-                    year, month, day = map(int, match.groups())
-                elif i in [1, 3]:  # MM/DD/YYYY or MM-DD-YYYY (assume MM/DD format)
-                    month, day, year = map(int, match.groups())
-                else:  # MM/DD or MM-DD (current year, assume MM/DD format)
-                    month, day = map(int, match.groups())
-                    year = now.year
-                    # If date has passed this year, assume next year
-                    test_date = datetime.date(year, month, day)
-                    if test_date < now.date():
-                        year += 1
-                
-                # Validate date
-                test_date = datetime.date(year, month, day)
-                return test_date.strftime("%Y-%m-%d")
-            except (ValueError, TypeError):
-                continue
+    if is_delete_all_request:
+        # Handle delete all reminders request
+        await handle_delete_all_reminders(from_number, contact_name)
+        return True
     
-    # Month name patterns
-    month_patterns = [
-        r'(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s*,?\s*(\d{4}))?',
-        r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s*,?\s*(\d{4}))?',
-        r'(\d{1,2})(?:st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)(?:\s*,?\s*(\d{4}))?',
-        r'(\d{1,2})(?:st|nd|rd|th)?\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)(?:\s*,?\s*(\d{4}))?'
+    if is_list_request:
+        # Enhanced date parsing from the request
+        target_date = parse_date_from_text(text_lower)
+        date_range = None
+        
+        # Check for range queries
+        if any(phrase in text_lower for phrase in ['this week', 'next week', 'last week']):
+            date_range = get_week_range(text_lower)
+        elif any(phrase in text_lower for phrase in ['this month', 'next month', 'last month']):
+            date_range = get_month_range(text_lower)
+        
+        # Default to today if no date found
+        if not target_date and not date_range:
+            target_date = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d")
+        
+        # Get reminders
+        if date_range:
+            # One past the display limit, so only the pages needed are fetched
+            reminders = await run_calendar_call(
+                get_reminders_for_date_range, date_range['start'], date_range['end'], RANGE_REMINDERS_DISPLAY_LIMIT + 1
+            )
+            await display_range_reminders(from_number, contact_name, reminders, date_range)
+        else:
+            reminders = await run_calendar_call(get_reminders_for_date, target_date)
+            if not reminders:
+                formatted_date = format_date_friendly(target_date)
+                msg = f"Hi {contact_name} 👋\n\n"
+                msg += f"📅 You have no reminders scheduled for {formatted_date}.\n\n"
+                msg += "Want to create one? Just tell me:\n"
+                msg += "   • 'Remind me to call mom at 3pm'\n"
+                msg += "   • 'Doctor appointment tomorrow'\n"
+                msg += "   • 'Team meeting next Monday'\n\n"
+                msg += "Or try asking about other dates:\n"
+                msg += "   • 'Show my reminders for tomorrow'\n"
+                msg += "   • 'What's my schedule this week'\n"
+                msg += "   • 'List reminders for December 15'"
+                
+                await send_text(from_number, msg)
+                return True
+            
+            # Display reminders with management options
+            await display_reminders_with_actions(from_number, contact_name, reminders, target_date)
+        
+        return True
+    
+    return False
+
+async def handle_delete_all_reminders(from_number: str, contact_name: str):
+    """Handle delete all reminders request"""
+    try:
+        # Get all reminders for the next 30 days to cover most user reminders
+        now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
+        start_date = now.strftime("%Y-%m-%d")
+        end_date = (now + timedelta(days=30)).strftime("%Y-%m-%d")
+        
+        all_reminders = await run_calendar_call(get_reminders_for_date_range, start_date, end_date)
+        
+        if not all_reminders:
+            msg = f"Hi {contact_name} 👋\n\n"
+            msg += "📅 You have no reminders to delete.\n\n"
+            msg += "You can create new reminders anytime by telling me what you need to remember."
+            await send_text(from_number, msg)
+            return
+        
+        # Delete all reminders
+        deleted_count = 0
+        failed_count = 0
+        
+        # A repeating reminder is deleted once through its series, not occurrence by occurrence
+        event_ids = list(dict.fromkeys(reminder.get('recurringEventId') or reminder['id'] for reminder in all_reminders))
+        has_series = any(is_recurring_instance(reminder) for reminder in all_reminders)
+        
+        # One batch request per CALENDAR_BATCH_SIZE events instead of a call per event
+        with calendar_priority(CALENDAR_PRIORITY_BULK):
+            results = await run_calendar_call(delete_calendar_events, event_ids)
+        for outcome in results.values():
+            if outcome in ("deleted", "not_found"):
+                deleted_count += 1
+            else:
+                failed_count += 1
+        
+        # Send confirmation message
+        msg = f"Hi {contact_name} 👋\n\n"
+        if deleted_count > 0:
+            msg += f"✅ Successfully deleted {deleted_count} reminder{'s' if deleted_count != 1 else ''}.\n\n"
+            if has_series:
+                msg += "🔁 Repeating reminders were removed with all their occurrences.\n\n"
+        
+        if failed_count > 0:
+            msg += f"❌ Failed to delete {failed_count} reminder{'s' if failed_count != 1 else ''}. Please try again later.\n\n"
+        
+        msg += "You can create new reminders anytime."
+        
+        await send_text(from_number, msg)
+        
+    except Exception as e:
+        logger.error(f"Error deleting all reminders: {str(e)}")
+        msg = f"Hi {contact_name}.\n\n"
+        msg += "Sorry, I encountered an error while deleting your reminders. Please try again later."
+        await send_text(from_number, msg)
+
+async def handle_management_action(text_body: str, from_number: str, contact_name: str, management_state: dict):
+    """Handle edit/delete actions on specific reminders"""
+    text_lower = text_body.lower().strip()
+    
+    logger.info(f"Handle management action: {from_number}, mode: {management_state.get('mode')}, input: '{text_body}'")
+    
+    # Handle cancellation
+    if text_lower in ['cancel', 'exit', 'done', 'back']:
+        del user_management_state[from_number]
+        await send_text(from_number, "Management mode exited. You can create new reminders or list them again.")
+        return True
+    
+    # Handle number selection - check current mode first
+    try:
+        selection = int(text_lower)
+        
+        # If we're in listing mode, select a reminder
+        if management_state.get('mode') == 'listing':
+            reminders = management_state.get('reminders', [])
+            
+            if 1 <= selection <= len(reminders):
+                selected_reminder = reminders[selection - 1]
+                
+                # Ask what to do with this reminder
+                user_management_state[from_number] = {
+                    'mode': 'action_selected',
+                    'selected_reminder': selected_reminder,
+                    'reminders': reminders,
+                    'date': management_state.get('date')
+                }
+                
+                logger.info(f"Set management state for {from_number}: mode=action_selected, reminder={selected_reminder['summary']}")
+                
+                msg = f"📝 Selected Reminder:\n"
+                msg += f"   Task: {selected_reminder['summary']}\n"
+                msg += f"   Time: {format_event_datetime(selected_reminder)}\n\n"
+                msg += "What would you like to do?\n"
+                msg += "   1 - ✏️ Edit this reminder\n"
+                msg += "   2 - 🗑️ Delete this reminder\n"
+                msg += "   3 - ↩️ Cancel and go back\n"
+                if is_recurring_instance(selected_reminder):
+                    msg += "   4 - 🔁 Edit every occurrence\n"
+                    msg += "   5 - 🔁 Delete every occurrence\n\n"
+                    msg += "Reply with 1-5."
+                else:
+                    msg += "\nReply with 1, 2, or 3."
+                
+                await send_text(from_number, msg)
+                return True
+            else:
+                await send_text(from_number, f"Please enter a number between 1 and {len(reminders)}, or 'cancel' to exit.")
+                return True
+        
+        # If we're in action_selected mode, handle the action choice
+        elif management_state.get('mode') == 'action_selected':
+            selected = management_state['selected_reminder']
+            recurring = is_recurring_instance(selected)
+
+            if selection == 1 or (selection == 4 and recurring):
+                # Edit this reminder (1) or every occurrence of a repeating one (4)
+                series = selection == 4
+                user_management_state[from_number] = {
+                    'mode': 'editing',
+                    'selected_reminder': selected,
+                    'series': series,
+                    'reminders': management_state['reminders'],
+                    'date': management_state.get('date')
+                }
+                
+                msg = f"Editing Every Occurrence:\n" if series else f"Editing Reminder:\n"
+                msg += f"   Current: {selected['summary']}\n"
+                msg += f"   Time: {format_event_datetime(selected)}\n\n"
+                msg += "Tell me what to change:\n"
+                msg += "   • 'Change time to 4pm'\n"
+                msg += "   • 'Move to tomorrow'\n"
+                msg += "   • 'Rename to call doctor'\n"
+                msg += "   • 'Make it daily'\n\n"
+                msg += "Or describe the new reminder details."
+                
+                await send_text(from_number, msg)
+                return True
+                
+            elif selection == 2 or (selection == 5 and recurring):
+                # Delete this reminder (2) or every occurrence of a repeating one (5)
+                await delete_selected_reminder(from_number, selected, series=selection == 5)
+                return True
+                
+            elif selection == 3:
+                # Go back to reminder list
+                reminders = management_state['reminders']
+                target_date = management_state.get('date', datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d"))
+                
+                user_management_state[from_number] = {
+                    'mode': 'listing',
+                    'reminders': reminders,
+                    'date': target_date
+                }
+                
+                await display_reminders_with_actions(from_number, contact_name, reminders, target_date)
+                return True
+            else:
+                await send_text(from_number, "Please enter a number from 1 to 5." if recurring else "Please enter 1, 2, or 3.")
+                return True
+            
+    except ValueError:
+        # Handle text-based commands when not expecting numbers
+        if management_state.get('mode') == 'editing':
+            # Process edit instructions
+            selected = management_state['selected_reminder']
+            series = management_state.get('series') or (is_recurring_instance(selected) and refers_to_series(text_body))
+            await apply_reminder_edit(from_number, selected, text_body, series)
+            return True
+        
+        # For other modes, provide appropriate guidance
+        elif management_state.get('mode') == 'listing':
+            reminders = management_state.get('reminders', [])
+            await send_text(from_number, f"Please enter a number between 1 and {len(reminders)}, or 'cancel' to exit.")
+        elif management_state.get('mode') == 'action_selected':
+            selected = management_state['selected_reminder']
+            if is_recurring_instance(selected) and refers_to_series(text_body):
+                # "Delete this daily reminder" / "move it to 9am every day"
+                if SERIES_DELETE_PATTERN.search(text_body):
+                    await delete_selected_reminder(from_number, selected, series=True)
+                else:
+                    await apply_reminder_edit(from_number, selected, text_body, series=True)
+            else:
+                await send_text(from_number, "Please enter 1 (Edit), 2 (Delete), or 3 (Cancel).")
+        else:
+            await send_text(from_number, f"I didn't understand that. Please try again or type 'cancel' to exit.")
+    
+    return True
+
+async def delete_selected_reminder(from_number: str, selected: dict, series: bool = False):
+    """Delete the reminder picked in management mode, or its whole series"""
+    logger.info(f"Attempting to delete reminder with ID: {selected.get('recurringEventId') if series else selected.get('id')}")
+    
+    if series:
+        outcome = await run_calendar_call(delete_reminder_series, selected)
+    else:
+        outcome = await run_calendar_call(delete_calendar_event, selected['id'], selected.get('etag'))
+    
+    # Clear management state
+    user_management_state.pop(from_number, None)
+    
+    if outcome in ("deleted", "not_found"):
+        msg = f"🗑️ Reminder Deleted Successfully.\n\n"
+        msg += f"Removed: {selected['summary']}\n"
+        if series:
+            msg += f"🔁 Every occurrence of this repeating reminder was removed.\n\n"
+        else:
+            msg += f"Was scheduled for: {format_event_datetime(selected)}\n\n"
+        msg += "You can create new reminders anytime or list your remaining ones."
+    elif outcome == "conflict":
+        msg = f"⚠️ This reminder was changed elsewhere after I listed it, so I didn't delete it.\n\n"
+        msg += "List your reminders again to see the latest version."
+    else:
+        msg = f"❌ Failed to delete the reminder. Please try again later or contact support."
+    
+    await send_text(from_number, msg)
+
+async def apply_reminder_edit(from_number: str, selected: dict, edit_text: str, series: bool = False):
+    """Apply an edit instruction to the reminder picked in management mode, or its whole series"""
+    # Use Gemini to understand the edit request
+    edit_result = await process_reminder_edit(edit_text, selected)
+    
+    if not edit_result:
+        msg = f"I couldn't understand how to edit the reminder.\n\n"
+        msg += "Try being more specific:\n"
+        msg += "   • 'Change time to 4pm'\n"
+        msg += "   • 'Move to next Monday'\n"
+        msg += "   • 'Rename to doctor appointment'\n\n"
+        msg += "Or type 'cancel' to go back."
+        
+        await send_text(from_number, msg)
+        return
+    
+    # A single occurrence cannot carry its own recurrence rule
+    series = series or (is_recurring_instance(selected) and 'recurrence' in edit_result)
+    if series:
+        outcome = await run_calendar_call(update_reminder_series, selected, edit_result)
+    else:
+        outcome = await run_calendar_call(update_calendar_event, selected['id'], edit_result, selected.get('etag'))
+    
+    # Clear management state
+    user_management_state.pop(from_number, None)
+    
+    if outcome == "updated":
+        msg = f"✅ Reminder Updated Successfully.\n\n"
+        msg += f"📋 New Details:\n"
+        msg += f"   Task: {edit_result.get('summary', selected['summary'])}\n"
+        
+        # Show updated date/time
+        if 'start' in edit_result:
+            if 'dateTime' in edit_result['start']:
+                dt = datetime.datetime.fromisoformat(edit_result['start']['dateTime'].replace('Z', '+00:00'))
+                if dt.tzinfo is None:
+                    dt = pytz.timezone(edit_result['start'].get('timeZone') or USER_TIMEZONE).localize(dt)
+                local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
+                msg += f"   Date: {local_dt.strftime('%A, %B %d, %Y')}\n"
+                msg += f"   Time: {local_dt.strftime('%I:%M %p')}\n"
+            else:
+                msg += f"   Date: {edit_result['start']['date']} (All-day)\n"
+        
+        if series:
+            msg += f"   🔁 Applied to every occurrence\n"
+        msg += f"\nYour reminder has been updated successfully."
+    elif outcome == "not_found":
+        msg = f"❌ This reminder no longer exists. List your reminders again to see what's left."
+    elif outcome == "conflict":
+        msg = f"⚠️ This reminder was changed elsewhere after I listed it, so I didn't overwrite it.\n\n"
+        msg += "List your reminders again and retry the edit."
+    else:
+        msg = f"❌ Failed to update the reminder. Please try again later."
+    
+    await send_text(from_number, msg)
+
+def parse_date_from_text(text: str):
+    """Enhanced date parsing from natural language text"""
+    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
+    text_lower = text.lower()
+    
+    # Basic relative dates
+    if 'today' in text_lower:
+        return now.strftime("%Y-%m-%d")
+    elif 'tomorrow' in text_lower:
+        return (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    elif 'yesterday' in text_lower:
+        return (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    # Day of week patterns
+    weekdays = {
+        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+        'friday': 4, 'saturday': 5, 'sunday': 6,
+        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6
+    }
+    
+    # Check for specific weekdays
+    for day_name, day_num in weekdays.items():
+        if day_name in text_lower:
+            current_weekday = now.weekday()
+            
+            # Check for "next [day]" or "this [day]"
+            if 'next' in text_lower:
+                days_ahead = (day_num - current_weekday + 7) % 7
+                if days_ahead == 0:  # If it's the same day, go to next week
+                    days_ahead = 7
+                target_date = now + timedelta(days=days_ahead)
+                return target_date.strftime("%Y-%m-%d")
+            elif 'this' in text_lower or 'coming' in text_lower:
+                days_ahead = (day_num - current_weekday) % 7
+                if days_ahead == 0 and 'this' in text_lower:  # Today
+                    target_date = now
+                else:
+                    target_date = now + timedelta(days=days_ahead)
+                return target_date.strftime("%Y-%m-%d")
+            elif 'last' in text_lower or 'previous' in text_lower:
+                days_back = (current_weekday - day_num) % 7
+                if days_back == 0:  # Same day, go to previous week
+                    days_back = 7
+                target_date = now - timedelta(days=days_back)
+                return target_date.strftime("%Y-%m-%d")
+            else:
+                # Default to next occurrence of this weekday
+                days_ahead = (day_num - current_weekday) % 7
+                if days_ahead == 0:  # If it's today, assume next week
+                    days_ahead = 7
+                target_date = now + timedelta(days=days_ahead)
+                return target_date.strftime("%Y-%m-%d")
+                target_date = now + timedelta(days=days_ahead)
+                return target_date.strftime("%Y-%m-%d")
+    
+    # Week-based patterns
+    if 'this week' in text_lower:
+        days_since_monday = now.weekday()
+        monday = now - timedelta(days=days_since_monday)
+        return monday.strftime("%Y-%m-%d")
+    elif 'next week' in text_lower:
+        return (now + timedelta(weeks=1)).strftime("%Y-%m-%d")
+    elif 'last week' in text_lower:
+        return (now - timedelta(weeks=1)).strftime("%Y-%m-%d")
+    
+    # Month-based patterns
+    if 'this month' in text_lower:
+        return now.replace(day=1).strftime("%Y-%m-%d")
+    elif 'next month' in text_lower:
+        if now.month == 12:
+            next_month = now.replace(year=now.year + 1, month=1, day=1)
+        else:
+            next_month = now.replace(month=now.month + 1, day=1)
+        return next_month.strftime("%Y-%m-%d")
+    elif 'last month' in text_lower:
+        if now.month == 1:
+            last_month = now.replace(year=now.year - 1, month=12, day=1)
+        else:
+            last_month = now.replace(month=now.month - 1, day=1)
+        return last_month.strftime("%Y-%m-%d")
+    
+    # Relative day patterns
+    
+    # "in X days" or "X days from now"
+    days_pattern = r'(?:in\s+)?(\d+)\s+days?(?:\s+from\s+now)?'
+    match = re.search(days_pattern, text_lower)
+    if match:
+        days = int(match.group(1))
+        target_date = now + timedelta(days=days)
+        return target_date.strftime("%Y-%m-%d")
+    
+    # "X days ago"
+    ago_pattern = r'(\d+)\s+days?\s+ago'
+    match = re.search(ago_pattern, text_lower)
+    if match:
+        days = int(match.group(1))
+        target_date = now - timedelta(days=days)
+        return target_date.strftime("%Y-%m-%d")
+    
+    # Date formats like "10/15", "15-10", "2025-10-15"
+    date_patterns = [
+        r'(\d{4})-(\d{1,2})-(\d{1,2})',  # YYYY-MM-DD
+        r'(\d{1,2})/(\d{1,2})/(\d{4})',  # MM/DD/YYYY
+        r'(\d{1,2})/(\d{1,2})',          # MM/DD (current year)
+        r'(\d{1,2})-(\d{1,2})-(\d{4})',  # MM-DD-YYYY or DD-MM-YYYY
+        r'(\d{1,2})-(\d{1,2})',          # MM-DD or DD-MM (current year)
+    ]
+    
+    for i, pattern in enumerate(date_patterns):
+        match = re.search(pattern, text)
+        if match:
+            try:
+                if i == 0:  # YYYY-MM-DD
+                    year, month, day = map(int, match.groups())
+                elif i in [1, 3]:  # MM/DD/YYYY or MM-DD-YYYY (assume MM/DD format)
+                    month, day, year = map(int, match.groups())
+                else:  # MM/DD or MM-DD (current year, assume MM/DD format)
+                    month, day = map(int, match.groups())
+                    year = now.year
+                    # If date has passed this year, assume next year
+                    test_date = datetime.date(year, month, day)
+                    if test_date < now.date():
+                        year += 1
+                
+                # Validate date
+                test_date = datetime.date(year, month, day)
+                return test_date.strftime("%Y-%m-%d")
+            except (ValueError, TypeError):
+                continue
+    
+    # Month name patterns
+    month_patterns = [
+        r'(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s*,?\s*(\d{4}))?',
+        r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+(\d{1,2})(?:st|nd|rd|th)?(?:\s*,?\s*(\d{4}))?',
+        r'(\d{1,2})(?:st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)(?:\s*,?\s*(\d{4}))?',
+        r'(\d{1,2})(?:st|nd|rd|th)?\s+(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)(?:\s*,?\s*(\d{4}))?'
     ]
     
-    month_map = {
-        'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
-        'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6,
-        'july': 7, 'jul': 7, 'august': 8, 'aug': 8, 'september': 9, 'sep': 9,
-        'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12
+    month_map = {
+        'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
+        'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6,
+        'july': 7, 'jul': 7, 'august': 8, 'aug': 8, 'september': 9, 'sep': 9,
+        'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12
+    }
+    
+    for i, pattern in enumerate(month_patterns):
+        match = re.search(pattern, text_lower)
+        if match:
+            try:
+                groups = match.groups()
+                if i < 2:  # Month first
+                    month_name, day_str, year_str = groups
+                    day = int(day_str)
+                else:  # Day first
+                    day_str, month_name, year_str = groups
+                    day = int(day_str)
+                
+                month = month_map.get(month_name.lower())
+                year = int(year_str) if year_str else now.year
+                
+                if month and 1 <= day <= 31:
+                    # If no year specified and date has passed, use next year
+                    if not year_str:
+                        test_date = datetime.date(year, month, day)
+                        if test_date < now.date():
+                            year += 1
+                    
+                    test_date = datetime.date(year, month, day)
+                    return test_date.strftime("%Y-%m-%d")
+            except (ValueError, KeyError):
+                continue
+    
+    return None
+
+def get_week_range(text: str):
+    """Get start and end dates for week-based queries"""
+    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
+    
+    if 'this week' in text.lower():
+        # Start from Monday of current week
+        days_since_monday = now.weekday()
+        start_date = now - timedelta(days=days_since_monday)
+        end_date = start_date + timedelta(days=6)  # Sunday
+    elif 'next week' in text.lower():
+        # Start from Monday of next week
+        days_since_monday = now.weekday()
+        start_date = now - timedelta(days=days_since_monday) + timedelta(weeks=1)
+        end_date = start_date + timedelta(days=6)
+    elif 'last week' in text.lower():
+        # Start from Monday of last week
+        days_since_monday = now.weekday()
+        start_date = now - timedelta(days=days_since_monday) - timedelta(weeks=1)
+        end_date = start_date + timedelta(days=6)
+    else:
+        return None
+    
+    return {
+        'start': start_date.strftime("%Y-%m-%d"),
+        'end': end_date.strftime("%Y-%m-%d"),
+        'type': 'week'
+    }
+
+def get_month_range(text: str):
+    """Get start and end dates for month-based queries"""
+    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
+    
+    if 'this month' in text.lower():
+        start_date = now.replace(day=1)
+        # Last day of current month
+        if now.month == 12:
+            end_date = now.replace(year=now.year + 1, month=1, day=1) - timedelta(days=1)
+        else:
+            end_date = now.replace(month=now.month + 1, day=1) - timedelta(days=1)
+    elif 'next month' in text.lower():
+        if now.month == 12:
+            start_date = now.replace(year=now.year + 1, month=1, day=1)
+            end_date = start_date.replace(month=2, day=1) - timedelta(days=1)
+        else:
+            start_date = now.replace(month=now.month + 1, day=1)
+            if start_date.month == 12:
+                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
+            else:
+                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
+    elif 'last month' in text.lower():
+        if now.month == 1:
+            start_date = now.replace(year=now.year - 1, month=12, day=1)
+            end_date = now.replace(day=1) - timedelta(days=1)
+        else:
+            start_date = now.replace(month=now.month - 1, day=1)
+            end_date = now.replace(day=1) - timedelta(days=1)
+    else:
+        return None
+    
+    return {
+        'start': start_date.strftime("%Y-%m-%d"),
+        'end': end_date.strftime("%Y-%m-%d"),
+        'type': 'month'
+    }
+
+async def display_range_reminders(from_number: str, contact_name: str, reminders: list, date_range: dict):
+    """Display reminders for a date range (week/month)"""
+    range_type = date_range['type']
+    start_formatted = format_date_friendly(date_range['start'])
+    end_formatted = format_date_friendly(date_range['end'])
+    
+    if range_type == 'week':
+        title = f"📅 Your Reminders This Week"
+        subtitle = f"({start_formatted} to {end_formatted})"
+    else:  # month
+        title = f"📅 Your Reminders This Month"
+        subtitle = f"({start_formatted} to {end_formatted})"
+    
+    if not reminders:
+        msg = f"{title}\n\n"
+        msg += f"Hi {contact_name} 👋\n\n"
+        msg += f"You have no reminders scheduled for {subtitle.lower()}.\n\n"
+        msg += "Want to create some? Try:\n"
+        msg += "   • 'Remind me to call mom tomorrow at 3pm'\n"
+        msg += "   • 'Meeting every Monday at 10am'\n"
+        msg += "   • 'Doctor appointment next Friday'"
+        
+        await send_text(from_number, msg)
+        return
+    
+    has_more = len(reminders) > RANGE_REMINDERS_DISPLAY_LIMIT
+    reminders = reminders[:RANGE_REMINDERS_DISPLAY_LIMIT]
+    
+    # Group reminders by date
+    reminders_by_date = {}
+    for reminder in reminders:
+        start = reminder.get('start', {})
+        if 'dateTime' in start:
+            dt = datetime.datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+            local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
+            date_key = local_dt.strftime("%Y-%m-%d")
+        elif 'date' in start:
+            date_key = start['date']
+        else:
+            date_key = "unknown"
+        
+        if date_key not in reminders_by_date:
+            reminders_by_date[date_key] = []
+        reminders_by_date[date_key].append(reminder)
+    
+    msg = f"{title}\n{subtitle}\n\n"
+    msg += f"Hi {contact_name} 👋, here are your scheduled reminders:\n\n"
+    
+    # Sort dates and display
+    sorted_dates = sorted(reminders_by_date.keys())
+    for date_key in sorted_dates:
+        if date_key == "unknown":
+            continue
+        
+        date_reminders = reminders_by_date[date_key]
+        friendly_date = format_date_friendly(date_key)
+        
+        msg += f"📆 {friendly_date}:\n"
+        for i, reminder in enumerate(date_reminders, 1):
+            time_str = format_event_datetime(reminder)
+            # Extract just the time part for cleaner display
+            if " at " in time_str:
+                time_part = time_str.split(" at ")[1]
+                msg += f"   {i}. {reminder['summary']} - {time_part}\n"
+            else:
+                msg += f"   {i}. {reminder['summary']} - {time_str}\n"
+        msg += "\n"
+    
+    if has_more:
+        msg += "…and more. Ask for a specific date to see everything on that day.\n\n"
+    
+    msg += "💡 To manage specific reminders, try:\n"
+    msg += "   • 'Show reminders for [specific date]'\n"
+    msg += "   • 'List my reminders today'\n"
+    msg += "   • 'What do I have tomorrow'"
+    
+    await send_text(from_number, msg)
+
+def get_reminders_for_date(date_str: str):
+    """Get all calendar events for a specific date"""
+    if not calendar_service:
+        return []
+    
+    try:
+        # Convert date to start and end of day
+        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        tz = pytz.timezone(USER_TIMEZONE)
+        
+        start_of_day = tz.localize(date_obj.replace(hour=0, minute=0, second=0))
+        end_of_day = tz.localize(date_obj.replace(hour=23, minute=59, second=59))
+        
+        # Query calendar events
+        events = iter_calendar_events(start_of_day, end_of_day)
+        
+        # Filter to only include events that look like reminders
+        reminders = []
+        for event in events:
+            # Include events that have our typical reminder characteristics
+            # or any event that the user might want to manage
+            if event.get('summary'):
+                reminders.append(event)
+        
+        return reminders
+        
+    except Exception as e:
+        logger.error(f"Error fetching calendar events: {str(e)}")
+        return []
+
+def get_reminders_for_date_range(start_date: str, end_date: str, limit: int = None):
+    """Get calendar events for a date range (for weekly/monthly views), at most limit if given"""
+    if not calendar_service:
+        return []
+    
+    try:
+        start_obj = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        end_obj = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+        tz = pytz.timezone(USER_TIMEZONE)
+        
+        start_of_period = tz.localize(start_obj.replace(hour=0, minute=0, second=0))
+        end_of_period = tz.localize(end_obj.replace(hour=23, minute=59, second=59))
+        
+        return list(itertools.islice(iter_calendar_events(start_of_period, end_of_period), limit))
+        
+    except Exception as e:
+        logger.error(f"Error fetching calendar events for range: {str(e)}")
+        return []
+
+# Partial responses: only the event fields the bot reads
+EVENT_FIELDS = "id,status,summary,start,end,etag,recurrence,recurringEventId,originalStartTime"
+EVENT_LIST_FIELDS = f"nextPageToken,nextSyncToken,items({EVENT_FIELDS})"
+CALENDAR_LIST_PAGE_SIZE = int(os.getenv("CALENDAR_LIST_PAGE_SIZE", "250"))
+RANGE_REMINDERS_DISPLAY_LIMIT = int(os.getenv("RANGE_REMINDERS_DISPLAY_LIMIT", "60"))
+
+def iter_calendar_events(time_min: datetime.datetime, time_max: datetime.datetime, calendar_id: str = 'primary'):
+    """Yield events overlapping [time_min, time_max] in start time order.
+    Served from the local event cache when it is enabled; otherwise pages are
+    fetched lazily, so a caller that stops early skips the remaining pages."""
+    if CALENDAR_CACHE_ENABLED:
+        try:
+            events = get_event_store(calendar_id).query(time_min, time_max)
+        except Exception as e:
+            logger.warning(f"⚠️  Event cache unavailable, querying Calendar directly: {str(e)}")
+        else:
+            yield from events
+            return
+
+    page_token = None
+    while True:
+        events_result = execute_calendar_request(calendar_service.events().list(
+            calendarId=calendar_id,
+            timeMin=time_min.isoformat(),
+            timeMax=time_max.isoformat(),
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=CALENDAR_LIST_PAGE_SIZE,
+            pageToken=page_token,
+            fields=EVENT_LIST_FIELDS
+        ))
+        yield from events_result.get('items', [])
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return
+
+async def display_reminders_with_actions(from_number: str, contact_name: str, reminders: list, target_date: str):
+    """Display reminders with numbered options for management"""
+    formatted_date = format_date_friendly(target_date)
+    
+    msg = f"📅 Your Reminders for {formatted_date}\n\n"
+    msg += f"Hi {contact_name} 👋, here are your scheduled reminders:\n\n"
+    
+    for i, reminder in enumerate(reminders, 1):
+        msg += f"{i}. {reminder['summary']}{' 🔁' if is_recurring_instance(reminder) else ''}\n"
+        msg += f"   ⏰ {format_event_datetime(reminder)}\n\n"
+    
+    msg += "\n\n\n🔧 Management Options:\n"
+    msg += f"   Reply with a number (1-{len(reminders)}) to edit or delete\n"
+    msg += f"   Reply 'cancel' to exit management mode\n\n"
+    msg += "What would you like to do with these reminders?"
+    
+    # Store management state - EXPLICITLY set mode to 'listing'
+    user_management_state[from_number] = {
+        'mode': 'listing',
+        'reminders': reminders,
+        'date': target_date
+    }
+    
+    logger.info(f"Set management state for {from_number}: mode=listing, {len(reminders)} reminders")
+    
+    await send_text(from_number, msg)
+
+def format_date_friendly(date_str: str):
+    """Convert YYYY-MM-DD to friendly format"""
+    try:
+        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        today = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).date()
+        
+        if date_obj.date() == today:
+            return "Today"
+        elif date_obj.date() == today + timedelta(days=1):
+            return "Tomorrow"
+        elif date_obj.date() == today - timedelta(days=1):
+            return "Yesterday"
+        else:
+            return date_obj.strftime("%A, %B %d, %Y")
+    except (ValueError, TypeError):
+        return date_str
+
+def format_event_datetime(event: dict):
+    """Format event datetime for display"""
+    try:
+        start = event.get('start', {})
+        if 'dateTime' in start:
+            # Timed event
+            dt = datetime.datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+            local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
+            return f"{local_dt.strftime('%A, %B %d')} at {local_dt.strftime('%I:%M %p')}"
+        elif 'date' in start:
+            # All-day event
+            date_obj = datetime.datetime.strptime(start['date'], "%Y-%m-%d")
+            return f"{date_obj.strftime('%A, %B %d')} - All-day"
+        else:
+            return "Date/time not specified"
+    except Exception as e:
+        logger.error(f"Error formatting event datetime: {str(e)}")
+        return "Unable to parse date/time"
+
+async def process_reminder_edit(edit_text: str, original_event: dict):
+    """Use Gemini to understand edit instructions and return updated event data"""
+    if FAST_PATH_PARSER_ENABLED:
+        updates = parse_edit_locally(edit_text, original_event)
+        if updates is None and refers_to_series(edit_text):
+            # "Move it to 9am every day": the series scope is handled by the caller
+            updates = parse_edit_locally(SERIES_SCOPE_PATTERN.sub(" ", edit_text), original_event)
+        if updates:
+            reminder_parser_stats["edit_fast_path"] += 1
+            logger.info(f"⚡ Fast-path processed edit: {updates}")
+            return updates
+
+    reminder_parser_stats["edit_gemini"] += 1
+    date_context = get_current_date_context()
+    
+    # Extract current event details
+    current_summary = original_event.get('summary', '')
+    current_start = original_event.get('start', {})
+    
+    prompt = f"""
+You are helping to edit a calendar reminder. The user wants to modify an existing event.
+
+Current Event:
+- Summary: "{current_summary}"
+- Start: {json.dumps(current_start)}
+
+User's edit instruction: "{edit_text}"
+
+Context:
+- Today is {date_context['current_day']}, {date_context['current_date']}
+- Current time: {date_context['current_time']}
+- User timezone: {USER_TIMEZONE}
+
+Return ONLY a JSON object with the fields that should be updated. Only include fields that are being changed.
+
+Possible fields to update:
+{{
+  "summary": "new task name",
+  "start": {{"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "{USER_TIMEZONE}"}},
+  "end": {{"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "{USER_TIMEZONE}"}},
+  "recurrence": ["RRULE:FREQ=DAILY"] // for recurring events
+}}
+
+For all-day events use:
+"start": {{"date": "YYYY-MM-DD"}}
+"end": {{"date": "YYYY-MM-DD"}}
+
+Rules:
+1. Only include fields that are being changed
+2. If changing time, include both start and end
+3. For date changes: 'tomorrow' = {(datetime.datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=1)).strftime("%Y-%m-%d")}
+4. Convert times to 24-hour format with timezone
+5. Return ONLY the JSON object, no explanation
+"""
+
+    try:
+        resp = await generate_gemini_content(
+            prompt,
+            generation_config={
+                "max_output_tokens": 300,
+                "temperature": 0.1,
+                "top_p": 0.95
+            }
+        )
+
+        if not resp.candidates or not resp.candidates[0].content.parts:
+            return None
+
+        text = resp.candidates[0].content.parts[0].text.strip()
+        
+        # Clean markdown formatting
+        text = re.sub(r'^```json\s*', '', text)
+        text = re.sub(r'^```\s*', '', text)
+        text = re.sub(r'\s*```$', '', text)
+        text = text.strip()
+
+        # Parse JSON
+        updates = json.loads(text)
+        
+        # Validate and format the updates
+        if 'start' in updates and 'end' not in updates:
+            # If start time is updated, update end time too
+            start_data = updates['start']
+            if 'dateTime' in start_data:
+                # For timed events, make end time same as start (reminder duration = 0)
+                updates['end'] = start_data.copy()
+            elif 'date' in start_data:
+                # For all-day events, end date should be same as start date
+                updates['end'] = start_data.copy()
+        
+        logger.info(f"Processed edit: {updates}")
+        return updates
+
+    except (json.JSONDecodeError, Exception) as e:
+        logger.error(f"Error processing reminder edit: {str(e)}")
+        return None
+
+def update_calendar_event(event_id: str, updates: dict, etag: str = None):
+    """Update a calendar event with new data.
+
+    Returns "updated", "not_found", "conflict" (the event changed since etag) or "failed".
+    """
+    if not calendar_service:
+        return "failed"
+
+    outcome = update_calendar_events({event_id: updates}, {event_id: etag} if etag else None)[event_id]
+    if outcome == "updated":
+        logger.info(f"✅ Calendar event updated successfully: {event_id}")
+    return outcome
+
+def delete_calendar_event(event_id: str, etag: str = None):
+    """Delete a calendar event.
+
+    Returns "deleted", "not_found", "conflict" (the event changed since etag) or "failed".
+    """
+    if not calendar_service:
+        logger.error("❌ Calendar service not available for deletion")
+        return "failed"
+    
+    if not event_id:
+        logger.error("No event ID provided for deletion")
+        return "failed"
+    
+    logger.info(f"Attempting to delete calendar event with ID: {event_id}")
+    return delete_calendar_events([event_id], {event_id: etag} if etag else None)[event_id]
+
+# Listings are expanded into single occurrences, so a repeating reminder the
+# user picks is one instance. When they mean the whole series ("delete this
+# daily reminder", "move it to 9am every day") we act on the series master:
+# one mutation instead of one per occurrence.
+SERIES_SCOPE_PATTERN = re.compile(
+    r"\b(?:every\s+(?:day|week|month|year|hour|time|occurrence)|each\s+(?:day|week|month|year|time|occurrence)"
+    r"|all\s+(?:of\s+them|occurrences|future\s+ones)|(?:the\s+)?(?:whole|entire)\s+series|the\s+series"
+    r"|(?:this|the)\s+(?:daily|weekly|monthly|yearly|hourly|recurring|repeating)\s+(?:reminder|event|one))\b",
+    re.IGNORECASE
+)
+SERIES_DELETE_PATTERN = re.compile(r"\b(?:delete|remove|cancel|stop|clear)\b", re.IGNORECASE)
+
+
+def is_recurring_instance(event: dict):
+    return bool(event.get('recurringEventId'))
+
+
+def refers_to_series(text: str):
+    """Whether an instruction is about every occurrence rather than the selected one"""
+    return bool(SERIES_SCOPE_PATTERN.search(text))
+
+
+def get_series_master(event: dict):
+    """The recurring event an occurrence belongs to, or None if it is gone"""
+    master_id = event.get('recurringEventId')
+    if not master_id or not calendar_service:
+        return None
+
+    store = event_stores.get('primary')
+    if store is not None:
+        with store.lock:
+            master = store.series.get(master_id)
+        if master is not None:
+            return master
+
+    try:
+        return execute_calendar_request(calendar_service.events().get(
+            calendarId='primary', eventId=master_id, fields=EVENT_FIELDS
+        ))
+    except HttpError as e:
+        if e.resp.status in (404, 410):
+            return None
+        raise
+
+
+def get_series_updates(master: dict, instance: dict, updates: dict):
+    """Turn an edit of one occurrence into the same edit of its series.
+
+    A new start moves every occurrence by the same wall-clock offset, so
+    "move it to 9am" keeps each one on its own day.
+    """
+    series_updates = {field: value for field, value in updates.items() if field not in ('start', 'end')}
+    new_start = updates.get('start')
+    if not new_start:
+        return series_updates
+
+    old_start = instance.get('originalStartTime') or instance['start']
+    master_start = master['start']
+    master_end = master.get('end') or master_start
+    if not ('dateTime' in new_start) == ('dateTime' in old_start) == ('dateTime' in master_start):
+        # Timed <-> all-day: the series restarts from the new slot
+        series_updates['start'] = new_start
+        series_updates['end'] = updates.get('end') or dict(new_start)
+        return series_updates
+
+    if 'date' in new_start:
+        day = lambda value: datetime.datetime.strptime(value['date'], "%Y-%m-%d").date()
+        shift = day(new_start) - day(old_start)
+        series_updates['start'] = {"date": (day(master_start) + shift).isoformat()}
+        series_updates['end'] = {"date": (day(master_end) + shift).isoformat()}
+        return series_updates
+
+    tz_name = master_start.get('timeZone') or USER_TIMEZONE
+    tz = pytz.timezone(tz_name)
+
+    def wall_clock(value: dict):
+        dt = datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = pytz.timezone(value.get('timeZone') or USER_TIMEZONE).localize(dt)
+        return dt.astimezone(tz).replace(tzinfo=None)
+
+    shift = wall_clock(new_start) - wall_clock(old_start)
+    series_updates['start'] = {"dateTime": (wall_clock(master_start) + shift).isoformat(), "timeZone": tz_name}
+    series_updates['end'] = {"dateTime": (wall_clock(master_end) + shift).isoformat(), "timeZone": tz_name}
+    return series_updates
+
+
+def update_reminder_series(instance: dict, updates: dict):
+    """Apply an edit of one occurrence to its whole series. Same outcomes as update_calendar_event."""
+    master = get_series_master(instance)
+    if master is None:
+        return "not_found"
+    return update_calendar_event(master['id'], get_series_updates(master, instance, updates), master.get('etag'))
+
+
+def delete_reminder_series(instance: dict):
+    """Delete every occurrence of a repeating reminder. Same outcomes as delete_calendar_event."""
+    return delete_calendar_event(instance['recurringEventId'])
+
+
+# ---------------- CALENDAR BATCH ----------------
+# Bulk mutations go through the Calendar batch endpoint: up to
+# CALENDAR_BATCH_SIZE sub-requests per HTTP call, per-item results, and only
+# the sub-requests that failed with a transient error are retried.
+CALENDAR_BATCH_SIZE = max(1, min(int(os.getenv("CALENDAR_BATCH_SIZE", "50")), 1000))
+CALENDAR_BATCH_MAX_RETRIES = int(os.getenv("CALENDAR_BATCH_MAX_RETRIES", "3"))
+CALENDAR_RETRY_BACKOFF_BASE = float(os.getenv("CALENDAR_RETRY_BACKOFF_BASE", "1"))
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+
+
+def get_http_error_status(error):
+    """HTTP status of a Calendar API error, or None for transport errors"""
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return None
+
+
+def is_retryable_calendar_error(error):
+    """Transient failures worth retrying: rate limits, 5xx and network errors"""
+    status = get_http_error_status(error)
+    if status is None:
+        return True
+    if status == 403:
+        return is_rate_limit_error(error)
+    return status == 429 or status >= 500
+
+
+def execute_calendar_batch(operations: dict):
+    """Run many Calendar requests through batch HTTP calls.
+
+    operations maps an item key to a callable that builds a fresh HttpRequest.
+    Returns {key: {"ok": bool, "status": int|None, "response": dict|None, "error": str|None}}.
+    """
+    results = {}
+    pending = list(operations)
+
+    for attempt in range(CALENDAR_BATCH_MAX_RETRIES + 1):
+        retry = []
+
+        def handle_response(request_id, response, exception):
+            key = request_ids[request_id]
+            status = get_http_error_status(exception)
+            if exception is None:
+                calendar_rate_limiter.on_success()
+                results[key] = {"ok": True, "status": 200, "response": response, "error": None}
+            else:
+                if is_rate_limit_error(exception):
+                    calendar_rate_limiter.on_rate_limited(exception.resp.get("retry-after"), attempt)
+                results[key] = {"ok": False, "status": status, "response": None, "error": str(exception)}
+                if is_retryable_calendar_error(exception):
+                    retry.append(key)
+
+        for start in range(0, len(pending), CALENDAR_BATCH_SIZE):
+            chunk = pending[start:start + CALENDAR_BATCH_SIZE]
+            request_ids = {str(index): key for index, key in enumerate(chunk)}
+            batch = calendar_service.new_batch_http_request(callback=handle_response)
+            for request_id, key in request_ids.items():
+                batch.add(operations[key](), request_id=request_id)
+
+            # The shared budget pays per sub-request; the user's pays for the one HTTP call
+            calendar_rate_limiter.acquire(len(chunk), calendar_call_user.get(), calendar_call_priority.get(), user_cost=1)
+            try:
+                batch.execute(http=get_calendar_http())
+            except Exception as e:
+                # The whole batch call failed; every item in it is retryable
+                for key in chunk:
+                    if key not in results or not results[key]["ok"]:
+                        results[key] = {"ok": False, "status": get_http_error_status(e), "response": None, "error": str(e)}
+                        if key not in retry:
+                            retry.append(key)
+
+        if not retry or attempt == CALENDAR_BATCH_MAX_RETRIES:
+            break
+
+        delay = random.uniform(0, CALENDAR_RETRY_BACKOFF_BASE * (2 ** attempt))
+        logger.warning(f"⚠️  Retrying {len(retry)} failed calendar sub-request(s) in {delay:.1f}s")
+        time.sleep(delay)
+        pending = retry
+
+    return results
+
+
+def get_calendar_write_outcome(result, success: str):
+    """Map a batch result to success / "not_found" (404, 410) / "conflict" (412) / "failed" """
+    if not result:
+        return "failed"
+    if result["ok"]:
+        return success
+    if result["status"] in (404, 410):
+        return "not_found"
+    if result["status"] == 412:
+        return "conflict"
+    return "failed"
+
+
+def with_if_match(request, etag: str = None):
+    """Make a write conditional on the event still having the ETag we last saw"""
+    if etag:
+        request.headers['If-Match'] = etag
+    return request
+
+
+def delete_calendar_events(event_ids: list, etags: dict = None):
+    """Delete many events with batched requests.
+
+    etags optionally maps event IDs to the ETag we last saw, making each delete
+    conditional. Returns {event_id: "deleted" | "not_found" | "conflict" | "failed"}.
+    """
+    if not calendar_service:
+        logger.error("❌ Calendar service not available for deletion")
+        return {event_id: "failed" for event_id in event_ids}
+
+    etags = etags or {}
+    operations = {
+        event_id: lambda event_id=event_id: with_if_match(
+            calendar_service.events().delete(calendarId='primary', eventId=event_id),
+            etags.get(event_id)
+        )
+        for event_id in event_ids if event_id
+    }
+    results = execute_calendar_batch(operations)
+
+    outcomes = {event_id: get_calendar_write_outcome(results.get(event_id), "deleted") for event_id in event_ids}
+    for event_id, outcome in outcomes.items():
+        if outcome in ("conflict", "failed"):
+            error = results.get(event_id, {}).get("error", "no event ID")
+            logger.error(f"Error deleting calendar event {event_id} ({outcome}): {error}")
+    deleted = sum(1 for outcome in outcomes.values() if outcome in ("deleted", "not_found"))
+    logger.info(f"🗑️  Batch delete: {deleted}/{len(event_ids)} events deleted")
+
+    gone = [event_id for event_id, outcome in outcomes.items() if outcome in ("deleted", "not_found")]
+    forget_created_events(gone)
+    cancel_reminders(gone)
+    for event_id in gone:
+        # A single occurrence: the series keeps its reminder, minus this one
+        master_id, original_start = parse_instance_id(event_id)
+        if master_id:
+            set_occurrence_exception(master_id, original_start)
+    if 'primary' in event_stores:
+        event_stores['primary'].remove(gone)
+
+    return outcomes
+
+
+def get_patch_body(updates: dict):
+    """PATCH merges start/end key by key, so an edit switching between a timed and an
+    all-day reminder has to clear the other kind's keys or Calendar rejects the mix"""
+    body = dict(updates)
+    for key in ("start", "end"):
+        value = updates.get(key)
+        if not value:
+            continue
+        if "dateTime" in value:
+            body[key] = {"date": None, **value}
+        elif "date" in value:
+            body[key] = {"dateTime": None, "timeZone": None, **value}
+    return body
+
+
+def update_calendar_events(updates_by_id: dict, etags: dict = None):
+    """PATCH many events with batched requests, one round trip per batch.
+
+    etags optionally maps event IDs to the ETag we last saw, making each write
+    conditional. Returns {event_id: "updated" | "not_found" | "conflict" | "failed"}.
+    """
+    if not calendar_service:
+        return {event_id: "failed" for event_id in updates_by_id}
+
+    etags = etags or {}
+    operations = {
+        event_id: lambda event_id=event_id, updates=updates: with_if_match(
+            calendar_service.events().patch(calendarId='primary', eventId=event_id, body=get_patch_body(updates)),
+            etags.get(event_id)
+        )
+        for event_id, updates in updates_by_id.items()
+    }
+    results = execute_calendar_batch(operations)
+
+    outcomes = {event_id: get_calendar_write_outcome(results.get(event_id), "updated") for event_id in updates_by_id}
+    invalidate_event_cache()
+    for event_id, outcome in outcomes.items():
+        if outcome == "updated":
+            reschedule_reminder(results[event_id]["response"])
+        else:
+            logger.error(f"❌ Error updating calendar event {event_id} ({outcome}): {results[event_id]['error']}")
+
+    return outcomes
+
+
+# ---------------- RECURRENCE ENGINE ----------------
+# Expands a recurring event (the series master) into its instances locally, so
+# the event cache can store each series once instead of every instance Calendar
+# would send with singleEvents=True. Supports FREQ (HOURLY..YEARLY), INTERVAL,
+# COUNT, UNTIL, BYDAY (with ordinals for MONTHLY/YEARLY), BYMONTHDAY, BYMONTH,
+# WKST and EXDATE. Instances are generated lazily in start order, in the event's
+# own timezone so DST shifts keep the wall-clock time. Anything else raises
+# UnsupportedRecurrence and callers fall back to the Calendar instances API.
+RRULE_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+RRULE_FREQUENCIES = ("HOURLY", "DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+RRULE_MAX_EMPTY_PERIODS = 1000  # stop rules that can never match (e.g. February 30th)
+
+
+class UnsupportedRecurrence(ValueError):
+    """Recurrence the local engine does not expand"""
+
+
+def parse_rrule_value(value: str, tz):
+    """UNTIL/EXDATE value: an aware datetime, or a date for all-day values"""
+    if "T" not in value:
+        return datetime.datetime.strptime(value, "%Y%m%d").date()
+    dt = datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    return pytz.utc.localize(dt) if value.endswith("Z") else tz.localize(dt)
+
+
+def parse_rrule(value: str, tz):
+    parts = dict(part.split("=", 1) for part in value.split(";") if "=" in part)
+    freq = parts.pop("FREQ", None)
+    if freq not in RRULE_FREQUENCIES:
+        raise UnsupportedRecurrence(f"FREQ={freq}")
+
+    rule = {"freq": freq, "interval": int(parts.pop("INTERVAL", "1")), "count": None, "until": None,
+            "byday": [], "bymonthday": [], "bymonth": [], "wkst": 0}
+    if "COUNT" in parts:
+        rule["count"] = int(parts.pop("COUNT"))
+    if "UNTIL" in parts:
+        rule["until"] = parse_rrule_value(parts.pop("UNTIL"), tz)
+    for item in parts.pop("BYDAY", "").split(",") if "BYDAY" in parts else []:
+        match = re.fullmatch(r"([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)", item.strip())
+        if not match:
+            raise UnsupportedRecurrence(f"BYDAY={item}")
+        rule["byday"].append((int(match.group(1)) if match.group(1) else None, RRULE_WEEKDAYS[match.group(2)]))
+    if "BYMONTHDAY" in parts:
+        rule["bymonthday"] = [int(day) for day in parts.pop("BYMONTHDAY").split(",")]
+    if "BYMONTH" in parts:
+        rule["bymonth"] = [int(month) for month in parts.pop("BYMONTH").split(",")]
+    if "WKST" in parts:
+        wkst = parts.pop("WKST")
+        if wkst not in RRULE_WEEKDAYS:
+            raise UnsupportedRecurrence(f"WKST={wkst}")
+        rule["wkst"] = RRULE_WEEKDAYS[wkst]
+
+    ordinal_byday = any(n for n, _ in rule["byday"])
+    if parts:
+        raise UnsupportedRecurrence(", ".join(parts))
+    if rule["interval"] < 1:
+        raise UnsupportedRecurrence(f"INTERVAL={rule['interval']}")
+    if ordinal_byday and (freq not in ("MONTHLY", "YEARLY") or (freq == "YEARLY" and not rule["bymonth"])):
+        raise UnsupportedRecurrence("ordinal BYDAY")
+    return rule
+
+
+def parse_recurrence(lines: list, tz):
+    """Parse an event's recurrence lines (one RRULE plus optional EXDATEs)"""
+    rule = None
+    exdates = set()
+    for line in lines:
+        name, _, value = line.partition(":")
+        params = name.split(";")
+        kind = params[0].upper()
+        if kind == "RRULE" and rule is None:
+            rule = parse_rrule(value, tz)
+        elif kind == "EXDATE":
+            exdate_tz = tz
+            for param in params[1:]:
+                if param.upper().startswith("TZID="):
+                    exdate_tz = pytz.timezone(param[5:])
+            exdates.update(parse_rrule_value(item.strip(), exdate_tz) for item in value.split(","))
+        else:
+            raise UnsupportedRecurrence(kind)
+    if rule is None:
+        raise UnsupportedRecurrence("no RRULE")
+    rule["exdates"] = exdates
+    return rule
+
+
+def get_month_days(rule: dict, year: int, month: int, default_day: int):
+    """Days of a month selected by BYMONTHDAY/BYDAY, or default_day when neither is set"""
+    last_day = calendar.monthrange(year, month)[1]
+    days = None
+    if rule["bymonthday"]:
+        days = {day if day > 0 else last_day + 1 + day for day in rule["bymonthday"] if 1 <= abs(day) <= last_day}
+    if rule["byday"]:
+        first_weekday = calendar.weekday(year, month, 1)
+        weekday_days = set()
+        for n, weekday in rule["byday"]:
+            matching = list(range(1 + (weekday - first_weekday) % 7, last_day + 1, 7))
+            if n is None:
+                weekday_days.update(matching)
+            elif 1 <= abs(n) <= len(matching):
+                weekday_days.add(matching[n - 1] if n > 0 else matching[n])
+        days = weekday_days if days is None else days & weekday_days
+    if days is None:
+        days = {default_day} if default_day <= last_day else set()
+    return sorted(days)
+
+
+def get_first_period(rule: dict, dtstart: datetime.datetime, not_before: datetime.datetime):
+    """Skip whole periods that end before not_before (only valid without COUNT)"""
+    if rule["count"] is not None or not_before <= dtstart:
+        return 0
+    freq, interval = rule["freq"], rule["interval"]
+    if freq in ("HOURLY", "DAILY", "WEEKLY"):
+        unit = {"HOURLY": 3600, "DAILY": 86400, "WEEKLY": 7 * 86400}[freq]
+        periods = int((not_before - dtstart).total_seconds() // (unit * interval))
+    elif freq == "MONTHLY":
+        periods = ((not_before.year - dtstart.year) * 12 + not_before.month - dtstart.month) // interval
+    else:
+        periods = (not_before.year - dtstart.year) // interval
+    return max(0, periods - 1)
+
+
+def iter_rule_starts(rule: dict, dtstart: datetime.datetime, first_period: int = 0):
+    """Candidate wall-clock starts (naive) in order, before COUNT/UNTIL/EXDATE"""
+    freq, interval = rule["freq"], rule["interval"]
+    start_time = dtstart.time()
+    weekdays = {weekday for _, weekday in rule["byday"]}
+    if freq == "YEARLY":
+        months = rule["bymonth"] or (list(range(1, 13)) if rule["bymonthday"] or rule["byday"] else [dtstart.month])
+
+    empty_periods = 0
+    for period in itertools.count(first_period):
+        if freq == "HOURLY":
+            candidates = [dtstart + timedelta(hours=period * interval)]
+        elif freq == "DAILY":
+            candidates = [dtstart + timedelta(days=period * interval)]
+        elif freq == "WEEKLY":
+            # Weeks begin on WKST, which decides which weeks INTERVAL skips
+            week_offset = lambda weekday: (weekday - rule["wkst"]) % 7
+            week_start = dtstart.date() - timedelta(days=week_offset(dtstart.weekday())) + timedelta(weeks=period * interval)
+            candidates = [
+                datetime.datetime.combine(week_start + timedelta(days=week_offset(weekday)), start_time)
+                for weekday in sorted(weekdays or [dtstart.weekday()], key=week_offset)
+            ]
+        elif freq == "MONTHLY":
+            month_index = dtstart.month - 1 + period * interval
+            year, month = dtstart.year + month_index // 12, month_index % 12 + 1
+            candidates = [
+                datetime.datetime.combine(datetime.date(year, month, day), start_time)
+                for day in get_month_days(rule, year, month, dtstart.day)
+            ]
+        else:
+            year = dtstart.year + period * interval
+            candidates = [
+                datetime.datetime.combine(datetime.date(year, month, day), start_time)
+                for month in months
+                for day in get_month_days(rule, year, month, dtstart.day)
+            ]
+
+        found = False
+        for candidate in candidates:
+            if candidate < dtstart:
+                continue
+            # BYxxx parts finer than the frequency limit rather than expand
+            if freq in ("HOURLY", "DAILY") and weekdays and candidate.weekday() not in weekdays:
+                continue
+            if rule["bymonth"] and freq != "YEARLY" and candidate.month not in rule["bymonth"]:
+                continue
+            if rule["bymonthday"] and freq in ("HOURLY", "DAILY", "WEEKLY") and \
+                    candidate.day not in get_month_days({**rule, "byday": []}, candidate.year, candidate.month, 0):
+                continue
+            found = True
+            yield candidate
+
+        empty_periods = 0 if found else empty_periods + 1
+        if empty_periods > RRULE_MAX_EMPTY_PERIODS:
+            return
+
+
+def iter_recurring_instances(master: dict, not_before: datetime.datetime = None):
+    """Yield the instances of a recurring event in start order, shaped like
+    singleEvents=True results. not_before (aware) skips instances ending earlier."""
+    start_value = master["start"]
+    all_day = "date" in start_value
+    tz_name = start_value.get("timeZone") or USER_TIMEZONE
+    tz = pytz.timezone(tz_name)
+    rule = parse_recurrence(master.get("recurrence") or [], tz)
+
+    if all_day:
+        dtstart = datetime.datetime.strptime(start_value["date"], "%Y-%m-%d")
+        end_value = master.get("end") or {}
+        duration = (datetime.datetime.strptime(end_value["date"], "%Y-%m-%d") - dtstart) if "date" in end_value else timedelta(days=1)
+    else:
+        aware_start = datetime.datetime.fromisoformat(start_value["dateTime"].replace("Z", "+00:00"))
+        aware_start = tz.localize(aware_start) if aware_start.tzinfo is None else aware_start.astimezone(tz)
+        dtstart = aware_start.replace(tzinfo=None)
+        end_value = master.get("end") or start_value
+        aware_end = datetime.datetime.fromisoformat(end_value["dateTime"].replace("Z", "+00:00")) if "dateTime" in end_value else aware_start
+        duration = (aware_end if aware_end.tzinfo else tz.localize(aware_end)) - aware_start
+
+    first_period = 0
+    local_not_before = None
+    if not_before is not None:
+        local_not_before = not_before.astimezone(tz).replace(tzinfo=None) - duration
+        first_period = get_first_period(rule, dtstart, local_not_before)
+
+    until = rule["until"]
+    produced = 0
+    for local_start in iter_rule_starts(rule, dtstart, first_period):
+        produced += 1
+        if rule["count"] is not None and produced > rule["count"]:
+            return
+        if all_day:
+            day = local_start.date()
+            if until is not None and day > (until if not isinstance(until, datetime.datetime) else until.astimezone(tz).date()):
+                return
+            if day in rule["exdates"]:
+                continue
+            if local_not_before is not None and local_start < local_not_before:
+                continue
+            start = {"date": day.isoformat()}
+            end = {"date": (day + duration).isoformat()}
+            suffix = day.strftime("%Y%m%d")
+        else:
+            aware = tz.localize(local_start)
+            if until is not None and (aware > until if isinstance(until, datetime.datetime) else local_start.date() > until):
+                return
+            if aware in rule["exdates"]:
+                continue
+            if local_not_before is not None and local_start < local_not_before:
+                continue
+            start = {"dateTime": aware.isoformat(), "timeZone": tz_name}
+            end = {"dateTime": tz.normalize(aware + duration).isoformat(), "timeZone": tz_name}
+            suffix = aware.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+        yield {
+            "id": f"{master['id']}_{suffix}",
+            "status": "confirmed",
+            "summary": master.get("summary"),
+            "recurringEventId": master["id"],
+            "originalStartTime": start,
+            "start": start,
+            "end": end
+        }
+
+
+def expand_recurring_event(master: dict, time_min: datetime.datetime, time_max: datetime.datetime):
+    """Instances of a recurring event overlapping [time_min, time_max]"""
+    instances = []
+    for instance in iter_recurring_instances(master, not_before=time_min):
+        start, end = get_event_bounds(instance)
+        if start >= time_max.timestamp():
+            break
+        if end > time_min.timestamp() or start >= time_min.timestamp():
+            instances.append(instance)
+    return instances
+
+
+def get_start_key(value: dict):
+    """Comparable key for a start/originalStartTime value"""
+    if "dateTime" in value:
+        return datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")).timestamp()
+    return value.get("date")
+
+
+# ---------------- CALENDAR EVENT CACHE ----------------
+# A local copy of each calendar's events kept fresh with Calendar incremental
+# sync: one full sync, then list calls with the stored syncToken that only
+# return what changed. Recurring series are synced as a single master (plus any
+# moved or cancelled instances) and expanded by the RECURRENCE ENGINE at query
+# time. Date and range queries are answered from a start-time index, so hot
+# users list reminders without a network round trip. Our own inserts/updates
+# mark the store stale; deletes are applied directly.
+CALENDAR_CACHE_ENABLED = os.getenv("CALENDAR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CALENDAR_CACHE_SYNC_INTERVAL = float(os.getenv("CALENDAR_CACHE_SYNC_INTERVAL", "60"))
+CALENDAR_EXPANSION_CACHE_SIZE = int(os.getenv("CALENDAR_EXPANSION_CACHE_SIZE", "2048"))  # (series, window) expansions kept
+
+
+def get_event_bounds(event: dict):
+    """(start, end) of an event as epoch seconds; all-day dates use the user's timezone"""
+    tz = pytz.timezone(USER_TIMEZONE)
+
+    def to_timestamp(value: dict):
+        if 'dateTime' in value:
+            dt = datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+            if dt.tzinfo is None:
+                dt = pytz.timezone(value.get('timeZone') or USER_TIMEZONE).localize(dt)
+            return dt.timestamp()
+        return tz.localize(datetime.datetime.strptime(value['date'], "%Y-%m-%d")).timestamp()
+
+    start = to_timestamp(event['start'])
+    end = to_timestamp(event.get('end') or event['start'])
+    if 'date' in event['start'] and end <= start:
+        end = start + 86400
+    return start, max(start, end)
+
+
+class CalendarEventStore:
+    """In-memory, incrementally synced copy of one calendar's events"""
+
+    def __init__(self, calendar_id: str = 'primary'):
+        self.calendar_id = calendar_id
+        self.events = {}  # event ID -> single event or moved instance of a series
+        self.series = {}  # event ID -> recurring event master
+        self.exceptions = {}  # master ID -> start keys of instances that were moved or cancelled
+        self.expansions = OrderedDict()  # (master ID, etag, window) -> instances before exceptions, LRU
+        self.index = []  # sorted (start, end, event ID) over self.events
+        self.max_duration = 0.0
+        self.sync_token = None
+        self.last_sync = 0.0
+        self.stale = False
+        self.watched_until = 0.0  # expiry of a live push channel, see CALENDAR PUSH NOTIFICATIONS
+        self.lock = threading.RLock()
+        self.stats = {"queries": 0, "cache_hits": 0, "incremental_syncs": 0, "full_syncs": 0, "changes_applied": 0,
+                      "instances_expanded": 0, "instances_fetched": 0, "expansion_hits": 0}
+
+    def _rebuild_index(self):
+        self.index = []
+        self.max_duration = 0.0
+        for event_id, event in self.events.items():
+            try:
+                start, end = get_event_bounds(event)
+            except (KeyError, ValueError):
+                continue
+            self.index.append((start, end, event_id))
+            self.max_duration = max(self.max_duration, end - start)
+        self.index.sort()
+
+    def _fetch(self, sync_token=None):
+        """Page through events().list, returning (items, nextSyncToken)"""
+        items = []
+        page_token = None
+        while True:
+            params = {
+                "calendarId": self.calendar_id,
+                "maxResults": 2500,
+                "fields": EVENT_LIST_FIELDS
+            }
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+
+            result = execute_calendar_request(calendar_service.events().list(**params))
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken')
+
+    def _apply(self, event: dict):
+        """Apply one synced item (new, changed or cancelled)"""
+        event_id = event['id']
+        master_id = event.get('recurringEventId')
+        if master_id and event.get('originalStartTime'):
+            # A moved or cancelled instance: its original slot is no longer generated
+            self.exceptions.setdefault(master_id, set()).add(get_start_key(event['originalStartTime']))
+            if event.get('status') == 'cancelled':
+                self.events.pop(event_id, None)
+            else:
+                self.events[event_id] = event
+        elif event.get('status') == 'cancelled':
+            self.events.pop(event_id, None)
+            self._drop_series(event_id)
+        elif event.get('recurrence'):
+            self.series[event_id] = event
+            self.events.pop(event_id, None)
+        else:
+            self.events[event_id] = event
+            self.series.pop(event_id, None)
+
+    def _drop_series(self, master_id: str):
+        """Forget a series with its exceptions and moved instances; True if it was known"""
+        if self.series.pop(master_id, None) is None:
+            return False
+        self.exceptions.pop(master_id, None)
+        for moved_id in [i for i, e in self.events.items() if e.get('recurringEventId') == master_id]:
+            del self.events[moved_id]
+        return True
+
+    def _fetch_instances(self, master: dict, time_min: datetime.datetime, time_max: datetime.datetime):
+        """Server-side expansion for series the local engine does not support"""
+        result = execute_calendar_request(calendar_service.events().instances(
+            calendarId=self.calendar_id,
+            eventId=master['id'],
+            timeMin=time_min.isoformat(),
+            timeMax=time_max.isoformat(),
+            fields=f"items({EVENT_FIELDS})"
+        ))
+        self.stats["instances_fetched"] += 1
+        return result.get('items', [])
+
+    def _visible_instances(self, master: dict, instances: list):
+        """Drop moved or cancelled instances; moved ones are indexed on their own. Caller holds lock."""
+        skipped = self.exceptions.get(master['id'], ())
+        return [
+            instance for instance in instances
+            if instance['id'] not in self.events and get_start_key(instance['originalStartTime']) not in skipped
+        ]
+
+    def full_sync(self):
+        with self.lock:
+            items, sync_token = self._fetch()
+            self.events, self.series, self.exceptions = {}, {}, {}
+            self.expansions.clear()
+            for event in items:
+                self._apply(event)
+            self.sync_token = sync_token
+            self._rebuild_index()
+            self.last_sync = time.time()
+            self.stale = False
+            self.stats["full_syncs"] += 1
+            logger.info(f"📅 Event cache: full sync of {self.calendar_id} ({len(self.events)} events, {len(self.series)} series)")
+
+    def incremental_sync(self):
+        with self.lock:
+            if not self.sync_token:
+                return self.full_sync()
+
+            try:
+                items, sync_token = self._fetch(self.sync_token)
+            except HttpError as e:
+                if e.resp.status == 410:
+                    # Sync token expired: start over
+                    logger.info("📅 Event cache: sync token expired, running full sync")
+                    return self.full_sync()
+                raise
+
+            for event in items:
+                self._apply(event)
+            if items:
+                self._rebuild_index()
+
+            self.sync_token = sync_token or self.sync_token
+            self.last_sync = time.time()
+            self.stale = False
+            self.stats["incremental_syncs"] += 1
+            self.stats["changes_applied"] += len(items)
+
+    def ensure_fresh(self):
+        with self.lock:
+            if self.sync_token is None:
+                self.full_sync()
+            elif self.stale or (
+                # Push notifications mark the store stale, so only poll without a live channel
+                time.time() >= self.watched_until
+                and time.time() - self.last_sync > CALENDAR_CACHE_SYNC_INTERVAL
+            ):
+                self.incremental_sync()
+            else:
+                self.stats["cache_hits"] += 1
+
+    def query(self, time_min: datetime.datetime, time_max: datetime.datetime):
+        """Events overlapping [time_min, time_max], ordered by start time"""
+        with self.lock:
+            self.ensure_fresh()
+            self.stats["queries"] += 1
+
+            low, high = time_min.timestamp(), time_max.timestamp()
+            # Anything starting before low - max_duration cannot reach into the window
+            first = bisect.bisect_left(self.index, (low - self.max_duration,))
+            last = bisect.bisect_left(self.index, (high,))
+            events = [
+                self.events[event_id]
+                for start, end, event_id in self.index[first:last]
+                if end > low or start >= low
+            ]
+            if not self.series:
+                return events
+
+            # A series' instances only change with its etag; exceptions are applied per query
+            pending = []
+            for master in self.series.values():
+                key = (master['id'], master.get('etag'), low, high)
+                instances = self.expansions.get(key) if key[1] else None
+                if instances is None:
+                    pending.append((master, key))
+                    continue
+                self.expansions.move_to_end(key)
+                self.stats["expansion_hits"] += 1
+                events.extend(self._visible_instances(master, instances))
+
+        # Outside the lock, so a long series or an instances call doesn't hold up other queries
+        for master, key in pending:
+            try:
+                instances = expand_recurring_event(master, time_min, time_max)
+                expanded = len(instances)
+            except (UnsupportedRecurrence, KeyError, ValueError) as e:
+                logger.debug(f"Expanding {master['id']} on the server: {e}")
+                instances = self._fetch_instances(master, time_min, time_max)
+                expanded = 0
+            with self.lock:
+                self.stats["instances_expanded"] += expanded
+                if key[1] and CALENDAR_EXPANSION_CACHE_SIZE > 0:
+                    self.expansions[key] = instances
+                    while len(self.expansions) > CALENDAR_EXPANSION_CACHE_SIZE:
+                        self.expansions.popitem(last=False)
+                events.extend(self._visible_instances(master, instances))
+
+        events.sort(key=lambda event: get_event_bounds(event)[0])
+        return events
+
+    def invalidate(self):
+        """Force an incremental sync before the next query"""
+        self.stale = True
+
+    def remove(self, event_ids):
+        with self.lock:
+            reindex = unknown = False
+            for event_id in event_ids:
+                if self.events.pop(event_id, None) is not None:
+                    reindex = True
+                elif self._drop_series(event_id):
+                    reindex = True
+                else:
+                    unknown = True
+            if reindex:
+                self._rebuild_index()
+            if unknown:
+                # Generated instances are not stored; let the next sync bring their cancellation
+                self.stale = True
+
+    def metrics(self):
+        return {
+            "calendar_id": self.calendar_id,
+            "events": len(self.events),
+            "series": len(self.series),
+            "cached_expansions": len(self.expansions),
+            "synced": self.sync_token is not None,
+            "push_channel": time.time() < self.watched_until,
+            "seconds_since_sync": round(time.time() - self.last_sync, 1) if self.last_sync else None,
+            **self.stats
+        }
+
+
+event_stores = {}  # calendar ID -> CalendarEventStore
+event_stores_lock = threading.Lock()
+
+
+def get_event_store(calendar_id: str = 'primary'):
+    with event_stores_lock:
+        if calendar_id not in event_stores:
+            event_stores[calendar_id] = CalendarEventStore(calendar_id)
+        return event_stores[calendar_id]
+
+
+def invalidate_event_cache(calendar_id: str = 'primary'):
+    if calendar_id in event_stores:
+        event_stores[calendar_id].invalidate()
+
+
+def get_event_cache_metrics():
+    return {
+        "enabled": CALENDAR_CACHE_ENABLED,
+        "sync_interval_seconds": CALENDAR_CACHE_SYNC_INTERVAL,
+        "calendars": [store.metrics() for store in event_stores.values()]
+    }
+
+
+# ---------------- CALENDAR PUSH NOTIFICATIONS ----------------
+# Calendar events.watch channels POST to /calendar-notifications/ whenever a
+# watched calendar changes (including edits made in the Calendar UI). Each
+# notification marks that calendar's event store stale and kicks off a single
+# incremental sync. Channels expire, so a background task re-watches shortly
+# before expiry. Requires a public HTTPS address in CALENDAR_WEBHOOK_URL.
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL", "")
+CALENDAR_CHANNEL_TOKEN = os.getenv("CALENDAR_CHANNEL_TOKEN", VERIFY_TOKEN or "")
+CALENDAR_CHANNEL_TTL = int(os.getenv("CALENDAR_CHANNEL_TTL", "604800"))
+CALENDAR_CHANNEL_RENEW_MARGIN = float(os.getenv("CALENDAR_CHANNEL_RENEW_MARGIN", "3600"))
+CALENDAR_WATCHED_CALENDARS = [c.strip() for c in os.getenv("CALENDAR_WATCHED_CALENDARS", "primary").split(",") if c.strip()]
+
+calendar_channels = {}  # channel ID -> {"calendar_id", "resource_id", "expiration"}
+calendar_channel_task = None
+pending_calendar_syncs = set()  # calendar IDs with a notification-triggered sync in flight
+calendar_push_stats = {"notifications": 0, "syncs": 0, "sync_errors": 0, "renewals": 0, "rejected": 0}
+
+
+def watch_calendar(calendar_id: str):
+    """Open a push channel for a calendar and return its channel ID"""
+    channel_id = str(uuid.uuid4())
+    channel = execute_calendar_request(calendar_service.events().watch(
+        calendarId=calendar_id,
+        body={
+            "id": channel_id,
+            "type": "web_hook",
+            "address": CALENDAR_WEBHOOK_URL,
+            "token": CALENDAR_CHANNEL_TOKEN,
+            "params": {"ttl": str(CALENDAR_CHANNEL_TTL)}
+        }
+    ))
+    # expiration is reported in milliseconds since the epoch
+    expiration = int(channel.get("expiration", 0)) / 1000 or time.time() + CALENDAR_CHANNEL_TTL
+    calendar_channels[channel_id] = {
+        "calendar_id": calendar_id,
+        "resource_id": channel.get("resourceId"),
+        "expiration": expiration
     }
-    
-    for i, pattern in enumerate(month_patterns):
-        match = re.search(pattern, text_lower)
-        if match:
+    get_event_store(calendar_id).watched_until = expiration
+    logger.info(f"🔔 Watching calendar {calendar_id} (channel {channel_id[:8]}, expires in {(expiration - time.time()) / 3600:.1f}h)")
+    return channel_id
+
+
+def stop_calendar_channel(channel_id: str):
+    """Stop a push channel; errors are logged, the channel expires anyway"""
+    channel = calendar_channels.pop(channel_id, None)
+    if not channel:
+        return
+    try:
+        execute_calendar_request(calendar_service.channels().stop(
+            body={"id": channel_id, "resourceId": channel["resource_id"]}
+        ))
+    except Exception as e:
+        logger.warning(f"⚠️  Could not stop calendar channel {channel_id[:8]}: {str(e)}")
+
+
+async def sync_notified_calendar(calendar_id: str):
+    """Incremental sync of one calendar after a push notification"""
+    calendar_call_priority.set(CALENDAR_PRIORITY_BULK)
+    try:
+        await run_calendar_call(get_event_store(calendar_id).incremental_sync)
+        calendar_push_stats["syncs"] += 1
+    except Exception as e:
+        # The store stays stale, so the next query retries the sync
+        calendar_push_stats["sync_errors"] += 1
+        logger.error(f"❌ Calendar sync after notification failed for {calendar_id}: {str(e)}")
+    finally:
+        pending_calendar_syncs.discard(calendar_id)
+
+
+async def renew_calendar_channels():
+    """Re-watch calendars shortly before their channels expire"""
+    calendar_call_priority.set(CALENDAR_PRIORITY_BULK)
+    while True:
+        now = time.time()
+        due = [
+            channel_id for channel_id, channel in calendar_channels.items()
+            if channel["expiration"] - now <= CALENDAR_CHANNEL_RENEW_MARGIN
+        ]
+        for channel_id in due:
+            calendar_id = calendar_channels[channel_id]["calendar_id"]
             try:
-                groups = match.groups()
-                if i < 2:  # Month first
-                    month_name, day_str, year_str = groups
-                    day = int(day_str)
-                else:  # Day first
-                    day_str, month_name, year_str = groups
-                    day = int(day_str)
-                
-                month = month_map.get(month_name.lower())
-                year = int(year_str) if year_str else now.year
-                
-                if month and 1 <= day <= 31:
-                    # If no year specified and date has passed, use next year
-                    if not year_str:
-                        test_date = datetime.date(year, month, day)
-                        if test_date < now.date():
-                            year += 1
-                    
-                    test_date = datetime.date(year, month, day)
-                    return test_date.strftime("%Y-%m-%d")
-            except (ValueError, KeyError):
-                continue
-    
-    return None
+                # Open the new channel before stopping the old one so no change is missed
+                await run_calendar_call(watch_calendar, calendar_id)
+                await run_calendar_call(stop_calendar_channel, channel_id)
+                calendar_push_stats["renewals"] += 1
+            except Exception as e:
+                logger.error(f"❌ Could not renew calendar channel for {calendar_id}: {str(e)}")
 
-def get_week_range(text: str):
-    """Get start and end dates for week-based queries"""
-    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
-    
-    if 'this week' in text.lower():
-        # Start from Monday of current week
-        days_since_monday = now.weekday()
-        start_date = now - timedelta(days=days_since_monday)
-        end_date = start_date + timedelta(days=6)  # Sunday
-    elif 'next week' in text.lower():
-        # Start from Monday of next week
-        days_since_monday = now.weekday()
-        start_date = now - timedelta(days=days_since_monday) + timedelta(weeks=1)
-        end_date = start_date + timedelta(days=6)
-    elif 'last week' in text.lower():
-        # Start from Monday of last week
-        days_since_monday = now.weekday()
-        start_date = now - timedelta(days=days_since_monday) - timedelta(weeks=1)
-        end_date = start_date + timedelta(days=6)
-    else:
-        return None
-    
+        next_due = min((c["expiration"] for c in calendar_channels.values()), default=now + 3600)
+        await asyncio.sleep(min(max(next_due - CALENDAR_CHANNEL_RENEW_MARGIN - time.time(), 60), 3600))
+
+
+@app.post("/calendar-notifications/")
+async def receive_calendar_notification(request: Request):
+    """Google Calendar push notification receiver"""
+    channel_id = request.headers.get("X-Goog-Channel-ID", "")
+    channel = calendar_channels.get(channel_id)
+    if channel is None or request.headers.get("X-Goog-Channel-Token", "") != CALENDAR_CHANNEL_TOKEN:
+        calendar_push_stats["rejected"] += 1
+        raise HTTPException(status_code=404, detail="Unknown channel")
+
+    # "sync" is the handshake sent when a channel opens; nothing changed yet
+    if request.headers.get("X-Goog-Resource-State") == "sync":
+        return {"status": "ok"}
+
+    calendar_push_stats["notifications"] += 1
+    calendar_id = channel["calendar_id"]
+    get_event_store(calendar_id).invalidate()
+    if calendar_id not in pending_calendar_syncs:
+        # A burst of notifications collapses into one sync
+        pending_calendar_syncs.add(calendar_id)
+        asyncio.create_task(sync_notified_calendar(calendar_id))
+    return {"status": "ok"}
+
+
+def get_calendar_push_metrics():
+    now = time.time()
     return {
-        'start': start_date.strftime("%Y-%m-%d"),
-        'end': end_date.strftime("%Y-%m-%d"),
-        'type': 'week'
+        "enabled": bool(CALENDAR_WEBHOOK_URL),
+        "channels": [
+            {
+                "calendar_id": channel["calendar_id"],
+                "expires_in_seconds": round(channel["expiration"] - now)
+            }
+            for channel in calendar_channels.values()
+        ],
+        **calendar_push_stats
     }
 
-def get_month_range(text: str):
-    """Get start and end dates for month-based queries"""
+
+async def start_calendar_channels():
+    """Watch the configured calendars and start the renewal task"""
+    global calendar_channel_task
+
+    if not (CALENDAR_WEBHOOK_URL and CALENDAR_CACHE_ENABLED and calendar_service):
+        return
+
+    for calendar_id in CALENDAR_WATCHED_CALENDARS:
+        try:
+            await run_calendar_call(watch_calendar, calendar_id)
+        except Exception as e:
+            logger.error(f"❌ Could not watch calendar {calendar_id}, falling back to polling: {str(e)}")
+    calendar_channel_task = asyncio.create_task(renew_calendar_channels())
+
+
+async def stop_calendar_channels():
+    """Stop the renewal task and close open channels"""
+    global calendar_channel_task
+
+    if calendar_channel_task is not None:
+        calendar_channel_task.cancel()
+        await asyncio.gather(calendar_channel_task, return_exceptions=True)
+        calendar_channel_task = None
+
+    for channel_id in list(calendar_channels):
+        await run_calendar_call(stop_calendar_channel, channel_id)
+
+
+# ---------------- FAST-PATH PARSER ----------------
+# Most reminder requests are formulaic ("remind me to call mom tomorrow at 3pm").
+# A rule-based extractor built on parse_date_from_text handles those locally and
+# only inputs it isn't confident about are sent to Gemini.
+FAST_PATH_PARSER_ENABLED = os.getenv("FAST_PATH_PARSER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+WEEKDAY_PATTERN = '|'.join(WEEKDAY_NAMES)
+MONTH_PATTERN = ('january|february|march|april|may|june|july|august|september|october|november|december|'
+                 'jan|feb|mar|apr|jun|jul|aug|sept|sep|oct|nov|dec')
+
+TASK_PREFIX_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:(?:can|could) you\s+)?"
+    r"(?:remind me (?:to|about|that i (?:need|have) to)|remind me|set (?:a |an )?reminder (?:to|for)|"
+    r"reminder (?:to|for)|reminder:|don'?t (?:let me )?forget(?: to)?|i need to|i have to)\s+",
+    re.IGNORECASE
+)
+
+# (pattern, recurrence); named groups "weekday" and "dom" refine the rule
+RECURRENCE_PATTERNS = [
+    (r'\b(?:on\s+)?(?:the\s+)?(?P<dom>\d{1,2})(?:st|nd|rd|th)?\s+of\s+(?:every|each)\s+month\b', 'monthly'),
+    (r'\b(?:every|each)\s+(?P<weekday>' + WEEKDAY_PATTERN + r')\b', 'weekly'),
+    (r'\b(?:every\s*day|each day|daily)\b', 'daily'),
+    (r'\b(?:every|each)\s+week\b|\bweekly\b', 'weekly'),
+    (r'\b(?:every|each)\s+month\b|\bmonthly\b', 'monthly'),
+    (r'\b(?:every|each)\s+year\b|\byearly\b|\bannually\b', 'yearly'),
+    (r'\b(?:every|each)\s+hour\b|\bhourly\b', 'hourly'),
+]
+
+# Clock hours (1-12) that a day period puts after noon; "12 at night" is midnight
+# and "2 at night" is early morning, so night only covers 5-11
+DAY_PERIOD_PM_HOURS = {'morning': range(0), 'afternoon': range(1, 13), 'evening': range(1, 13), 'night': range(5, 12)}
+TIME_PATTERNS = [
+    r'\b(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>[0-5]\d))?\s*(?P<ampm>a\.?m\.?|p\.?m\.?)(?!\w)',
+    r'\b(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>[0-5]\d))?\s+(?:o\'?clock\s+)?(?:in the\s+|at\s+)(?P<period>morning|afternoon|evening|night)\b',
+    r'\b(?:at\s+)?(?P<hour>[01]?\d|2[0-3]):(?P<minute>[0-5]\d)\b',
+    r'\b(?:at\s+)?(?P<named>noon|midday|midnight)\b',
+]
+
+DATE_PHRASE_PATTERNS = [
+    r'\b(?:today|tonight|tomorrow)\b',
+    r'\b(?:(?:next|this|coming)\s+)?(?:' + WEEKDAY_PATTERN + r')\b',
+    r'\bin\s+\d{1,3}\s+days?\b',
+    r'\b(?:' + MONTH_PATTERN + r')\s+\d{1,2}(?:st|nd|rd|th)?(?:\s*,?\s*\d{4})?\b',
+    r'\b\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?(?:' + MONTH_PATTERN + r')(?:\s*,?\s*\d{4})?\b',
+    r'\b\d{4}-\d{1,2}-\d{1,2}\b',
+    r'\b\d{1,2}/\d{1,2}(?:/\d{4})?\b',
+]
+
+SKIP_TIME_PATTERN = r'\b(?:no time|all day|whole day|entire day|skip time|no specific time)\b'
+
+# Left-over words that mean the rules probably missed part of the meaning
+AMBIGUOUS_TASK_WORDS = {
+    'morning', 'afternoon', 'evening', 'night', 'tonight', 'noon', 'today', 'tomorrow', 'yesterday',
+    'week', 'weeks', 'weekend', 'weekday', 'weekdays', 'month', 'months', 'year', 'years',
+    'hour', 'hours', 'minute', 'minutes', 'next', 'last', 'after', 'before', 'until', 'till',
+    'later', 'soon', 'every', 'each', 'except', 'remind', 'reminder', 'reminders',
+    'am', 'pm', 'daily', 'weekly', 'monthly', 'yearly'
+} | set(WEEKDAY_NAMES) | set(MONTH_PATTERN.split('|')[:12]) - {'may'}
+CONNECTOR_WORDS = {'on', 'at', 'by', 'for', 'the', 'in', 'and', 'to', 'of', 'every', 'from'}
+MAX_FAST_PATH_TASK_WORDS = 10
+
+reminder_parser_stats = {"fast_path": 0, "gemini": 0, "edit_fast_path": 0, "edit_gemini": 0}
+
+
+def cut_span(text: str, match):
+    return text[:match.start()] + " " + text[match.end():]
+
+
+def parse_time_match(match):
+    """Turn a TIME_PATTERNS match into HH:MM, or None if it isn't a valid time"""
+    groups = match.groupdict()
+    if groups.get('named'):
+        return "00:00" if groups['named'].lower() == 'midnight' else "12:00"
+
+    hour = int(groups['hour'])
+    minute = int(groups.get('minute') or 0)
+    ampm = (groups.get('ampm') or '').lower().replace('.', '')
+    period = (groups.get('period') or '').lower()
+
+    if ampm or period:
+        if not 1 <= hour <= 12:
+            return None
+        pm = ampm == 'pm' or hour in DAY_PERIOD_PM_HOURS.get(period, ())
+        hour = hour % 12 + (12 if pm else 0)
+    elif hour > 23:
+        return None
+
+    return f"{hour:02d}:{minute:02d}"
+
+
+def first_occurrence_date(recurrence: str, time_value, weekday=None, day_of_month=None):
+    """Start date for a recurring reminder given without an explicit date"""
     now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
-    
-    if 'this month' in text.lower():
-        start_date = now.replace(day=1)
-        # Last day of current month
-        if now.month == 12:
-            end_date = now.replace(year=now.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            end_date = now.replace(month=now.month + 1, day=1) - timedelta(days=1)
-    elif 'next month' in text.lower():
-        if now.month == 12:
-            start_date = now.replace(year=now.year + 1, month=1, day=1)
-            end_date = start_date.replace(month=2, day=1) - timedelta(days=1)
-        else:
-            start_date = now.replace(month=now.month + 1, day=1)
-            if start_date.month == 12:
-                end_date = start_date.replace(year=start_date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_date = start_date.replace(month=start_date.month + 1, day=1) - timedelta(days=1)
-    elif 'last month' in text.lower():
-        if now.month == 1:
-            start_date = now.replace(year=now.year - 1, month=12, day=1)
-            end_date = now.replace(day=1) - timedelta(days=1)
-        else:
-            start_date = now.replace(month=now.month - 1, day=1)
-            end_date = now.replace(day=1) - timedelta(days=1)
-    else:
+    still_today = not time_value or time_value == "skip" or time_value > now.strftime("%H:%M")
+
+    if recurrence == 'weekly' and weekday:
+        days_ahead = (WEEKDAY_NAMES.index(weekday) - now.weekday()) % 7
+        if days_ahead == 0 and not still_today:
+            days_ahead = 7
+        return (now + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+
+    if recurrence == 'monthly' and day_of_month:
+        year, month = now.year, now.month
+        if day_of_month < now.day or (day_of_month == now.day and not still_today):
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        try:
+            return datetime.date(year, month, day_of_month).strftime("%Y-%m-%d")
+        except ValueError:
+            return None
+
+    if recurrence in ('daily', 'hourly'):
+        return (now if still_today else now + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    return None
+
+
+def extract_reminder_locally(user_input: str, existing_data=None):
+    """Rule-based reminder extraction. Returns the same structure as
+    extract_with_gemini, or None when the input isn't confidently understood."""
+    text = user_input.strip()
+    if not text or '?' in text:
         return None
-    
-    return {
-        'start': start_date.strftime("%Y-%m-%d"),
-        'end': end_date.strftime("%Y-%m-%d"),
-        'type': 'month'
-    }
 
-async def display_range_reminders(from_number: str, contact_name: str, reminders: list, date_range: dict):
-    """Display reminders for a date range (week/month)"""
-    range_type = date_range['type']
-    start_formatted = format_date_friendly(date_range['start'])
-    end_formatted = format_date_friendly(date_range['end'])
-    
-    if range_type == 'week':
-        title = f"📅 Your Reminders This Week"
-        subtitle = f"({start_formatted} to {end_formatted})"
-    else:  # month
-        title = f"📅 Your Reminders This Month"
-        subtitle = f"({start_formatted} to {end_formatted})"
-    
-    if not reminders:
-        msg = f"{title}\n\n"
-        msg += f"Hi {contact_name} 👋\n\n"
-        msg += f"You have no reminders scheduled for {subtitle.lower()}.\n\n"
-        msg += "Want to create some? Try:\n"
-        msg += "   • 'Remind me to call mom tomorrow at 3pm'\n"
-        msg += "   • 'Meeting every Monday at 10am'\n"
-        msg += "   • 'Doctor appointment next Friday'"
-        
-        await send_text(from_number, msg)
-        return
-    
-    # Group reminders by date
-    reminders_by_date = {}
-    for reminder in reminders:
-        start = reminder.get('start', {})
-        if 'dateTime' in start:
-            dt = datetime.datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
-            local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
-            date_key = local_dt.strftime("%Y-%m-%d")
-        elif 'date' in start:
-            date_key = start['date']
-        else:
-            date_key = "unknown"
-        
-        if date_key not in reminders_by_date:
-            reminders_by_date[date_key] = []
-        reminders_by_date[date_key].append(reminder)
-    
-    msg = f"{title}\n{subtitle}\n\n"
-    msg += f"Hi {contact_name} 👋, here are your scheduled reminders:\n\n"
-    
-    # Sort dates and display
-    sorted_dates = sorted(reminders_by_date.keys())
-    for date_key in sorted_dates:
-        if date_key == "unknown":
-            continue
-        
-        date_reminders = reminders_by_date[date_key]
-        friendly_date = format_date_friendly(date_key)
-        
-        msg += f"📆 {friendly_date}:\n"
-        for i, reminder in enumerate(date_reminders, 1):
-            time_str = format_event_datetime(reminder)
-            # Extract just the time part for cleaner display
-            if " at " in time_str:
-                time_part = time_str.split(" at ")[1]
-                msg += f"   {i}. {reminder['summary']} - {time_part}\n"
-            else:
-                msg += f"   {i}. {reminder['summary']} - {time_str}\n"
-        msg += "\n"
-    
-    msg += "💡 To manage specific reminders, try:\n"
-    msg += "   • 'Show reminders for [specific date]'\n"
-    msg += "   • 'List my reminders today'\n"
-    msg += "   • 'What do I have tomorrow'"
-    
-    await send_text(from_number, msg)
+    found = {"task": None, "date": None, "time": None, "recurrence": None, "day_of_week": None, "notes": None}
+    had_prefix = False
+    weekday = None
+    day_of_month = None
+
+    prefix = TASK_PREFIX_PATTERN.match(text)
+    if prefix:
+        had_prefix = True
+        text = text[prefix.end():]
+
+    match = re.search(SKIP_TIME_PATTERN, text, re.IGNORECASE)
+    if match:
+        found["time"] = "skip"
+        text = cut_span(text, match)
+
+    for pattern, recurrence in RECURRENCE_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            found["recurrence"] = recurrence
+            weekday = (match.groupdict().get('weekday') or '').lower() or None
+            if match.groupdict().get('dom'):
+                day_of_month = int(match.group('dom'))
+            text = cut_span(text, match)
+            break
+
+    if found["time"] is None:
+        for pattern in TIME_PATTERNS:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                found["time"] = parse_time_match(match)
+                if not found["time"]:
+                    return None
+                text = cut_span(text, match)
+                break
+
+    for pattern in DATE_PHRASE_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            phrase = match.group(0).lower().replace('tonight', 'today').replace(' of ', ' ')
+            found["date"] = parse_date_from_text(phrase)
+            if not found["date"]:
+                return None
+            text = cut_span(text, match)
+            break
+
+    # Whatever is left (minus dangling connectors) is the task
+    words = re.sub(r'[^\w\s\'-]', ' ', text).split()
+    while words and words[0].lower() in CONNECTOR_WORDS:
+        words.pop(0)
+    while words and words[-1].lower() in CONNECTOR_WORDS:
+        words.pop()
+    leftover = " ".join(words)
+
+    if leftover:
+        lowered = {word.lower() for word in words}
+        if (any(char.isdigit() for char in leftover) or lowered & AMBIGUOUS_TASK_WORDS
+                or len(words) > MAX_FAST_PATH_TASK_WORDS):
+            return None
+
+    understood_when = any(found[key] for key in ("date", "time", "recurrence"))
+    if existing_data:
+        # Clarification reply: either a bare date/time answer, or the missing task
+        if leftover and existing_data.get("task"):
+            return None
+        if not leftover and not understood_when:
+            return None
+    elif not leftover or not (understood_when or had_prefix):
+        return None
+
+    if leftover:
+        found["task"] = leftover[0].upper() + leftover[1:]
+
+    if weekday:
+        found["day_of_week"] = weekday.title()
+
+    if existing_data:
+        for key in found:
+            if found[key] is None and existing_data.get(key) is not None:
+                found[key] = existing_data[key]
+
+    if found["recurrence"] and not found["date"]:
+        found["date"] = first_occurrence_date(found["recurrence"], found["time"], weekday, day_of_month)
+        if day_of_month and not found["date"]:
+            return None
+
+    found["title"] = found.get("task") or "Reminder"
+    if found.get("recurrence") is None:
+        found["recurrence"] = "none"
+
+    return found
+
+
+async def extract_reminder(user_input: str, existing_data=None):
+    """Parse a reminder locally when possible, falling back to Gemini"""
+    if FAST_PATH_PARSER_ENABLED:
+        parsed = extract_reminder_locally(user_input, existing_data)
+        if parsed:
+            reminder_parser_stats["fast_path"] += 1
+            logger.info(f"⚡ Fast-path parsed reminder: {parsed.get('task', 'Unknown task')}")
+            logger.debug(f"📋 Full parsed data: {parsed}")
+            return parsed
+
+    reminder_parser_stats["gemini"] += 1
+    return await extract_with_gemini(user_input, existing_data)
+
+
+RENAME_EDIT_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:rename(?: it| this| the reminder)?|change (?:the |its )?(?:name|title|task|summary)|call it)"
+    r"\s+(?:to\s+|as\s+)?[\"']?(?P<name>.+?)[\"']?\s*$",
+    re.IGNORECASE
+)
+RECURRENCE_EDIT_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?(?:make it|set it to|change it to|repeat(?: it)?)\s+"
+    r"(?P<recurrence>daily|weekly|monthly|yearly|hourly|every day|every week|every month|every year|every hour)\s*$",
+    re.IGNORECASE
+)
+EDIT_FILLER_WORDS = {
+    'please', 'change', 'move', 'set', 'reschedule', 'make', 'update', 'shift', 'push', 'postpone',
+    'it', 'the', 'time', 'date', 'day', 'to', 'for', 'on', 'at', 'reminder', 'this', 'instead'
+}
+RECURRENCE_RULES = {
+    'daily': 'DAILY', 'every day': 'DAILY', 'weekly': 'WEEKLY', 'every week': 'WEEKLY',
+    'monthly': 'MONTHLY', 'every month': 'MONTHLY', 'yearly': 'YEARLY', 'every year': 'YEARLY',
+    'hourly': 'HOURLY', 'every hour': 'HOURLY'
+}
 
-def get_reminders_for_date(date_str: str):
-    """Get all calendar events for a specific date"""
-    if not calendar_service:
-        return []
-    
-    try:
-        # Convert date to start and end of day
-        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        tz = pytz.timezone(USER_TIMEZONE)
-        
-        start_of_day = tz.localize(date_obj.replace(hour=0, minute=0, second=0))
-        end_of_day = tz.localize(date_obj.replace(hour=23, minute=59, second=59))
-        
-        # Query calendar events
-        events_result = calendar_service.events().list(
-            calendarId='primary',
-            timeMin=start_of_day.isoformat(),
-            timeMax=end_of_day.isoformat(),
-            singleEvents=True,
-            orderBy='startTime',
-            maxResults=50
-        ).execute()
-        
-        events = events_result.get('items', [])
-        
-        # Filter to only include events that look like reminders
-        reminders = []
-        for event in events:
-            # Include events that have our typical reminder characteristics
-            # or any event that the user might want to manage
-            if event.get('summary'):
-                reminders.append(event)
-        
-        return reminders
-        
-    except Exception as e:
-        logger.error(f"Error fetching calendar events: {str(e)}")
-        return []
 
-def get_reminders_for_date_range(start_date: str, end_date: str):
-    """Get all calendar events for a date range (for weekly/monthly views)"""
-    if not calendar_service:
-        return []
-    
-    try:
-        start_obj = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-        end_obj = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-        tz = pytz.timezone(USER_TIMEZONE)
-        
-        start_of_period = tz.localize(start_obj.replace(hour=0, minute=0, second=0))
-        end_of_period = tz.localize(end_obj.replace(hour=23, minute=59, second=59))
-        
-        events_result = calendar_service.events().list(
-            calendarId='primary',
-            timeMin=start_of_period.isoformat(),
-            timeMax=end_of_period.isoformat(),
-            singleEvents=True,
-            orderBy='startTime',
-            maxResults=100
-        ).execute()
-        
-        return events_result.get('items', [])
-        
-    except Exception as e:
-        logger.error(f"Error fetching calendar events for range: {str(e)}")
-        return []
+def get_event_local_start(event: dict):
+    """Return (YYYY-MM-DD, HH:MM or None) for an event's start in the user's timezone"""
+    start = event.get('start', {})
+    if 'dateTime' in start:
+        dt = datetime.datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = pytz.timezone(start.get('timeZone') or USER_TIMEZONE).localize(dt)
+        local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
+        return local_dt.strftime("%Y-%m-%d"), local_dt.strftime("%H:%M")
+    return start.get('date'), None
 
-async def display_reminders_with_actions(from_number: str, contact_name: str, reminders: list, target_date: str):
-    """Display reminders with numbered options for management"""
-    formatted_date = format_date_friendly(target_date)
-    
-    msg = f"📅 Your Reminders for {formatted_date}\n\n"
-    msg += f"Hi {contact_name} 👋, here are your scheduled reminders:\n\n"
-    
-    for i, reminder in enumerate(reminders, 1):
-        msg += f"{i}. {reminder['summary']}\n"
-        msg += f"   ⏰ {format_event_datetime(reminder)}\n\n"
-    
-    msg += "\n\n\n🔧 Management Options:\n"
-    msg += f"   Reply with a number (1-{len(reminders)}) to edit or delete\n"
-    msg += f"   Reply 'cancel' to exit management mode\n\n"
-    msg += "What would you like to do with these reminders?"
-    
-    # Store management state - EXPLICITLY set mode to 'listing'
-    user_management_state[from_number] = {
-        'mode': 'listing',
-        'reminders': reminders,
-        'date': target_date
+
+def parse_edit_locally(edit_text: str, original_event: dict):
+    """Turn common edit commands into the updates dict update_calendar_event expects.
+    Returns None for anything free-form so the caller can ask Gemini."""
+    match = RENAME_EDIT_PATTERN.match(edit_text)
+    if match:
+        return {"summary": match.group('name').strip()}
+
+    match = RECURRENCE_EDIT_PATTERN.match(edit_text)
+    if match:
+        return {"recurrence": [f"RRULE:FREQ={RECURRENCE_RULES[match.group('recurrence').lower()]}"]}
+
+    text = edit_text
+    new_time = None
+    new_date = None
+
+    match = re.search(SKIP_TIME_PATTERN, text, re.IGNORECASE)
+    if match:
+        new_time = "skip"
+        text = cut_span(text, match)
+    else:
+        for pattern in TIME_PATTERNS:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                new_time = parse_time_match(match)
+                if not new_time:
+                    return None
+                text = cut_span(text, match)
+                break
+
+    for pattern in DATE_PHRASE_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            new_date = parse_date_from_text(match.group(0).lower().replace('tonight', 'today').replace(' of ', ' '))
+            if not new_date:
+                return None
+            text = cut_span(text, match)
+            break
+
+    if not new_time and not new_date:
+        return None
+
+    leftover = re.sub(r'[^\w\s]', ' ', text).lower().split()
+    if any(word not in EDIT_FILLER_WORDS for word in leftover):
+        return None
+
+    current_date, current_time = get_event_local_start(original_event)
+    target_date = new_date or current_date
+    target_time = current_time if new_time is None else new_time
+    if not target_date:
+        return None
+
+    if target_time and target_time != "skip":
+        start = {"dateTime": f"{target_date}T{target_time}:00", "timeZone": USER_TIMEZONE}
+    else:
+        start = {"date": target_date}
+
+    return {"start": start, "end": dict(start)}
+
+
+def get_reminder_parser_metrics():
+    """How often the local parser avoided a Gemini call"""
+    total = reminder_parser_stats["fast_path"] + reminder_parser_stats["gemini"]
+    return {
+        "enabled": FAST_PATH_PARSER_ENABLED,
+        "fast_path": reminder_parser_stats["fast_path"],
+        "gemini_fallback": reminder_parser_stats["gemini"],
+        "fast_path_hit_rate": round(reminder_parser_stats["fast_path"] / total, 3) if total else 0.0,
+        "edit_fast_path": reminder_parser_stats["edit_fast_path"],
+        "edit_gemini_fallback": reminder_parser_stats["edit_gemini"]
     }
-    
-    logger.info(f"Set management state for {from_number}: mode=listing, {len(reminders)} reminders")
-    
-    await send_text(from_number, msg)
 
-def format_date_friendly(date_str: str):
-    """Convert YYYY-MM-DD to friendly format"""
-    try:
-        date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        today = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).date()
-        
-        if date_obj.date() == today:
-            return "Today"
-        elif date_obj.date() == today + timedelta(days=1):
-            return "Tomorrow"
-        elif date_obj.date() == today - timedelta(days=1):
-            return "Yesterday"
-        else:
-            return date_obj.strftime("%A, %B %d, %Y")
-    except (ValueError, TypeError):
-        return date_str
 
-def format_event_datetime(event: dict):
-    """Format event datetime for display"""
-    try:
-        start = event.get('start', {})
-        if 'dateTime' in start:
-            # Timed event
-            dt = datetime.datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
-            local_dt = dt.astimezone(pytz.timezone(USER_TIMEZONE))
-            return f"{local_dt.strftime('%A, %B %d')} at {local_dt.strftime('%I:%M %p')}"
-        elif 'date' in start:
-            # All-day event
-            date_obj = datetime.datetime.strptime(start['date'], "%Y-%m-%d")
-            return f"{date_obj.strftime('%A, %B %d')} - All-day"
-        else:
-            return "Date/time not specified"
-    except Exception as e:
-        logger.error(f"Error formatting event datetime: {str(e)}")
-        return "Unable to parse date/time"
+# ---------------- GEMINI CLIENT ----------------
+# Gemini calls never block the event loop: by default they go through the SDK's
+# async API, or through a dedicated thread pool when GEMINI_USE_EXECUTOR is set.
+# A semaphore caps concurrent requests and every call has a timeout.
+GEMINI_MAX_CONCURRENCY = max(1, int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "20"))
+GEMINI_USE_EXECUTOR = os.getenv("GEMINI_USE_EXECUTOR", "false").lower() in ("1", "true", "yes")
 
-async def process_reminder_edit(edit_text: str, original_event: dict):
-    """Use Gemini to understand edit instructions and return updated event data"""
-    model = genai.GenerativeModel(MODEL_NAME)
-    date_context = get_current_date_context()
-    
-    # Extract current event details
-    current_summary = original_event.get('summary', '')
-    current_start = original_event.get('start', {})
-    
-    prompt = f"""
-You are helping to edit a calendar reminder. The user wants to modify an existing event.
+gemini_model = None
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+gemini_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini") if GEMINI_USE_EXECUTOR else None
+gemini_stats = {"calls": 0, "in_flight": 0, "timeouts": 0, "errors": 0, "total_seconds": 0.0}
 
-Current Event:
-- Summary: "{current_summary}"
-- Start: {json.dumps(current_start)}
 
-User's edit instruction: "{edit_text}"
+def setup_gemini():
+    """Import the Gemini SDK and create the model (the import alone takes about a second)"""
+    global gemini_model
 
-Context:
-- Today is {date_context['current_day']}, {date_context['current_date']}
-- Current time: {date_context['current_time']}
-- User timezone: {USER_TIMEZONE}
+    import google.generativeai as genai
 
-Return ONLY a JSON object with the fields that should be updated. Only include fields that are being changed.
+    genai.configure(api_key=GEMINI_API_KEY)
+    gemini_model = genai.GenerativeModel(MODEL_NAME)
 
-Possible fields to update:
-{{
-  "summary": "new task name",
-  "start": {{"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "{USER_TIMEZONE}"}},
-  "end": {{"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "{USER_TIMEZONE}"}},
-  "recurrence": ["RRULE:FREQ=DAILY"] // for recurring events
-}}
 
-For all-day events use:
-"start": {{"date": "YYYY-MM-DD"}}
-"end": {{"date": "YYYY-MM-DD"}}
+async def generate_gemini_content(prompt: str, generation_config: dict):
+    """Run a Gemini generate_content call without blocking the event loop"""
+    contents = [{"parts": [{"text": prompt}]}]
+    if gemini_model is None:
+        setup_gemini()
 
-Rules:
-1. Only include fields that are being changed
-2. If changing time, include both start and end
-3. For date changes: 'tomorrow' = {(datetime.datetime.now(pytz.timezone(USER_TIMEZONE)) + timedelta(days=1)).strftime("%Y-%m-%d")}
-4. Convert times to 24-hour format with timezone
-5. Return ONLY the JSON object, no explanation
-"""
+    async with gemini_semaphore:
+        gemini_stats["calls"] += 1
+        gemini_stats["in_flight"] += 1
+        started = time.time()
+        try:
+            if gemini_executor:
+                call = asyncio.get_running_loop().run_in_executor(
+                    gemini_executor,
+                    functools.partial(gemini_model.generate_content, contents=contents, generation_config=generation_config)
+                )
+            else:
+                call = gemini_model.generate_content_async(contents=contents, generation_config=generation_config)
+            return await asyncio.wait_for(call, timeout=GEMINI_TIMEOUT)
+        except asyncio.TimeoutError:
+            gemini_stats["timeouts"] += 1
+            raise
+        except Exception:
+            gemini_stats["errors"] += 1
+            raise
+        finally:
+            gemini_stats["in_flight"] -= 1
+            gemini_stats["total_seconds"] += time.time() - started
 
-    try:
-        resp = model.generate_content(
-            contents=[{"parts": [{"text": prompt}]}],
-            generation_config={
-                "max_output_tokens": 300,
-                "temperature": 0.1,
-                "top_p": 0.95
-            }
-        )
 
-        if not resp.candidates or not resp.candidates[0].content.parts:
-            return None
+def get_gemini_metrics():
+    """Gemini call volume, latency and concurrency"""
+    return {
+        "mode": "executor" if gemini_executor else "async",
+        "max_concurrency": GEMINI_MAX_CONCURRENCY,
+        "timeout_seconds": GEMINI_TIMEOUT,
+        "calls": gemini_stats["calls"],
+        "in_flight": gemini_stats["in_flight"],
+        "timeouts": gemini_stats["timeouts"],
+        "errors": gemini_stats["errors"],
+        "avg_latency_seconds": round(gemini_stats["total_seconds"] / gemini_stats["calls"], 3) if gemini_stats["calls"] else 0.0
+    }
 
-        text = resp.candidates[0].content.parts[0].text.strip()
-        
-        # Clean markdown formatting
-        text = re.sub(r'^```json\s*', '', text)
-        text = re.sub(r'^```\s*', '', text)
-        text = re.sub(r'\s*```$', '', text)
-        text = text.strip()
 
-        # Parse JSON
-        updates = json.loads(text)
-        
-        # Validate and format the updates
-        if 'start' in updates and 'end' not in updates:
-            # If start time is updated, update end time too
-            start_data = updates['start']
-            if 'dateTime' in start_data:
-                # For timed events, make end time same as start (reminder duration = 0)
-                updates['end'] = start_data.copy()
-            elif 'date' in start_data:
-                # For all-day events, end date should be same as start date
-                updates['end'] = start_data.copy()
-        
-        logger.info(f"Processed edit: {updates}")
-        return updates
+# ---------------- GEMINI RESPONSE CACHE ----------------
+# Parsed reminders keyed on the normalized input, any clarification state and
+# today's date: relative dates ("tomorrow", "next friday") and inputs without a
+# date (which default to today) both resolve against it, so entries also expire
+# at the user's local midnight. Inputs that depend on the clock ("in 2 hours")
+# are never cached.
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "2000"))
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "21600"))
 
-    except (json.JSONDecodeError, Exception) as e:
-        logger.error(f"Error processing reminder edit: {str(e)}")
+CLOCK_RELATIVE_PATTERN = re.compile(r'\b(?:now|hours?|minutes?|mins?|later|soon|ago)\b')
+
+gemini_cache = OrderedDict()  # key -> (expires_at, parsed reminder)
+gemini_cache_stats = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0, "uncacheable": 0}
+
+
+def get_gemini_cache_key(user_input: str, existing_data=None):
+    """Return (key, expires_at) for an input, or (None, None) if it must not be cached"""
+    normalized = re.sub(r'\s+', ' ', user_input.lower()).strip().rstrip('.!')
+    if CLOCK_RELATIVE_PATTERN.search(normalized):
+        return None, None
+
+    existing = json.dumps(existing_data, sort_keys=True) if existing_data else ""
+    now = datetime.datetime.now(pytz.timezone(USER_TIMEZONE))
+    midnight = pytz.timezone(USER_TIMEZONE).localize(
+        datetime.datetime.combine(now.date() + timedelta(days=1), datetime.time())
+    )
+    ttl = min(GEMINI_CACHE_TTL, (midnight - now).total_seconds())
+    return (normalized, existing, now.strftime("%Y-%m-%d")), time.time() + ttl
+
+
+def gemini_cache_get(key):
+    if key is None:
+        gemini_cache_stats["uncacheable"] += 1
         return None
 
-def update_calendar_event(event_id: str, updates: dict):
-    """Update a calendar event with new data"""
-    if not calendar_service:
-        return False
-    
-    try:
-        # First get the current event
-        current_event = calendar_service.events().get(
-            calendarId='primary',
-            eventId=event_id
-        ).execute()
-        
-        # Apply updates to the current event
-        for key, value in updates.items():
-            current_event[key] = value
-        
-        # Update the event
-        updated_event = calendar_service.events().update(
-            calendarId='primary',
-            eventId=event_id,
-            body=current_event
-        ).execute()
-        
-        logger.info(f"✅ Calendar event updated successfully: {event_id}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Error updating calendar event: {str(e)}")
-        return False
+    entry = gemini_cache.get(key)
+    if entry is None:
+        gemini_cache_stats["misses"] += 1
+        return None
 
-def delete_calendar_event(event_id: str):
-    """Delete a calendar event"""
-    if not calendar_service:
-        logger.error("❌ Calendar service not available for deletion")
-        return False
-    
-    if not event_id:
-        logger.error("No event ID provided for deletion")
-        return False
-    
-    try:
-        logger.info(f"Attempting to delete calendar event with ID: {event_id}")
-        
-        # First check if the event exists
-        try:
-            calendar_service.events().get(
-                calendarId='primary',
-                eventId=event_id
-            ).execute()
-            logger.info(f"Event {event_id} exists, proceeding with deletion")
-        except Exception as e:
-            logger.error(f"Event {event_id} not found or not accessible: {str(e)}")
-            return False
-        
-        # Delete the event
-        calendar_service.events().delete(
-            calendarId='primary',
-            eventId=event_id
-        ).execute()
-        
-        logger.info(f"Event deleted successfully: {event_id}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error deleting calendar event {event_id}: {str(e)}")
-        return False
+    expires_at, parsed = entry
+    if expires_at <= time.time():
+        del gemini_cache[key]
+        gemini_cache_stats["expired"] += 1
+        gemini_cache_stats["misses"] += 1
+        return None
+
+    gemini_cache.move_to_end(key)
+    gemini_cache_stats["hits"] += 1
+    return dict(parsed)
+
+
+def gemini_cache_put(key, expires_at, parsed: dict):
+    if key is None:
+        return
+
+    gemini_cache[key] = (expires_at, dict(parsed))
+    gemini_cache.move_to_end(key)
+    while len(gemini_cache) > GEMINI_CACHE_MAX_ENTRIES:
+        gemini_cache.popitem(last=False)
+        gemini_cache_stats["evicted"] += 1
+
+
+def get_gemini_cache_metrics():
+    """Size and hit rate of the parsed-reminder cache"""
+    lookups = gemini_cache_stats["hits"] + gemini_cache_stats["misses"]
+    return {
+        "size": len(gemini_cache),
+        "max_entries": GEMINI_CACHE_MAX_ENTRIES,
+        "hit_rate": round(gemini_cache_stats["hits"] / lookups, 3) if lookups else 0.0,
+        **gemini_cache_stats
+    }
 
 
 # ---------------- ADVANCED GEMINI PARSER ----------------
@@ -1326,7 +4111,12 @@ def get_current_date_context():
 
 async def extract_with_gemini(user_input: str, existing_data=None):
     """Extract structured reminder JSON from user input using advanced Gemini processing"""
-    model = genai.GenerativeModel(MODEL_NAME)
+    cache_key, cache_expires_at = get_gemini_cache_key(user_input, existing_data)
+    cached = gemini_cache_get(cache_key)
+    if cached:
+        logger.info(f"✅ Cached parse for reminder: {cached.get('task', 'Unknown task')}")
+        return cached
+
     date_context = get_current_date_context()
 
     # Check if user is declining to provide time
@@ -1376,8 +4166,8 @@ Rules:
 
     try:
         logger.debug(f"🧠 Sending request to Gemini AI...")
-        resp = model.generate_content(
-            contents=[{"parts": [{"text": prompt}]}],
+        resp = await generate_gemini_content(
+            prompt,
             generation_config={
                 "max_output_tokens": 500,
                 "temperature": 0.1,
@@ -1448,11 +4238,15 @@ Rules:
         
         logger.info(f"✅ Successfully parsed reminder: {parsed.get('task', 'Unknown task')}")
         logger.debug(f"📋 Full parsed data: {parsed}")
+        gemini_cache_put(cache_key, cache_expires_at, parsed)
         return parsed
 
     except json.JSONDecodeError as e:
         logger.error(f"❌ JSON parsing error: {str(e)}")
         return None
+    except asyncio.TimeoutError:
+        logger.error(f"❌ Gemini request timed out after {GEMINI_TIMEOUT:g}s")
+        return None
     except Exception as e:
         logger.error(f"❌ Gemini parsing failed: {str(e)}")
         return None
@@ -1501,88 +4295,121 @@ def generate_clarification_question(missing_info):
 
 
 # ---------------- GOOGLE CALENDAR ----------------
-def create_calendar_event(structured: dict):
-    if not calendar_service:
-        return "Calendar not configured"
-
-    try:
-        # Get task name from either 'task' or 'title' field
-        task_name = structured.get("task") or structured.get("title") or "Reminder"
-        
-        # Build event summary
+def build_calendar_event(structured: dict):
+    """Calendar event body for a parsed reminder"""
+    # Get task name from either 'task' or 'title' field
+    task_name = structured.get("task") or structured.get("title") or "Reminder"
+    
+    # Build event summary
+    time_value = structured.get("time")
+    if time_value and time_value != "skip":
+        summary = f"{task_name} at {time_value}"
+    else:
+        summary = task_name
+    
+    # Create base event
+    event = {
+        "summary": summary,
+    }
+    
+    # Handle date and time
+    if structured.get("date"):
         time_value = structured.get("time")
         if time_value and time_value != "skip":
-            summary = f"{task_name} at {time_value}"
-        else:
-            summary = task_name
-        
-        # Create base event
-        event = {
-            "summary": summary,
-        }
-        
-        # Handle date and time
-        if structured.get("date"):
-            time_value = structured.get("time")
-            if time_value and time_value != "skip":
-                # Specific date and time
-                start_datetime = f"{structured['date']}T{time_value}:00"
-                end_datetime = f"{structured['date']}T{time_value}:00"
-                
-                event.update({
-                    "start": {
-                        "dateTime": start_datetime,
-                        "timeZone": USER_TIMEZONE
-                    },
-                    "end": {
-                        "dateTime": end_datetime,
-                        "timeZone": USER_TIMEZONE
-                    }
-                })
-            else:
-                # All-day event (time is None or "skip")
-                event.update({
-                    "start": {"date": structured["date"]},
-                    "end": {"date": structured["date"]}
-                })
+            # Specific date and time
+            start_datetime = f"{structured['date']}T{time_value}:00"
+            end_datetime = f"{structured['date']}T{time_value}:00"
+            
+            event.update({
+                "start": {
+                    "dateTime": start_datetime,
+                    "timeZone": USER_TIMEZONE
+                },
+                "end": {
+                    "dateTime": end_datetime,
+                    "timeZone": USER_TIMEZONE
+                }
+            })
         else:
-            # No specific date, use today as all-day event
-            today = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d")
+            # All-day event (time is None or "skip")
             event.update({
-                "start": {"date": today},
-                "end": {"date": today}
+                "start": {"date": structured["date"]},
+                "end": {"date": structured["date"]}
             })
+    else:
+        # No specific date, use today as all-day event
+        today = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d")
+        event.update({
+            "start": {"date": today},
+            "end": {"date": today}
+        })
 
-        # Handle recurrence
-        recurrence_value = structured.get("recurrence")
-        if recurrence_value and recurrence_value != "none":
-            if recurrence_value == "yearly":
-                event["recurrence"] = ["RRULE:FREQ=YEARLY"]
-            elif recurrence_value == "monthly":
-                event["recurrence"] = ["RRULE:FREQ=MONTHLY"]
-            elif recurrence_value == "weekly":
-                event["recurrence"] = ["RRULE:FREQ=WEEKLY"]
-            elif recurrence_value == "daily":
-                event["recurrence"] = ["RRULE:FREQ=DAILY"]
-            elif recurrence_value == "hourly":
-                event["recurrence"] = ["RRULE:FREQ=HOURLY"]
-
-        # Add notes if available
-        notes = []
-        if structured.get("notes"):
-            notes.append(f"Notes: {structured['notes']}")
-        if structured.get("day_of_week"):
-            notes.append(f"Preferred day: {structured['day_of_week']}")
-        
-        if notes:
-            event["description"] = "\n".join(notes)
+    # Handle recurrence
+    recurrence_value = structured.get("recurrence")
+    if recurrence_value and recurrence_value != "none":
+        if recurrence_value == "yearly":
+            event["recurrence"] = ["RRULE:FREQ=YEARLY"]
+        elif recurrence_value == "monthly":
+            event["recurrence"] = ["RRULE:FREQ=MONTHLY"]
+        elif recurrence_value == "weekly":
+            event["recurrence"] = ["RRULE:FREQ=WEEKLY"]
+        elif recurrence_value == "daily":
+            event["recurrence"] = ["RRULE:FREQ=DAILY"]
+        elif recurrence_value == "hourly":
+            event["recurrence"] = ["RRULE:FREQ=HOURLY"]
+
+    # Add notes if available
+    notes = []
+    if structured.get("notes"):
+        notes.append(f"Notes: {structured['notes']}")
+    if structured.get("day_of_week"):
+        notes.append(f"Preferred day: {structured['day_of_week']}")
+    
+    if notes:
+        event["description"] = "\n".join(notes)
+
+    return event
+
+
+def insert_calendar_event(structured: dict, owner: str = ""):
+    """Insert a reminder into Google Calendar and return the created event; raises on failure.
+
+    The event ID is derived from the reminder, so a retried or redelivered
+    insert lands on the same event instead of creating a duplicate.
+    """
+    event = build_calendar_event(structured)
+    event["id"] = get_reminder_event_id(owner, structured, event)
+
+    known = get_created_event(event["id"])
+    if known is not None:
+        logger.info(f"♻️  Skipping duplicate insert of event {event['id'][:12]}")
+        return known
 
-        # Create the event
-        logger.debug(f"📝 Creating calendar event: {event}")
-        event_result = calendar_service.events().insert(
+    logger.debug(f"📝 Creating calendar event: {event}")
+    try:
+        event_result = execute_calendar_request(calendar_service.events().insert(
             calendarId="primary", body=event
-        ).execute()
+        ))
+    except HttpError as e:
+        if e.resp.status != 409:
+            raise
+        # The ID is taken: an earlier attempt already created it
+        event_result = recover_existing_event(event)
+
+    invalidate_event_cache()
+    remember_created_event(event_result)
+    if owner:
+        schedule_event_reminder(event_result, owner)
+    return event_result
+
+
+def create_calendar_event(structured: dict, owner: str = ""):
+    if not calendar_service:
+        return "Calendar not configured"
 
+    try:
+        event_result = insert_calendar_event(structured, owner)
+        task_name = structured.get("task") or structured.get("title") or "Reminder"
         event_link = event_result.get("htmlLink", "Event created but no link available")
         logger.info(f"✅ Calendar event created successfully: {task_name}")
         return event_link
@@ -1592,11 +4419,900 @@ def create_calendar_event(structured: dict):
         return "Failed to create event"
 
 
+# ---------------- IDEMPOTENT INSERTS ----------------
+# Every reminder gets a deterministic event ID: a hash of (user, normalized task,
+# start, recurrence). Hex digits are valid Calendar IDs (base32hex), so retries
+# reuse the same ID and Calendar rejects the copy with 409, which counts as
+# success. IDs we created recently are remembered so known duplicates skip the
+# network call entirely.
+CREATED_EVENT_INDEX_MAX_ENTRIES = int(os.getenv("CREATED_EVENT_INDEX_MAX_ENTRIES", "5000"))
+CREATED_EVENT_INDEX_TTL = float(os.getenv("CREATED_EVENT_INDEX_TTL", "86400"))
+
+created_event_index = OrderedDict()  # event ID -> (expires_at, event)
+created_event_index_lock = threading.Lock()
+idempotent_insert_stats = {"index_hits": 0, "conflicts": 0, "restored": 0}
+
+
+def get_reminder_event_id(owner: str, structured: dict, event: dict):
+    """Keyed on the start and recurrence in the event body, i.e. what Calendar actually gets
+    (a reminder without a date falls back to today there)"""
+    task = structured.get("task") or structured.get("title") or "Reminder"
+    normalized_task = " ".join(re.sub(r"[^\w\s]", " ", task.lower()).split())
+    start = event["start"].get("dateTime") or event["start"]["date"]
+    recurrence = ",".join(event.get("recurrence") or []) or "none"
+    key = "|".join([owner, normalized_task, start, recurrence])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get_created_event(event_id: str):
+    with created_event_index_lock:
+        entry = created_event_index.get(event_id)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del created_event_index[event_id]
+            return None
+        idempotent_insert_stats["index_hits"] += 1
+        return entry[1]
+
+
+def remember_created_event(event: dict):
+    with created_event_index_lock:
+        created_event_index[event["id"]] = (time.time() + CREATED_EVENT_INDEX_TTL, event)
+        created_event_index.move_to_end(event["id"])
+        while len(created_event_index) > CREATED_EVENT_INDEX_MAX_ENTRIES:
+            created_event_index.popitem(last=False)
+
+
+def forget_created_events(event_ids):
+    """Deleted events may be created again"""
+    with created_event_index_lock:
+        for event_id in event_ids:
+            created_event_index.pop(event_id, None)
+
+
+def recover_existing_event(event: dict):
+    """Resolve a 409 on insert: return the existing event, restoring it if it was deleted"""
+    idempotent_insert_stats["conflicts"] += 1
+    existing = execute_calendar_request(calendar_service.events().get(calendarId="primary", eventId=event["id"]))
+    if existing.get("status") != "cancelled":
+        return existing
+
+    # Deleted events keep their ID, so re-creating the same reminder means undeleting it
+    idempotent_insert_stats["restored"] += 1
+    return execute_calendar_request(calendar_service.events().update(
+        calendarId="primary", eventId=event["id"], body={**event, "status": "confirmed"}
+    ))
+
+
+def get_idempotent_insert_metrics():
+    return {"indexed_ids": len(created_event_index), **idempotent_insert_stats}
+
+
+# ---------------- CALENDAR WRITE-BEHIND ----------------
+# New reminders are written to a local journal and acknowledged immediately;
+# background workers insert them into Google Calendar, retrying transient
+# errors with backoff. The user only hears back if the insert fails for good.
+# The journal (CALENDAR_PENDING_FILE) survives restarts and is replayed on boot.
+CALENDAR_WRITE_BEHIND = os.getenv("CALENDAR_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+CALENDAR_INSERT_WORKERS = max(1, int(os.getenv("CALENDAR_INSERT_WORKERS", "2")))
+CALENDAR_INSERT_MAX_ATTEMPTS = max(1, int(os.getenv("CALENDAR_INSERT_MAX_ATTEMPTS", "5")))
+CALENDAR_PENDING_FILE = os.getenv("CALENDAR_PENDING_FILE", "pending_events.json")
+
+calendar_insert_queue = None
+calendar_insert_tasks = []
+pending_calendar_inserts = {}  # write ID -> record, mirrored to CALENDAR_PENDING_FILE
+pending_calendar_inserts_lock = threading.Lock()
+recent_calendar_inserts = deque(maxlen=100)  # completed records with their htmlLink
+calendar_insert_stats = {"queued": 0, "inserted": 0, "retried": 0, "failed": 0}
+
+
+def persist_pending_calendar_inserts():
+    """Write a snapshot of the pending journal; the lock keeps snapshots in order"""
+    with pending_calendar_inserts_lock:
+        data = json.dumps(list(pending_calendar_inserts.values()), ensure_ascii=False).encode()
+        write_file_atomically(CALENDAR_PENDING_FILE, data)
+
+
+def load_pending_calendar_inserts():
+    if not os.path.exists(CALENDAR_PENDING_FILE):
+        return []
+    try:
+        with open(CALENDAR_PENDING_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Could not read pending calendar inserts: {e}")
+        return []
+
+
+async def save_pending_calendar_inserts():
+    await asyncio.get_running_loop().run_in_executor(None, persist_pending_calendar_inserts)
+
+
+async def enqueue_calendar_insert(from_number: str, contact_name: str, structured: dict):
+    """Record a reminder for background insertion; returns once it is on disk"""
+    record = {
+        "id": uuid.uuid4().hex,
+        "to": from_number,
+        "contact_name": contact_name,
+        "structured": structured,
+        "attempts": 0,
+        "created_at": time.time()
+    }
+    pending_calendar_inserts[record["id"]] = record
+    await save_pending_calendar_inserts()
+    calendar_insert_stats["queued"] += 1
+    calendar_insert_queue.put_nowait(record["id"])
+    return record["id"]
+
+
+async def notify_calendar_insert_failed(record: dict, error: str):
+    task_name = record["structured"].get("task") or record["structured"].get("title") or "your reminder"
+    msg = f"Hi {record['contact_name']}.\n\n"
+    msg += f"⚠️ I couldn't add \"{task_name}\" to Google Calendar, so it was not saved.\n\n"
+    msg += "Please send the reminder again in a moment."
+    logger.error(f"❌ Giving up on calendar insert for {task_name}: {error}")
+    await send_text(record["to"], msg)
+
+
+async def process_calendar_insert(write_id: str):
+    record = pending_calendar_inserts.get(write_id)
+    if record is None:
+        return
+
+    record["attempts"] += 1
+    calendar_call_user.set(record["to"])
+    try:
+        event_result = await run_calendar_call(insert_calendar_event, record["structured"], record["to"])
+    except Exception as e:
+        if is_retryable_calendar_error(e) and record["attempts"] < CALENDAR_INSERT_MAX_ATTEMPTS:
+            calendar_insert_stats["retried"] += 1
+            delay = random.uniform(0, CALENDAR_RETRY_BACKOFF_BASE * (2 ** record["attempts"]))
+            logger.warning(f"⚠️  Calendar insert failed (attempt {record['attempts']}), retrying in {delay:.1f}s: {str(e)}")
+            await save_pending_calendar_inserts()
+            asyncio.get_running_loop().call_later(delay, calendar_insert_queue.put_nowait, write_id)
+            return
+
+        calendar_insert_stats["failed"] += 1
+        pending_calendar_inserts.pop(write_id, None)
+        await save_pending_calendar_inserts()
+        await notify_calendar_insert_failed(record, str(e))
+        return
+
+    calendar_insert_stats["inserted"] += 1
+    record["event_id"] = event_result.get("id")
+    record["html_link"] = event_result.get("htmlLink")
+    pending_calendar_inserts.pop(write_id, None)
+    recent_calendar_inserts.append(record)
+    await save_pending_calendar_inserts()
+    logger.info(f"📅 Calendar event created: {record['html_link']}")
+
+
+async def calendar_insert_worker(worker_id: int):
+    calendar_call_priority.set(CALENDAR_PRIORITY_BULK)
+    while True:
+        write_id = await calendar_insert_queue.get()
+        try:
+            await process_calendar_insert(write_id)
+        except Exception as e:
+            logger.error(f"❌ Calendar insert worker {worker_id} failed on {write_id}: {str(e)}")
+        finally:
+            calendar_insert_queue.task_done()
+
+
+def get_calendar_insert_metrics():
+    return {
+        "enabled": calendar_insert_queue is not None,
+        "pending": len(pending_calendar_inserts),
+        **calendar_insert_stats
+    }
+
+
+async def start_calendar_inserts():
+    """Replay the pending journal and start the insert workers"""
+    global calendar_insert_queue
+
+    if not CALENDAR_WRITE_BEHIND:
+        return
+
+    calendar_insert_queue = asyncio.Queue()
+    for record in load_pending_calendar_inserts():
+        pending_calendar_inserts[record["id"]] = record
+        calendar_insert_queue.put_nowait(record["id"])
+    if pending_calendar_inserts:
+        logger.info(f"📅 Replaying {len(pending_calendar_inserts)} pending calendar inserts")
+
+    for worker_id in range(CALENDAR_INSERT_WORKERS):
+        calendar_insert_tasks.append(asyncio.create_task(calendar_insert_worker(worker_id)))
+
+
+async def stop_calendar_inserts():
+    """Give queued inserts a chance to finish; anything left stays in the journal"""
+    global calendar_insert_queue
+
+    if calendar_insert_queue is None:
+        return
+
+    try:
+        await asyncio.wait_for(calendar_insert_queue.join(), timeout=WEBHOOK_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️  Shutting down with {len(pending_calendar_inserts)} pending calendar inserts (kept for next start)")
+
+    for task in calendar_insert_tasks:
+        task.cancel()
+    await asyncio.gather(*calendar_insert_tasks, return_exceptions=True)
+    calendar_insert_tasks.clear()
+    calendar_insert_queue = None
+
+
+@app.get("/pending-events/")
+async def get_pending_events():
+    """Reminders waiting to be written to Google Calendar, and recently written ones"""
+    return {
+        "pending": list(pending_calendar_inserts.values()),
+        "recent": list(recent_calendar_inserts)
+    }
+
+
+# ---------------- REMINDER SCHEDULER ----------------
+# Sends the WhatsApp reminder itself when an event we created comes due. Upcoming
+# fire times sit in a min-heap of (fire_at, version, event ID) and a single task
+# sleeps until the earliest one, so scheduling is O(log n) and nothing polls per
+# reminder. Cancelling or rescheduling just bumps the reminder's version; stale
+# heap entries are skipped when they surface. Recurring reminders are pushed
+# back with their next occurrence (from the RECURRENCE ENGINE) after firing;
+# single occurrences deleted or moved in Calendar are kept as exceptions on the
+# series' reminder. A reminder whose send fails stays scheduled and is retried.
+REMINDER_DELIVERY_ENABLED = os.getenv("REMINDER_DELIVERY_ENABLED", "true").lower() in ("1", "true", "yes")
+REMINDER_ALL_DAY_TIME = os.getenv("REMINDER_ALL_DAY_TIME", "09:00")  # when all-day reminders fire
+REMINDER_RETRY_DELAY = float(os.getenv("REMINDER_RETRY_DELAY", "60"))  # seconds before resending a failed reminder
+REMINDER_MAX_ATTEMPTS = max(1, int(os.getenv("REMINDER_MAX_ATTEMPTS", "5")))
+REMINDER_SEND_CONCURRENCY = max(1, int(os.getenv("REMINDER_SEND_CONCURRENCY", "200")))  # sends in flight at once
+
+reminder_heap = []  # (fire_at, version, event ID)
+scheduled_reminders = {}  # event ID -> reminder
+reminder_versions = itertools.count()
+reminder_lock = threading.Lock()  # events are scheduled from the calendar threads too
+reminder_loop = None
+reminder_wakeup = None
+reminder_scheduler_task = None
+reminder_send_slots = None
+reminder_send_tasks = set()
+reminder_stats = {"scheduled": 0, "fired": 0, "cancelled": 0, "send_failures": 0}
+
+def get_event_frequency(event: dict):
+    for rule in event.get("recurrence") or []:
+        match = re.search(r"FREQ=(\w+)", rule)
+        if match and match.group(1) in RRULE_FREQUENCIES:
+            return match.group(1)
+    return None
+
+
+def get_fire_time(start_value: dict):
+    """Epoch time to deliver a reminder starting at start_value; all-day ones use REMINDER_ALL_DAY_TIME"""
+    if 'dateTime' in start_value:
+        dt = datetime.datetime.fromisoformat(start_value['dateTime'].replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = pytz.timezone(start_value.get('timeZone') or USER_TIMEZONE).localize(dt)
+        return dt.timestamp()
+    local = datetime.datetime.strptime(f"{start_value['date']} {REMINDER_ALL_DAY_TIME}", "%Y-%m-%d %H:%M")
+    return pytz.timezone(USER_TIMEZONE).localize(local).timestamp()
+
+
+def get_occurrence_key(original_start: dict):
+    """Key of one occurrence of a series in a reminder's exceptions"""
+    return str(round(get_fire_time(original_start)))
+
+
+def parse_instance_id(event_id: str):
+    """(series master ID, original start) of a recurring instance ID such as
+    <master>_20261017T040000Z or <master>_20261017, else (None, None)"""
+    master_id, _, suffix = event_id.rpartition("_")
+    try:
+        if "T" in suffix:
+            original = datetime.datetime.strptime(suffix, "%Y%m%dT%H%M%SZ").replace(tzinfo=pytz.utc)
+            return (master_id or None), {"dateTime": original.isoformat()}
+        return (master_id or None), {"date": datetime.datetime.strptime(suffix, "%Y%m%d").date().isoformat()}
+    except ValueError:
+        return None, None
+
+
+def next_fire_time(reminder: dict, now: float):
+    """Epoch time of the reminder's next occurrence after now, or None if it is over.
+    Occurrences deleted or moved on their own are taken from reminder["exceptions"]."""
+    event = reminder["event"]
+    if event.get("recurrence"):
+        try:
+            exceptions = reminder.get("exceptions") or {}
+            moved = [get_fire_time(start) for start in exceptions.values() if start]
+            candidates = [fire_at for fire_at in moved if fire_at > now]
+            # All-day instances fire partway through their day, so start a day back
+            not_before = datetime.datetime.fromtimestamp(now - 86400, pytz.utc)
+            for instance in iter_recurring_instances(event, not_before=not_before):
+                fire_at = get_fire_time(instance["start"])
+                if fire_at > now and get_occurrence_key(instance["start"]) not in exceptions:
+                    candidates.append(fire_at)
+                    break
+            return min(candidates, default=None)
+        except (UnsupportedRecurrence, KeyError, ValueError) as e:
+            logger.warning(f"⚠️  Cannot expand recurrence of '{reminder['summary']}', reminding once: {e}")
+
+    fire_at = get_fire_time(event["start"])
+    return fire_at if fire_at > now else None
+
+
+def dump_reminder(reminder: dict):
+    return json.dumps({key: value for key, value in reminder.items() if key != "version"}, ensure_ascii=False)
+
+
+def save_reminders(event_ids):
+    """Mirror the current schedule of these events to the state DB. Caller holds reminder_lock."""
+    if state_db is None:
+        return
+    saved, removed = [], []
+    for event_id in event_ids:
+        reminder = scheduled_reminders.get(event_id)
+        if reminder is None:
+            removed.append((event_id,))
+        else:
+            saved.append((event_id, reminder["owner"], reminder["fire_at"], dump_reminder(reminder), time.time()))
+    write_state("INSERT OR REPLACE INTO reminders (event_id, owner, fire_at, data, updated) VALUES (?, ?, ?, ?, ?)", saved)
+    write_state("DELETE FROM reminders WHERE event_id = ?", removed)
+
+
+def restore_reminders(partitions: set = None):
+    """Load reminders from the state DB into the heap in one pass, applying the missed-fire policy.
+    With partitions, only the users in those dispatch partitions are loaded (see REMINDER DISPATCH)."""
+    if not REMINDER_DELIVERY_ENABLED:
+        return
+    if partitions is None and is_dispatch_partitioned():
+        # Loaded partition by partition as this worker leases them
+        return
+    now = time.time()
+    changed = []
+    with reminder_lock:
+        restored = len(scheduled_reminders)
+        for event_id, owner, fire_at, data in read_state("SELECT event_id, owner, fire_at, data FROM reminders"):
+            if partitions is not None and get_dispatch_partition(owner) not in partitions:
+                continue
+            reminder = json.loads(data)
+            if fire_at <= now - MISSED_REMINDER_GRACE:
+                # Too late to be useful; recurring reminders resume with their next occurrence
+                state_stats["reminders_missed"] += 1
+                changed.append(event_id)
+                fire_at = next_fire_time(reminder, now) if reminder["frequency"] else None
+                if fire_at is None:
+                    continue
+            elif fire_at <= now:
+                state_stats["reminders_caught_up"] += 1
+            reminder["version"] = next(reminder_versions)
+            reminder["fire_at"] = fire_at
+            scheduled_reminders[event_id] = reminder
+            reminder_heap.append((fire_at, reminder["version"], event_id))
+        heapq.heapify(reminder_heap)
+        state_stats["reminders_restored"] += len(scheduled_reminders) - restored
+        save_reminders(changed)
+    if reminder_loop is not None:
+        reminder_loop.call_soon_threadsafe(reminder_wakeup.set)
+
+
+def push_reminder(event_id: str, reminder: dict, fire_at: float, persist: bool = True):
+    """Caller holds reminder_lock"""
+    reminder["version"] = next(reminder_versions)
+    reminder["fire_at"] = fire_at
+    scheduled_reminders[event_id] = reminder
+    if persist:
+        save_reminders([event_id])
+    if not is_dispatched_here(reminder["owner"]):
+        # Another worker owns this user's partition and picks the row up from the state DB
+        del scheduled_reminders[event_id]
+        return
+    earliest = not reminder_heap or fire_at < reminder_heap[0][0]
+    heapq.heappush(reminder_heap, (fire_at, reminder["version"], event_id))
+    if earliest and reminder_loop is not None:
+        reminder_loop.call_soon_threadsafe(reminder_wakeup.set)
+
+
+def schedule_event_reminder(event: dict, owner: str, exceptions: dict = None):
+    """Deliver a WhatsApp reminder to owner when the event comes due"""
+    if not REMINDER_DELIVERY_ENABLED:
+        return
+    fire_at = None
+    if event.get("start"):
+        reminder = {
+            "owner": owner,
+            "summary": event.get("summary") or "Reminder",
+            # Just what the recurrence engine needs
+            "event": {key: event[key] for key in ("id", "start", "end", "recurrence") if key in event},
+            "frequency": get_event_frequency(event)
+        }
+        if exceptions and event.get("recurrence"):
+            reminder["exceptions"] = exceptions
+        fire_at = next_fire_time(reminder, time.time())
+    if fire_at is None:
+        # Nothing left to deliver (e.g. moved into the past)
+        cancel_reminders([event["id"]])
+        return
+    with reminder_lock:
+        push_reminder(event["id"], reminder, fire_at)
+        reminder_stats["scheduled"] += 1
+
+
+def find_scheduled_reminder(event_id: str):
+    """The reminder scheduled for event_id, here or (from the state DB) on another worker"""
+    with reminder_lock:
+        reminder = scheduled_reminders.get(event_id)
+    if reminder is not None:
+        return reminder
+    rows = read_state("SELECT data FROM reminders WHERE event_id = ?", (event_id,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+def reschedule_reminder(event: dict):
+    """Follow an edit to a scheduled event, or to one occurrence of a scheduled series"""
+    if event.get("recurringEventId") and event.get("originalStartTime"):
+        new_start = None if event.get("status") == "cancelled" else event.get("start")
+        set_occurrence_exception(event["recurringEventId"], event["originalStartTime"], new_start)
+        return
+    reminder = find_scheduled_reminder(event.get("id"))
+    if reminder is not None:
+        schedule_event_reminder(event, reminder["owner"], reminder.get("exceptions"))
+
+
+def set_occurrence_exception(master_id: str, original_start: dict, new_start: dict = None):
+    """Skip one occurrence of a scheduled recurring reminder (new_start None) or move it"""
+    reminder = find_scheduled_reminder(master_id)
+    if reminder is None or not reminder["event"].get("recurrence"):
+        return
+    now = time.time()
+    # Occurrences more than a day back are never expanded again (see next_fire_time)
+    exceptions = {
+        key: start for key, start in (reminder.get("exceptions") or {}).items()
+        if float(key) > now - 86400 or (start and get_fire_time(start) > now - 86400)
+    }
+    exceptions[get_occurrence_key(original_start)] = new_start
+    reminder = {key: value for key, value in reminder.items() if key not in ("version", "attempts", "due_at")}
+    reminder["exceptions"] = exceptions
+    fire_at = next_fire_time(reminder, now)
+    if fire_at is None:
+        cancel_reminders([master_id])
+        return
+    with reminder_lock:
+        push_reminder(master_id, reminder, fire_at)
+
+
+def cancel_reminders(event_ids):
+    with reminder_lock:
+        for event_id in event_ids:
+            # The heap entry stays behind and is skipped when it comes up
+            if scheduled_reminders.pop(event_id, None) is not None:
+                reminder_stats["cancelled"] += 1
+        save_reminders(event_ids)
+
+
+def pop_due_reminders(now: float):
+    """Return (event ID, reminder) pairs due at now. Only their heap entries are consumed: they stay
+    scheduled until complete_reminders records how the send went."""
+    due = []
+    with reminder_lock:
+        while reminder_heap and reminder_heap[0][0] <= now:
+            fire_at, version, event_id = heapq.heappop(reminder_heap)
+            reminder = scheduled_reminders.get(event_id)
+            if reminder is None or reminder["version"] != version:
+                continue
+            due.append((event_id, reminder))
+    return due
+
+
+def complete_reminders(outcomes: list):
+    """Advance, retry or drop reminders after a send attempt; outcomes are (event ID, reminder, sent).
+    State DB rows are only touched while they still hold the fired time, so a concurrent edit wins."""
+    now = time.time()
+    updated, finished = [], []
+    with reminder_lock:
+        for event_id, reminder, sent in outcomes:
+            if scheduled_reminders.get(event_id) is not reminder:
+                # Edited or cancelled while it was being sent
+                continue
+            fired_at = reminder["fire_at"]
+            attempts = reminder.get("attempts", 0) + 1
+            next_at = next_fire_time(reminder, now) if reminder["frequency"] else None
+            if not sent and attempts < REMINDER_MAX_ATTEMPTS and (next_at is None or now + REMINDER_RETRY_DELAY < next_at):
+                reminder["attempts"] = attempts
+                reminder.setdefault("due_at", fired_at)
+                next_at = now + REMINDER_RETRY_DELAY
+            else:
+                if not sent:
+                    logger.error(f"❌ Giving up on reminder '{reminder['summary']}' after {attempts} attempt(s)")
+                reminder.pop("attempts", None)
+                reminder.pop("due_at", None)
+
+            if next_at is None:
+                del scheduled_reminders[event_id]
+                finished.append((event_id, fired_at))
+            else:
+                push_reminder(event_id, reminder, next_at, persist=False)
+                updated.append((next_at, dump_reminder(reminder), now, event_id, fired_at))
+        if state_db is not None:
+            write_state("UPDATE reminders SET fire_at = ?, data = ?, updated = ? WHERE event_id = ? AND fire_at = ?", updated)
+            write_state("DELETE FROM reminders WHERE event_id = ? AND fire_at = ?", finished)
+
+
+async def deliver_reminder(reminder: dict):
+    """Send one reminder; returns whether it went out"""
+    due_at = reminder.get("due_at", reminder["fire_at"])
+    msg = f"⏰ Reminder\n\n"
+    msg += f"{reminder['summary']}\n"
+    if reminder["frequency"]:
+        msg += f"🔁 Repeats {reminder['frequency'].lower()}\n"
+    if time.time() - due_at > 60:
+        # Overdue after a restart or a failed send
+        due = datetime.datetime.fromtimestamp(due_at, pytz.timezone(USER_TIMEZONE))
+        msg += f"🕒 Was due {due.strftime('%A, %B %d at %I:%M %p')}\n"
+    try:
+        # Waits for the Graph API, so the state DB row is only finished after a real send
+        result = await send_text(reminder["owner"], msg, wait=True)
+    except Exception as e:
+        result = {"status": "failed", "detail": str(e)}
+    if not result or result.get("status") == "failed":
+        reminder_stats["send_failures"] += 1
+        detail = (result or {}).get("detail", "message dead-lettered")
+        logger.error(f"❌ Failed to deliver reminder '{reminder['summary']}': {detail}")
+        return False
+    reminder_stats["fired"] += 1
+    return True
+
+
+async def send_due_reminder(event_id: str, reminder: dict, partition: int = None):
+    """Deliver one due reminder and record its outcome as soon as it's known"""
+    try:
+        async with reminder_send_slots:
+            sent = await deliver_reminder(reminder)
+        # After delivery, so a crash mid-send repeats the reminder instead of losing it
+        complete_reminders([(event_id, reminder, sent)])
+    finally:
+        if partition is not None:
+            with reminder_lock:
+                delivering_reminders[partition] -= 1
+
+
+async def run_reminder_scheduler():
+    while True:
+        reminder_wakeup.clear()
+        due = pop_due_reminders(time.time())
+        partitions = {}
+        if due and is_dispatch_partitioned():
+            partitions = {event_id: get_dispatch_partition(reminder["owner"]) for event_id, reminder in due}
+            with reminder_lock:
+                delivering_reminders.update(partitions.values())
+            checked = await asyncio.get_running_loop().run_in_executor(None, filter_dispatchable_reminders, due)
+            with reminder_lock:
+                # Swap the whole due list for the ones actually being sent in one step
+                delivering_reminders.subtract(partitions.values())
+                delivering_reminders.update(partitions[event_id] for event_id, _ in checked)
+            due = checked
+        # One task per reminder, so a slow or failing send never holds up the ones behind it
+        for event_id, reminder in due:
+            task = asyncio.create_task(send_due_reminder(event_id, reminder, partitions.get(event_id)))
+            reminder_send_tasks.add(task)
+            task.add_done_callback(reminder_send_tasks.discard)
+
+        with reminder_lock:
+            next_at = reminder_heap[0][0] if reminder_heap else None
+        try:
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            await asyncio.wait_for(reminder_wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def get_reminder_scheduler_metrics():
+    with reminder_lock:
+        next_at = reminder_heap[0][0] if reminder_heap else None
+        return {
+            "enabled": REMINDER_DELIVERY_ENABLED,
+            "pending": len(scheduled_reminders),
+            "heap_size": len(reminder_heap),
+            "next_fire_in_seconds": round(next_at - time.time(), 1) if next_at else None,
+            **reminder_stats
+        }
+
+
+async def start_reminder_scheduler():
+    global reminder_loop, reminder_wakeup, reminder_scheduler_task, reminder_send_slots
+
+    if not REMINDER_DELIVERY_ENABLED:
+        return
+    reminder_loop = asyncio.get_running_loop()
+    reminder_wakeup = asyncio.Event()
+    reminder_send_slots = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+    reminder_scheduler_task = asyncio.create_task(run_reminder_scheduler())
+
+
+async def stop_reminder_scheduler():
+    global reminder_loop, reminder_scheduler_task
+
+    if reminder_scheduler_task is not None:
+        reminder_scheduler_task.cancel()
+        await asyncio.gather(reminder_scheduler_task, return_exceptions=True)
+        reminder_scheduler_task = None
+    # Unfinished sends stay scheduled with their fired time and are repeated after a restart
+    for task in list(reminder_send_tasks):
+        task.cancel()
+    await asyncio.gather(*reminder_send_tasks, return_exceptions=True)
+    reminder_loop = None
+
+
+# ---------------- REMINDER DISPATCH ----------------
+# Reminder dispatch is the only part of WhatBot that runs across processes.
+# Sessions, per-user ordering, the caches, Calendar push channels and the insert
+# journal live in the single web process (claim_web_process refuses a second
+# one on the same STATE_DB_FILE); extra processes started with
+# `python main.py dispatch` only send reminders. All of them share the state DB:
+# users are split into DISPATCH_PARTITIONS partitions by a hash of their phone
+# number and each partition is dispatched by exactly one worker. Ownership is a
+# lease row in the state DB, renewed every DISPATCH_LEASE_TTL / 3; workers
+# heartbeat and rebalance toward an even share, and a dead worker's partitions
+# are taken over once its leases lapse (at once if it ran on this host).
+# Any worker may schedule a reminder: the row lands in the state DB and the
+# owner picks it up by polling for changed rows. Before sending, the owner
+# re-checks its lease and that the row still holds the fire time.
+DISPATCH_PARTITIONS = max(0, int(os.getenv("DISPATCH_PARTITIONS", "16")))  # 0 dispatches everything in-process
+DISPATCH_LEASE_TTL = float(os.getenv("DISPATCH_LEASE_TTL", "30"))
+DISPATCH_POLL_INTERVAL = float(os.getenv("DISPATCH_POLL_INTERVAL", "1"))
+DISPATCH_POLL_OVERLAP = 5.0  # re-read recent changes in case a slower writer committed late
+
+dispatch_worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+dispatch_leases = {}  # partition -> lease expiry, for the partitions this worker owns
+delivering_reminders = Counter()  # dispatch partition -> reminders whose send is in flight
+dispatch_poll_from = 0.0
+dispatch_task = None
+# Leases get their own connection: BEGIN IMMEDIATE may wait out another worker's write,
+# and session writes on the event loop must not queue behind it on state_db_lock
+dispatch_db = None
+dispatch_db_lock = threading.Lock()
+dispatch_stats = {"live_workers": 0, "acquired": 0, "released": 0, "changes_picked_up": 0, "skipped_stale": 0, "deferred": 0}
+
+
+def is_dispatch_partitioned():
+    return DISPATCH_PARTITIONS > 0 and REMINDER_DELIVERY_ENABLED and state_db is not None
+
+
+def get_dispatch_partition(owner: str):
+    """Stable across processes, unlike hash()"""
+    return int.from_bytes(hashlib.sha1(owner.encode()).digest()[:4], "big") % max(1, DISPATCH_PARTITIONS)
+
+
+def is_dispatched_here(owner: str):
+    return not is_dispatch_partitioned() or get_dispatch_partition(owner) in dispatch_leases
+
+
+def is_worker_alive(worker: str):
+    """Processes on this host can be checked directly; others are judged by heartbeat"""
+    host, pid, _ = worker.rsplit(":", 2)
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+
+def rebalance_dispatch_partitions():
+    """Heartbeat, renew this worker's leases and claim or release partitions toward an even share"""
+    global dispatch_leases
+
+    now = time.time()
+    expires = now + DISPATCH_LEASE_TTL
+    with dispatch_db_lock:
+        dispatch_db.execute("BEGIN IMMEDIATE")
+        try:
+            dispatch_db.execute("INSERT OR REPLACE INTO dispatch_workers (worker, heartbeat) VALUES (?, ?)", (dispatch_worker_id, now))
+            for worker, heartbeat in dispatch_db.execute("SELECT worker, heartbeat FROM dispatch_workers").fetchall():
+                if worker != dispatch_worker_id and (heartbeat < now - DISPATCH_LEASE_TTL or not is_worker_alive(worker)):
+                    dispatch_db.execute("DELETE FROM dispatch_workers WHERE worker = ?", (worker,))
+                    dispatch_db.execute("DELETE FROM partition_leases WHERE worker = ?", (worker,))
+            live_workers = dispatch_db.execute("SELECT COUNT(*) FROM dispatch_workers").fetchone()[0]
+            share = -(-DISPATCH_PARTITIONS // live_workers)
+
+            dispatch_db.execute("UPDATE partition_leases SET expires = ? WHERE worker = ?", (expires, dispatch_worker_id))
+            leases = {
+                partition: (worker, lease_expires)
+                for partition, worker, lease_expires in dispatch_db.execute("SELECT partition, worker, expires FROM partition_leases")
+            }
+            owned = sorted(partition for partition, (worker, _) in leases.items() if worker == dispatch_worker_id)
+            # Over our share: hand partitions back so newly started workers get theirs, but never
+            # one with a send in flight, or its new owner would load and send the reminder again
+            with reminder_lock:
+                busy = {partition for partition, sending in delivering_reminders.items() if sending > 0}
+                releasing = [partition for partition in owned if partition not in busy][:max(0, len(owned) - share)]
+                for partition in releasing:
+                    # Sends not yet started for it are skipped from here on
+                    dispatch_leases.pop(partition, None)
+            for partition in releasing:
+                dispatch_db.execute("DELETE FROM partition_leases WHERE partition = ?", (partition,))
+            owned = set(owned) - set(releasing)
+            for partition in range(DISPATCH_PARTITIONS):
+                if len(owned) >= share:
+                    break
+                lease = leases.get(partition)
+                if partition not in owned and (lease is None or lease[1] < now):
+                    dispatch_db.execute(
+                        "INSERT OR REPLACE INTO partition_leases (partition, worker, expires) VALUES (?, ?, ?)",
+                        (partition, dispatch_worker_id, expires)
+                    )
+                    owned.add(partition)
+            dispatch_db.commit()
+        except Exception:
+            dispatch_db.rollback()
+            raise
+
+    acquired = owned - set(dispatch_leases)
+    released = (set(dispatch_leases) - owned) | set(releasing)
+    dispatch_leases = {partition: expires for partition in owned}
+    dispatch_stats["live_workers"] = live_workers
+
+    if released:
+        with reminder_lock:
+            for event_id in [i for i, r in scheduled_reminders.items() if get_dispatch_partition(r["owner"]) in released]:
+                # Heap entries are skipped once the reminder is gone
+                del scheduled_reminders[event_id]
+        dispatch_stats["released"] += len(released)
+    if acquired:
+        restore_reminders(acquired)
+        dispatch_stats["acquired"] += len(acquired)
+    if acquired or released:
+        logger.info(f"🔀 Reminder dispatch: {len(owned)}/{DISPATCH_PARTITIONS} partitions owned, {live_workers} live worker(s)")
+
+
+def poll_reminder_changes():
+    """Pick up reminders other workers scheduled or changed in our partitions"""
+    global dispatch_poll_from
+
+    started = time.time()
+    # Read under reminder_lock so a row isn't overwritten by a completion that lands mid-poll
+    with reminder_lock:
+        rows = read_state(
+            "SELECT event_id, owner, fire_at, data FROM reminders WHERE updated > ?",
+            (dispatch_poll_from - DISPATCH_POLL_OVERLAP,)
+        )
+        dispatch_poll_from = started
+        for event_id, owner, fire_at, data in rows:
+            if get_dispatch_partition(owner) not in dispatch_leases:
+                continue
+            current = scheduled_reminders.get(event_id)
+            if current is not None and current["fire_at"] == fire_at:
+                continue
+            push_reminder(event_id, json.loads(data), fire_at, persist=False)
+            dispatch_stats["changes_picked_up"] += 1
+
+
+def filter_dispatchable_reminders(due: list):
+    """Drop due reminders another worker cancelled or rescheduled since we loaded them, and put
+    back ones whose partition lease is about to lapse until the lease is renewed"""
+    try:
+        event_ids = [event_id for event_id, _ in due]
+        fire_times = {}
+        for start in range(0, len(event_ids), 500):
+            chunk = event_ids[start:start + 500]
+            fire_times.update(read_state(
+                f"SELECT event_id, fire_at FROM reminders WHERE event_id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+            ))
+    except Exception as e:
+        # Better a rare duplicate than a lost reminder
+        logger.error(f"❌ Could not re-check due reminders, sending anyway: {e}")
+        return due
+
+    now = time.time()
+    dispatchable = []
+    with reminder_lock:
+        for event_id, reminder in due:
+            lease = dispatch_leases.get(get_dispatch_partition(reminder["owner"]))
+            if lease is None or fire_times.get(event_id) != reminder["fire_at"]:
+                # Handed over, cancelled or rescheduled; the current row reaches its owner by polling
+                dispatch_stats["skipped_stale"] += 1
+                if scheduled_reminders.get(event_id) is reminder:
+                    del scheduled_reminders[event_id]
+            elif lease <= now + DISPATCH_LEASE_TTL / 3:
+                # Still ours but the lease is overdue for renewal; retry after the next rebalance
+                dispatch_stats["deferred"] += 1
+                heapq.heappush(reminder_heap, (now + DISPATCH_POLL_INTERVAL, reminder["version"], event_id))
+            else:
+                dispatchable.append((event_id, reminder))
+    return dispatchable
+
+
+async def run_reminder_dispatch():
+    loop = asyncio.get_running_loop()
+    next_rebalance = time.time() + DISPATCH_LEASE_TTL / 3
+    while True:
+        await asyncio.sleep(DISPATCH_POLL_INTERVAL)
+        try:
+            if time.time() >= next_rebalance:
+                await loop.run_in_executor(None, rebalance_dispatch_partitions)
+                next_rebalance = time.time() + DISPATCH_LEASE_TTL / 3
+            await loop.run_in_executor(None, poll_reminder_changes)
+        except Exception as e:
+            logger.error(f"❌ Reminder dispatch error: {str(e)}")
+
+
+def get_reminder_dispatch_metrics():
+    return {
+        "partitioned": is_dispatch_partitioned(),
+        "worker": dispatch_worker_id,
+        "partitions": DISPATCH_PARTITIONS,
+        "owned_partitions": sorted(dispatch_leases),
+        **dispatch_stats
+    }
+
+
+async def start_reminder_dispatch():
+    global dispatch_task, dispatch_poll_from, dispatch_db
+
+    if not is_dispatch_partitioned():
+        return
+    dispatch_db = connect_state_db()
+    dispatch_poll_from = time.time()
+    # Claim a share before serving so this worker's reminders are loaded at once
+    await asyncio.get_running_loop().run_in_executor(None, rebalance_dispatch_partitions)
+    dispatch_task = asyncio.create_task(run_reminder_dispatch())
+
+
+async def run_dispatch_worker():
+    """Reminder dispatch without the web app, for `python main.py dispatch`"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, open_state_db)
+    if not is_dispatch_partitioned():
+        logger.error("❌ Dispatch workers need STATE_DB_FILE, DISPATCH_PARTITIONS > 0 and REMINDER_DELIVERY_ENABLED")
+        return
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    await start_outbound_delivery()
+    await start_reminder_scheduler()
+    await start_reminder_dispatch()
+    logger.info(f"📮 Reminder dispatch worker {dispatch_worker_id} running")
+    try:
+        await stop.wait()
+    finally:
+        await stop_reminder_scheduler()
+        await stop_reminder_dispatch()
+        await stop_outbound_delivery()
+        close_state_db()
+
+
+async def stop_reminder_dispatch():
+    global dispatch_task, dispatch_leases, dispatch_db
+
+    if dispatch_task is not None:
+        dispatch_task.cancel()
+        await asyncio.gather(dispatch_task, return_exceptions=True)
+        dispatch_task = None
+    if dispatch_db is not None:
+        # Hand our partitions over now instead of after the leases lapse
+        with dispatch_db_lock:
+            try:
+                with dispatch_db:
+                    dispatch_db.execute("DELETE FROM partition_leases WHERE worker = ?", (dispatch_worker_id,))
+                    dispatch_db.execute("DELETE FROM dispatch_workers WHERE worker = ?", (dispatch_worker_id,))
+            except Exception as e:
+                logger.error(f"❌ Could not release reminder dispatch partitions: {e}")
+            dispatch_db.close()
+            dispatch_db = None
+        dispatch_leases = {}
+
+
 # ---------------- TEST ENDPOINTS ----------------
 @app.post("/test-reminder/")
 async def test_reminder(user_input: str):
     """Test reminder creation without WhatsApp"""
-    structured = await extract_with_gemini(user_input)
+    structured = await extract_reminder(user_input)
     if not structured:
         return {"error": "Failed to parse input"}
 
@@ -1610,7 +5326,7 @@ async def test_reminder(user_input: str):
     }
 
     if len(missing) == 0 and calendar_service:
-        link = create_calendar_event(structured)
+        link = await run_calendar_call(create_calendar_event, structured)
         result["calendar_link"] = link
     else:
         result["calendar_link"] = "Calendar not configured or reminder incomplete"
@@ -1627,10 +5343,35 @@ async def health_check():
         "model": MODEL_NAME,
         "timezone": USER_TIMEZONE,
         "active_conversations": len(user_conversations),
+        "webhook_queue_depth": get_webhook_queue_metrics()["depth"],
         "timestamp": datetime.datetime.now().isoformat()
     }
 
 
+@app.get("/metrics/")
+async def get_metrics():
+    """Runtime instrumentation for capacity planning"""
+    return {
+        "webhook_queue": get_webhook_queue_metrics(),
+        "message_dedup": get_message_dedup_metrics(),
+        "whatsapp_client": get_whatsapp_client_metrics(),
+        "outbound": get_outbound_metrics(),
+        "gemini": get_gemini_metrics(),
+        "reminder_parser": get_reminder_parser_metrics(),
+        "gemini_cache": get_gemini_cache_metrics(),
+        "startup_phases": startup_phases,
+        "calendar_rate_limiter": calendar_rate_limiter.metrics(),
+        "calendar_credentials": get_calendar_credential_metrics(),
+        "calendar_inserts": get_calendar_insert_metrics(),
+        "idempotent_inserts": get_idempotent_insert_metrics(),
+        "reminder_scheduler": get_reminder_scheduler_metrics(),
+        "durable_state": get_durable_state_metrics(),
+        "reminder_dispatch": get_reminder_dispatch_metrics(),
+        "event_cache": get_event_cache_metrics(),
+        "calendar_push": get_calendar_push_metrics()
+    }
+
+
 @app.post("/simulate-message/")
 async def simulate_whatsapp_message(text: str, from_number: str = "923141181535"):
     """Simulate a WhatsApp message for testing"""
@@ -1648,7 +5389,7 @@ async def simulate_whatsapp_message(text: str, from_number: str = "923141181535"
         "profile": {"name": "Test User"}
     }]
     
-    await process_incoming_message(mock_message, mock_contacts)
+    await process_message_in_order(mock_message, mock_contacts)
     
     # Return current conversation state
     conversation_state = user_conversations.get(from_number, "No active conversation")
@@ -1688,7 +5429,7 @@ async def test_list_reminders(date: str = None, phone_number: str = "92314118153
     if not date:
         date = datetime.datetime.now(pytz.timezone(USER_TIMEZONE)).strftime("%Y-%m-%d")
     
-    reminders = get_reminders_for_date(date)
+    reminders = await run_calendar_call(get_reminders_for_date, date)
     
     return {
         "date": date,
@@ -1723,7 +5464,7 @@ async def test_management_flow(text: str, phone_number: str = "923141181535"):
     }]
     
     # Process the message
-    await process_incoming_message(mock_message, mock_contacts)
+    await process_message_in_order(mock_message, mock_contacts)
     
     # Return current states
     return {
@@ -1735,3 +5476,7 @@ async def test_management_flow(text: str, phone_number: str = "923141181535"):
         "active_conversations": len(user_conversations),
         "active_management_sessions": len(user_management_state)
     }
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["dispatch"]:
+    asyncio.run(run_dispatch_worker())